@@ -2,6 +2,8 @@
 ASGI config for Pardis_panel project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve it with an ASGI server (e.g. ``uvicorn Pardis_panel.asgi:application``)
+to enable the Server-Sent Events price stream at ``/pricing/stream/``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
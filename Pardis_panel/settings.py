@@ -56,6 +56,8 @@ LOGIN_REDIRECT_URL = '/'
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # serves collected static files before sessions/auth run
+    'users.middlewares.PrecompressedStaticMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -63,6 +65,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     # local middleware
+    'users.middlewares.QueryInspectorMiddleware',
     'users.middlewares.LoginRequiredMiddleware',
 
 ]
@@ -85,6 +88,16 @@ TEMPLATES = [
     },
 ]
 
+if not DEBUG:
+    # Compile each template once per process (explicit loaders replace APP_DIRS)
+    TEMPLATES[0]['APP_DIRS'] = False
+    TEMPLATES[0]['OPTIONS']['loaders'] = [
+        ('django.template.loaders.cached.Loader', [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ]),
+    ]
+
 WSGI_APPLICATION = 'Pardis_panel.wsgi.application'
 
 
@@ -95,11 +108,119 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Take the write lock at BEGIN so concurrent writers queue on
+            # busy_timeout instead of failing with "database is locked"
+            'transaction_mode': 'IMMEDIATE',
+        },
     }
 }
 
+# Optional read replica: a copy of the database refreshed by
+# `manage.py sync_replica`. Reports, history, exports and the feeds read from
+# it while it is current or at most REPLICA_MAX_LAG seconds behind
+# (pricing.replica); writes always go to the primary.
+DATABASE_REPLICA = config('DATABASE_REPLICA', default='')
+if DATABASE_REPLICA:
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': f'file:{DATABASE_REPLICA}?mode=ro',
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_ROUTERS = ['pricing.replica.ReplicaRouter']
+REPLICA_MAX_LAG = config('REPLICA_MAX_LAG', default=30, cast=int)
+
+# Applied to every SQLite connection (pricing.db). WAL journaling, which lets
+# readers run while a write is in progress, is stored in the database file and
+# set once by migration pricing 0011; synchronous=NORMAL is durable enough under WAL.
+SQLITE_PRAGMAS = {
+    'synchronous': 'NORMAL',
+    'busy_timeout': 20000,
+    'cache_size': -32000,  # KiB
+    'mmap_size': 268435456,
+    'temp_store': 'MEMORY',
+}
+
+# Price writes go through one writer per process (pricing.db.write_transaction):
+# at most this many queue, each for at most this many seconds
+PRICING_WRITE_QUEUE_SIZE = config('PRICING_WRITE_QUEUE_SIZE', default=16, cast=int)
+PRICING_WRITE_TIMEOUT = config('PRICING_WRITE_TIMEOUT', default=15, cast=float)
+
 AUTH_USER_MODEL = "users.CustomUser"
 
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+#
+# PRICING_CACHE_BACKEND selects where the shared price board snapshot lives:
+#   locmem - per-process memory (single worker / development only)
+#   file   - files under PRICING_CACHE_LOCATION, shared by all workers on the host
+#   redis  - any Redis-compatible server at PRICING_CACHE_LOCATION (needs `redis`)
+
+PRICING_CACHE_BACKEND = config('PRICING_CACHE_BACKEND', default='file')
+
+_PRICING_CACHE_BACKENDS = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'pricing-board'),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache', str(BASE_DIR / 'cache' / 'pricing')),
+    'redis': ('django.core.cache.backends.redis.RedisCache', 'redis://127.0.0.1:6379/1'),
+}
+_backend, _default_location = _PRICING_CACHE_BACKENDS[PRICING_CACHE_BACKEND]
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'pricing': {
+        'BACKEND': _backend,
+        'LOCATION': config('PRICING_CACHE_LOCATION', default=_default_location),
+        'KEY_PREFIX': 'pardis',
+    },
+    # Rendered template fragments (pricing.fragments). Keys carry the objects'
+    # versions, so a per-process cache never serves stale markup.
+    'fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'pricing-fragments',
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+}
+
+PRICING_CACHE_ALIAS = 'pricing'
+PRICING_FRAGMENT_CACHE_ALIAS = 'fragments'
+PRICING_FRAGMENT_CACHE_TIMEOUT = 3600
+# Fragment hit/miss counters (shown at board/cache-stats/)
+PRICING_FRAGMENT_CACHE_METRICS = config('PRICING_FRAGMENT_CACHE_METRICS', default=not DEBUG, cast=bool)
+PRICING_BOARD_CACHE_TIMEOUT = config('PRICING_BOARD_CACHE_TIMEOUT', default=3600, cast=int)
+
+# Reports are also rebuilt on every price write; this bounds time-based counters
+PRICING_REPORT_CACHE_TIMEOUT = 300
+
+# Analytics results are keyed on the newest history row, the timeout only evicts
+PRICING_ANALYTICS_CACHE_TIMEOUT = 3600
+
+# Seconds public clients may reuse the JSON price feed before revalidating
+PRICING_FEED_MAX_AGE = config('PRICING_FEED_MAX_AGE', default=10, cast=int)
+
+# Server-Sent Events price stream (served by the ASGI entry point only)
+PRICING_SSE_POLL_INTERVAL = config('PRICING_SSE_POLL_INTERVAL', default=1.0, cast=float)
+PRICING_SSE_HEARTBEAT = 15
+PRICING_SSE_REPLAY_LIMIT = 500
+PRICING_SSE_QUEUE_SIZE = 100
+
+# Background job queue (pricing.jobs), processed by `manage.py run_jobs`
+JOB_QUEUE_CONCURRENCY = config('JOB_QUEUE_CONCURRENCY', default=4, cast=int)
+JOB_QUEUE_POLL_INTERVAL = config('JOB_QUEUE_POLL_INTERVAL', default=1.0, cast=float)
+JOB_QUEUE_MAX_ATTEMPTS = 5
+
+# Per-request SQL instrumentation (users.middlewares.QueryInspectorMiddleware).
+# Sampled requests over any budget are logged as one JSON line; repeated
+# query shapes usually mean an N+1 loop in the view.
+SQL_INSPECTOR_ENABLED = config('SQL_INSPECTOR_ENABLED', default=True, cast=bool)
+SQL_INSPECTOR_SAMPLE_RATE = config('SQL_INSPECTOR_SAMPLE_RATE', default=1.0 if DEBUG else 0.05, cast=float)
+SQL_INSPECTOR_MAX_QUERIES = config('SQL_INSPECTOR_MAX_QUERIES', default=30, cast=int)
+SQL_INSPECTOR_MAX_DB_TIME_MS = config('SQL_INSPECTOR_MAX_DB_TIME_MS', default=200, cast=int)
+SQL_INSPECTOR_REPEAT_THRESHOLD = config('SQL_INSPECTOR_REPEAT_THRESHOLD', default=10, cast=int)
+SQL_INSPECTOR_SERVER_TIMING = config('SQL_INSPECTOR_SERVER_TIMING', default=DEBUG, cast=bool)
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -138,6 +259,25 @@ STATIC_URL = '/static/'
 STATICFILES_DIRS = [BASE_DIR / 'pages' / 'static'] 
 STATIC_ROOT = BASE_DIR / 'staticfiles' 
 
+# Outside DEBUG, collectstatic fingerprints every file (name.<hash>.css,
+# cached for a year) and writes .gz/.br variants next to it (.br needs
+# brotli from requirements.txt). {% static %} then needs the collected manifest.
+# PrecompressedStaticMiddleware serves them from STATIC_ROOT; turn it off
+# when nginx serves /static/ (gzip_static/brotli_static on).
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': (
+            'django.contrib.staticfiles.storage.StaticFilesStorage' if DEBUG
+            else 'Pardis_panel.storage.CompressedManifestStaticFilesStorage'
+        ),
+    },
+}
+STATIC_SERVE_PRECOMPRESSED = config('STATIC_SERVE_PRECOMPRESSED', default=True, cast=bool)
+STATIC_MAX_AGE = config('STATIC_MAX_AGE', default=3600, cast=int)  # seconds, unfingerprinted names
+
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
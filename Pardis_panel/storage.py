@@ -0,0 +1,97 @@
+"""
+Static files storage for production.
+
+``collectstatic`` fingerprints every file (``ManifestStaticFilesStorage``:
+``style.css`` -> ``style.3f2a9c1b7e4d.css``, with references inside CSS
+rewritten) and then writes pre-compressed ``.gz`` and ``.br`` variants
+next to each compressible file (``brotli`` is in requirements.txt; without
+it collectstatic warns and writes gzip variants only). Requests never
+compress anything: nginx (``gzip_static`` / ``brotli_static``) or
+``PrecompressedStaticMiddleware`` serve the variants as they are.
+"""
+import gzip
+import logging
+import os
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - listed in requirements.txt
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+COMPRESSIBLE_EXTENSIONS = {
+    ".css", ".js", ".mjs", ".map", ".json", ".svg", ".txt", ".xml", ".html",
+    ".ico", ".ttf", ".otf", ".eot",
+}
+MIN_SIZE = 256  # smaller files are not worth a variant
+
+
+def _gzip(data):
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def _brotli(data):
+    return brotli.compress(data, quality=11)
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """Fingerprinted static files with pre-compressed .gz/.br variants"""
+
+    def compressors(self):
+        yield ".gz", _gzip
+        if brotli is not None:
+            yield ".br", _brotli
+
+    def url_converter(self, name, hashed_files, template=None):
+        converter = super().url_converter(name, hashed_files, template)
+
+        def convert(matchobj):
+            try:
+                return converter(matchobj)
+            except ValueError:
+                # Vendored files often ship without their source maps
+                if "sourceMappingURL" in matchobj["matched"]:
+                    return matchobj["matched"]
+                raise
+
+        return convert
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+        if dry_run:
+            return
+        if brotli is None:
+            logger.warning("brotli is not installed: writing gzip variants only")
+        # Both names are served: hashed ones from templates, plain ones from
+        # anything that still links to them directly
+        names = set(self.hashed_files) | set(self.hashed_files.values())
+        for name in sorted(names):
+            if os.path.splitext(name)[1].lower() in COMPRESSIBLE_EXTENSIONS:
+                self.compress(name)
+
+    def compress(self, name):
+        """Write the compressed variants of `name` that are missing or stale"""
+        path = self.path(name)
+        if not os.path.isfile(path) or os.path.getsize(path) < MIN_SIZE:
+            return
+        modified = os.path.getmtime(path)
+        data = None
+        for suffix, compress in self.compressors():
+            target = path + suffix
+            if os.path.exists(target) and os.path.getmtime(target) >= modified:
+                continue
+            if data is None:
+                with open(path, "rb") as f:
+                    data = f.read()
+            compressed = compress(data)
+            if len(compressed) >= len(data) * 0.95:
+                # Already compressed (fonts, minified images): serve the original
+                if os.path.exists(target):
+                    os.remove(target)
+                continue
+            with open(target + ".tmp", "wb") as f:
+                f.write(compressed)
+            os.replace(target + ".tmp", target)
@@ -0,0 +1,30 @@
+// افزودن افکت اسکرول برای نوبار
+window.addEventListener('scroll', function() {
+    const navbar = document.querySelector('.navbar');
+    if (window.scrollY > 30) {
+        navbar.classList.add('scrolled');
+    } else {
+        navbar.classList.remove('scrolled');
+    }
+});
+
+// مدیریت وضعیت فعال بودن منوها
+document.addEventListener('DOMContentLoaded', function() {
+    const navLinks = document.querySelectorAll('.nav-link');
+    const currentUrl = window.location.href;
+
+    navLinks.forEach(link => {
+        if (link.href === currentUrl) {
+            link.classList.add('active');
+        }
+
+        link.addEventListener('click', function() {
+            if (this.getAttribute('href') !== '#') {
+                navLinks.forEach(item => {
+                    if (item !== this) item.classList.remove('active');
+                });
+                this.classList.add('active');
+            }
+        });
+    });
+});
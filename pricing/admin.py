@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Category, PriceType, Price, PriceHistory
+from django.utils import timezone
+from .models import Category, PriceType, Price, PriceHistory, PriceCandle, RollingPriceStats, AlertRule, AlertEvent, Job
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
@@ -30,3 +31,61 @@ class PriceHistoryAdmin(admin.ModelAdmin):
     search_fields = ['price_type__name', 'notes']
     ordering = ['-changed_at']
     readonly_fields = ['change_percentage']
+
+
+@admin.register(PriceCandle)
+class PriceCandleAdmin(admin.ModelAdmin):
+    list_display = ['price_type', 'interval', 'bucket_start', 'open', 'high', 'low', 'close', 'change_count']
+    list_filter = ['interval', 'price_type__category']
+    search_fields = ['price_type__name']
+    ordering = ['-bucket_start']
+    readonly_fields = ['open_at', 'close_at']
+
+
+@admin.register(RollingPriceStats)
+class RollingPriceStatsAdmin(admin.ModelAdmin):
+    list_display = ['price_type', 'last_price', 'min_24h', 'max_24h', 'change_24h', 'count_24h', 'change_7d', 'count_7d', 'corrected_at']
+    list_filter = ['price_type__category']
+    list_select_related = ['price_type']
+    search_fields = ['price_type__name']
+    readonly_fields = [field.name for field in RollingPriceStats._meta.fields]
+
+
+@admin.register(AlertRule)
+class AlertRuleAdmin(admin.ModelAdmin):
+    list_display = ['price_type', 'kind', 'threshold', 'window', 'cooldown_minutes', 'notify_email', 'is_active', 'last_fired_at']
+    list_filter = ['kind', 'is_active', 'price_type__category']
+    list_select_related = ['price_type']
+    search_fields = ['price_type__name', 'notify_email']
+    raw_id_fields = ['price_type']
+    readonly_fields = ['last_fired_at', 'created_by', 'created_at']
+
+    def save_model(self, request, obj, form, change):
+        if not change:
+            obj.created_by = request.user
+        super().save_model(request, obj, form, change)
+
+
+@admin.register(AlertEvent)
+class AlertEventAdmin(admin.ModelAdmin):
+    list_display = ['rule', 'price', 'change_percentage', 'fired_at', 'delivered_at', 'error']
+    list_filter = ['rule__kind', 'fired_at']
+    list_select_related = ['rule__price_type']
+    search_fields = ['message', 'rule__price_type__name']
+    readonly_fields = [field.name for field in AlertEvent._meta.fields]
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'task', 'status', 'attempts', 'max_attempts', 'run_at', 'created_at', 'finished_at']
+    list_filter = ['status', 'task']
+    search_fields = ['task', 'last_error']
+    readonly_fields = [field.name for field in Job._meta.fields]
+    actions = ['retry_jobs']
+
+    @admin.action(description='Retry selected jobs now')
+    def retry_jobs(self, request, queryset):
+        updated = queryset.exclude(status=Job.RUNNING).update(
+            status=Job.PENDING, attempts=0, run_at=timezone.now(), locked_by='', finished_at=None,
+        )
+        self.message_user(request, f'{updated} job(s) queued for retry')
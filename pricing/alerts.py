@@ -0,0 +1,180 @@
+"""
+Price alert evaluation and delivery.
+
+``evaluate_alerts`` runs from the ``price_history_recorded`` receiver inside
+the writing transaction. It reads only the active rules of the changed price
+types, together with their rolling stats, in a single query, whatever the
+number of rules, and decides in memory which ones fire:
+
+* ``above`` / ``below`` fire when the price crosses the bound (edge
+  triggered: the old price was on the other side)
+* ``change`` fires while the rolling window's change is at least the
+  threshold in either direction
+
+Rules still inside their cooldown are skipped. Everything else (recording
+the AlertEvent, sending the notification) is left to a job (see
+pricing.jobs): the alerts fired in one transaction, however many saves it
+holds, are queued together as a single job once it commits, so saving
+prices never waits for email or writes a job row per alert. Delivery claims
+each rule with a conditional update on ``last_fired_at``, so concurrent
+writers cannot fire the same rule twice within its cooldown.
+"""
+import datetime
+import logging
+import threading
+from dataclasses import asdict, dataclass
+
+from django.core.mail import send_mail
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .jobs import enqueue, task
+from .models import AlertEvent, AlertRule, PriceHistory
+
+logger = logging.getLogger(__name__)
+
+# History older than this (imports, backfills) does not trigger alerts
+MAX_ROW_AGE = datetime.timedelta(minutes=15)
+
+
+@dataclass
+class FiredAlert:
+    rule_id: int
+    price: object
+    change: object
+    message: str
+    fired_at: datetime.datetime
+    cooldown_minutes: int
+    notify_email: str
+
+
+class _AlertBatch:
+    """Alerts fired in one transaction, queued as one delivery job on commit"""
+
+    def __init__(self):
+        self.alerts = []  # ((history row id, changed_at), FiredAlert dict)
+        self.queued = False
+
+    def __call__(self):
+        self.queued = True
+        # Alerts fired inside a savepoint that was rolled back lost their row
+        # (whose id may since have been reused, hence the timestamp)
+        kept = set(PriceHistory.objects.filter(
+            pk__in=[row_id for (row_id, _), _ in self.alerts if row_id is not None]
+        ).values_list("pk", "changed_at"))
+        alerts = [alert for row, alert in self.alerts if row[0] is None or row in kept]
+        if alerts:
+            enqueue("pricing.deliver_alerts", {"alerts": alerts})
+
+
+_batches = threading.local()  # connections are per thread
+
+
+def _queue_delivery(fired):
+    """Add `fired` ((history row, FiredAlert) pairs) to the transaction's delivery job"""
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        enqueue("pricing.deliver_alerts", {"alerts": [asdict(alert) for _, alert in fired]})
+        return
+    batch = getattr(_batches, "current", None)
+    # A batch whose commit hook is gone was rolled back with its transaction
+    if batch is None or batch.queued or not any(hook is batch for _, hook, _ in connection.run_on_commit):
+        batch = _batches.current = _AlertBatch()
+        transaction.on_commit(batch)
+    batch.alerts += [((row.pk, row.changed_at), asdict(alert)) for row, alert in fired]
+
+
+def _rule_fires(rule, row):
+    threshold = rule.threshold
+    old_price, price = row.old_price, row.new_price
+    if rule.kind == "above":
+        return price > threshold and (old_price is None or old_price <= threshold)
+    if rule.kind == "below":
+        return price < threshold and (old_price is None or old_price >= threshold)
+    stats = getattr(rule.price_type, "rolling_stats", None)
+    change = getattr(stats, f"change_{rule.window}", None) if stats else None
+    return change is not None and abs(change) >= threshold
+
+
+def _message(rule, row):
+    name = rule.price_type.name
+    if rule.kind == "change":
+        change = getattr(rule.price_type.rolling_stats, f"change_{rule.window}")
+        return f"{name} moved {change:+.2f}% within {rule.get_window_display()} (now {row.new_price})"
+    direction = "above" if rule.kind == "above" else "below"
+    return f"{name} crossed {direction} {rule.threshold}: {row.old_price} -> {row.new_price}"
+
+
+def evaluate_alerts(rows, now=None):
+    """
+    Check the rules of the price types in `rows` (one query) and add the
+    ones that fire to the transaction's delivery job. Returns the fired alerts.
+    """
+    now = now or timezone.now()
+    latest = {}
+    for row in rows:
+        if row.changed_at < now - MAX_ROW_AGE:
+            continue
+        current = latest.get(row.price_type_id)
+        if current is None or row.changed_at >= current.changed_at:
+            latest[row.price_type_id] = row
+    if not latest:
+        return []
+
+    rules = AlertRule.objects.filter(
+        price_type_id__in=list(latest), is_active=True
+    ).select_related("price_type__rolling_stats")
+
+    fired = []
+    for rule in rules:
+        if rule.last_fired_at and rule.last_fired_at > now - datetime.timedelta(minutes=rule.cooldown_minutes):
+            continue
+        row = latest[rule.price_type_id]
+        if not _rule_fires(rule, row):
+            continue
+        fired.append((row, FiredAlert(
+            rule_id=rule.pk,
+            price=row.new_price,
+            change=row.change_percentage,
+            message=_message(rule, row),
+            fired_at=now,
+            cooldown_minutes=rule.cooldown_minutes,
+            notify_email=rule.notify_email,
+        )))
+
+    if fired:
+        _queue_delivery(fired)
+    return [alert for _, alert in fired]
+
+
+def notify(alert):
+    logger.warning(f'Price alert: {alert.message}')
+    if alert.notify_email:
+        send_mail(f"Price alert: {alert.message}", alert.message, None, [alert.notify_email])
+
+
+@task("pricing.deliver_alerts")
+def deliver_alerts(alerts):
+    """Record and send fired alerts (job task; `alerts` are FiredAlert dicts)"""
+    for alert in alerts:
+        alert = FiredAlert(**{**alert, "fired_at": parse_datetime(alert["fired_at"])})
+        cutoff = alert.fired_at - datetime.timedelta(minutes=alert.cooldown_minutes)
+        claimed = AlertRule.objects.filter(pk=alert.rule_id).filter(
+            Q(last_fired_at__isnull=True) | Q(last_fired_at__lte=cutoff)
+        ).update(last_fired_at=alert.fired_at)
+        if not claimed:
+            continue  # fired by another writer within the cooldown
+
+        event = AlertEvent.objects.create(
+            rule_id=alert.rule_id, price=alert.price, change_percentage=alert.change,
+            message=alert.message, fired_at=alert.fired_at,
+        )
+        try:
+            notify(alert)
+            event.delivered_at = timezone.now()
+        except Exception as e:
+            event.error = str(e)
+            logger.error(f'Error delivering price alert {event.pk}: {str(e)}')
+        event.save(update_fields=["delivered_at", "error"])
@@ -0,0 +1,207 @@
+"""
+Vectorized analytics over PriceHistory.
+
+History for the selected price types is loaded in one query and turned into
+NumPy arrays; everything else is array arithmetic. Changes arrive at
+irregular times, so each series is first reduced to daily closes (UTC days)
+and the metrics are computed on those:
+
+* volatility - standard deviation of daily log returns (and annualized)
+* moving averages - simple moving averages of the closes over each window
+* max drawdown - the largest fall from a running peak
+* correlation - pairwise correlation of daily log returns, on the days
+  every series has a price (missing days carry the previous close forward)
+
+Results are cached under the newest ``changed_at`` of the selection, so a
+report is recomputed only after new history arrives. NumPy is an optional
+dependency; ``numpy_available()`` tells callers whether analytics can run.
+"""
+import datetime
+import hashlib
+import logging
+import math
+
+from django.conf import settings
+from django.db.models import Max
+from django.utils import timezone
+
+from .cache import get_cache
+from .models import PriceHistory, PriceType
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+logger = logging.getLogger(__name__)
+
+RESULT_KEY = "pricing:analytics:{selection}:{latest}"
+DAY_SECONDS = 86400
+DEFAULT_DAYS = 90
+DEFAULT_WINDOWS = (7, 30)
+
+
+def numpy_available():
+    return np is not None
+
+
+def load_history(price_type_ids, since=None):
+    """
+    History of the given types as arrays sorted by (type, time), in one query.
+
+    Returns ``(type_ids, timestamps, prices)``: int64 ids, int64 epoch
+    seconds and float64 prices.
+    """
+    history = PriceHistory.objects.filter(price_type_id__in=price_type_ids)
+    if since is not None:
+        history = history.filter(changed_at__gte=since)
+    rows = list(history.order_by("price_type_id", "changed_at", "id").values_list(
+        "price_type_id", "changed_at", "new_price",
+    ))
+    type_ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+    timestamps = np.fromiter((row[1].timestamp() for row in rows), dtype=np.float64, count=len(rows))
+    prices = np.fromiter((row[2] for row in rows), dtype=np.float64, count=len(rows))
+    return type_ids, timestamps.astype(np.int64), prices
+
+
+def split_series(type_ids, timestamps, prices):
+    """``{price_type_id: (timestamps, prices)}`` views into the sorted arrays"""
+    if not len(type_ids):
+        return {}
+    ids, starts = np.unique(type_ids, return_index=True)
+    bounds = np.append(starts, len(type_ids))
+    return {
+        int(price_type_id): (timestamps[bounds[i]:bounds[i + 1]], prices[bounds[i]:bounds[i + 1]])
+        for i, price_type_id in enumerate(ids)
+    }
+
+
+def daily_closes(timestamps, prices):
+    """Last price of every UTC day that has changes: ``(days, closes)``"""
+    days = timestamps // DAY_SECONDS
+    last_of_day = np.flatnonzero(np.diff(days, append=days[-1] + 1))
+    return days[last_of_day], prices[last_of_day]
+
+
+def log_returns(closes):
+    return np.diff(np.log(closes))
+
+
+def volatility(closes):
+    returns = log_returns(closes)
+    if len(returns) < 2:
+        return None
+    return float(np.std(returns, ddof=1))
+
+
+def moving_average(closes, window):
+    """Simple moving average series (empty when there are fewer closes than `window`)"""
+    if window < 1:
+        raise ValueError(f"Moving average window must be at least 1, got {window}")
+    if len(closes) < window:
+        return np.empty(0)
+    cumulative = np.cumsum(np.insert(closes, 0, 0.0))
+    return (cumulative[window:] - cumulative[:-window]) / window
+
+
+def max_drawdown(closes):
+    """Largest relative fall from a running peak, as a negative fraction"""
+    return float(np.min(closes / np.maximum.accumulate(closes) - 1))
+
+
+def aligned_closes(series):
+    """
+    Daily closes of several series on one shared day grid, each carried
+    forward over days without changes (NaN before a series starts).
+    """
+    grid = np.unique(np.concatenate([days for days, _ in series.values()]))
+    columns = []
+    for days, closes in series.values():
+        position = np.searchsorted(days, grid, side="right") - 1
+        column = closes[np.clip(position, 0, None)].copy()
+        column[position < 0] = np.nan
+        columns.append(column)
+    return grid, np.column_stack(columns)
+
+
+def correlation_matrix(series):
+    """Pairwise correlation of daily log returns over the fully covered days"""
+    if len(series) < 2:
+        return None
+    _, matrix = aligned_closes(series)
+    returns = np.diff(np.log(matrix), axis=0)
+    returns = returns[~np.isnan(returns).any(axis=1)]
+    if len(returns) < 3:
+        return None
+    with np.errstate(invalid="ignore", divide="ignore"):
+        correlation = np.corrcoef(returns, rowvar=False)
+    return correlation
+
+
+def _number(value, digits=6):
+    if value is None or not math.isfinite(value):
+        return None
+    return round(float(value), digits)
+
+
+def _latest_average(closes, window):
+    averages = moving_average(closes, window)
+    return _number(averages[-1]) if len(averages) else None
+
+
+def compute_analytics(price_type_ids, since=None, windows=DEFAULT_WINDOWS):
+    """Metrics for each type plus their correlation matrix"""
+    series = {}
+    metrics = {}
+    for price_type_id, (timestamps, prices) in split_series(*load_history(price_type_ids, since)).items():
+        days, closes = daily_closes(timestamps, prices)
+        series[price_type_id] = (days, closes)
+        daily_volatility = volatility(closes)
+        metrics[price_type_id] = {
+            "changes": len(prices),
+            "days": len(closes),
+            "last": _number(closes[-1]),
+            "volatility": _number(daily_volatility),
+            "volatility_annualized": _number(daily_volatility * math.sqrt(365)) if daily_volatility is not None else None,
+            "moving_averages": {str(window): _latest_average(closes, window) for window in windows},
+            "max_drawdown": _number(max_drawdown(closes)),
+        }
+
+    correlation = correlation_matrix(series)
+    ids = list(series)
+    return {
+        "metrics": metrics,
+        "correlation": {
+            "price_types": ids,
+            "matrix": [[_number(value, 4) for value in row] for row in correlation.tolist()],
+        } if correlation is not None else None,
+    }
+
+
+def get_analytics(price_type_ids, days=DEFAULT_DAYS, windows=DEFAULT_WINDOWS, now=None):
+    """
+    Cached analytics for `price_type_ids` over the last `days` days.
+
+    The cache key includes the newest ``changed_at`` of the selection (one
+    indexed aggregate), so new history makes the next call recompute.
+    """
+    price_type_ids = sorted(set(price_type_ids))
+    latest = PriceHistory.objects.filter(price_type_id__in=price_type_ids).aggregate(latest=Max("changed_at"))["latest"]
+    now = now or timezone.now()
+    since = now - datetime.timedelta(days=days)
+
+    selection = hashlib.sha256(
+        f"{price_type_ids}|{days}|{list(windows)}|{since.date()}".encode()
+    ).hexdigest()[:16]
+    key = RESULT_KEY.format(selection=selection, latest=latest.timestamp() if latest else 0)
+    cache = get_cache()
+    result = cache.get(key)
+    if result is None:
+        result = compute_analytics(price_type_ids, since=since, windows=windows)
+        names = dict(PriceType.objects.filter(pk__in=price_type_ids).values_list("id", "name"))
+        for price_type_id, metrics in result["metrics"].items():
+            metrics["name"] = names.get(price_type_id)
+        result.update({"days": days, "windows": list(windows), "latest_change": latest})
+        cache.set(key, result, timeout=getattr(settings, "PRICING_ANALYTICS_CACHE_TIMEOUT", 3600))
+        logger.info(f'Computed analytics for {len(price_type_ids)} price type(s)')
+    return result
@@ -6,4 +6,4 @@ class PricingConfig(AppConfig):
     name = 'pricing'
 
     def ready(self):
-        from . import signals  # register signals
+        from . import db, signals  # register signals
@@ -0,0 +1,199 @@
+"""
+Seeded benchmarks of the pricing views and admin changelists.
+
+``run_benchmarks`` creates a throwaway test database, seeds it with the
+requested number of categories, price types and history rows, then drives
+each view through the Django test client. Latency comes from plain timed
+runs; query counts and peak memory come from one extra instrumented run
+(``CaptureQueriesContext`` and ``tracemalloc`` would distort the timings).
+Used by ``manage.py benchmark_views``.
+"""
+import datetime
+import math
+import platform
+import random
+import time
+import tracemalloc
+from decimal import Decimal
+
+import django
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Category, Price, PriceHistory, PriceType
+
+BENCHMARK_SETTINGS = {
+    # Keep the real board cache and the request logs out of the measurements
+    "CACHES": {
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "bench-default"},
+        "pricing": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "bench-pricing"},
+        "fragments": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "bench-fragments"},
+    },
+    "SQL_INSPECTOR_ENABLED": False,
+}
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def seed(categories=10, types_per_category=10, history_per_type=100, batch_size=2000):
+    """Fill the (empty) database with benchmark data and return the row counts"""
+    now = timezone.now()
+    Category.objects.bulk_create([
+        Category(name=f"Category {i}", slug=f"category-{i}") for i in range(categories)
+    ])
+    price_types = PriceType.objects.bulk_create([
+        PriceType(
+            category=category, name=f"{category.name} type {j}", action="buy" if j % 2 else "sell",
+            base_currency="Tether", target_currency="Rial",
+        )
+        for category in Category.objects.all()
+        for j in range(types_per_category)
+    ], batch_size=batch_size)
+
+    history = []
+    for price_type in PriceType.objects.all().iterator():
+        price = Decimal(random.randint(50_000, 90_000))
+        for k in range(history_per_type, 0, -1):
+            new_price = price + random.randint(-500, 500)
+            history.append(PriceHistory(
+                price_type=price_type, old_price=price, new_price=new_price,
+                change_percentage=(new_price - price) / price * 100,
+                changed_at=now - datetime.timedelta(minutes=k * 5),
+            ))
+            price = new_price
+            if len(history) >= batch_size:
+                PriceHistory.objects.bulk_create(history)
+                history = []
+        Price.objects.create(price_type=price_type, price=price, is_current=True)
+    PriceHistory.objects.bulk_create(history)
+
+    return {
+        "categories": categories,
+        "price_types": len(price_types),
+        "history": PriceHistory.objects.count(),
+    }
+
+
+def _price_form_post(category):
+    return {
+        f"price_{price_type_id}": str(random.randint(50_000, 90_000))
+        for price_type_id in category.price_types.values_list("id", flat=True)
+    }
+
+
+def benchmark_targets():
+    """(name, method, url, data factory) for every benchmarked view"""
+    category = Category.objects.order_by("pk").first()
+    price_type = PriceType.objects.order_by("pk").first()
+    form_url = reverse("pricing:category_prices_form", args=[category.slug])
+    return [
+        ("category_list", "get", reverse("pricing:category_list"), None),
+        ("price_list", "get", reverse("pricing:price_list"), None),
+        ("category_prices_form", "get", form_url, None),
+        ("category_prices_form_post", "post", form_url, lambda: _price_form_post(category)),
+        ("price_history", "get", reverse("pricing:price_history"), None),
+        ("report", "get", reverse("pricing:report"), None),
+        ("price_feed", "get", reverse("pricing:price_feed"), None),
+        ("price_type_candles", "get", reverse("pricing:price_type_candles", args=[price_type.pk]), None),
+        ("export_history_csv", "get", reverse("pricing:export") + "?dataset=history", None),
+        ("admin_category_changelist", "get", reverse("admin:pricing_category_changelist"), None),
+        ("admin_pricetype_changelist", "get", reverse("admin:pricing_pricetype_changelist"), None),
+        ("admin_price_changelist", "get", reverse("admin:pricing_price_changelist"), None),
+        ("admin_pricehistory_changelist", "get", reverse("admin:pricing_pricehistory_changelist"), None),
+    ]
+
+
+def _request(client, method, url, data):
+    response = getattr(client, method)(url, data() if data else None)
+    if response.streaming:
+        for _ in response.streaming_content:
+            pass
+    response.close()
+    return response
+
+
+def measure(client, method, url, data=None, iterations=20):
+    """Latency percentiles, query count and peak memory of one view"""
+    response = _request(client, method, url, data)  # warm-up (templates, caches)
+
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        response = _request(client, method, url, data)
+        timings.append((time.perf_counter() - started) * 1000)
+
+    tracemalloc.start()
+    try:
+        with CaptureQueriesContext(connection) as queries:
+            _request(client, method, url, data)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "method": method.upper(),
+        "url": url,
+        "status": response.status_code,
+        "runs": iterations,
+        "p50_ms": round(percentile(timings, 50), 2),
+        "p95_ms": round(percentile(timings, 95), 2),
+        "mean_ms": round(sum(timings) / len(timings), 2),
+        "max_ms": round(max(timings), 2),
+        "queries": len(queries),
+        "peak_memory_kb": round(peak / 1024, 1),
+    }
+
+
+def run_benchmarks(categories=10, types_per_category=10, history_per_type=100, iterations=20,
+                   views=None, log=None):
+    """Seed a throwaway database, benchmark the views and return the report dict"""
+    log = log or (lambda message: None)
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        with override_settings(**BENCHMARK_SETTINGS):
+            started = time.perf_counter()
+            seeded = seed(categories, types_per_category, history_per_type)
+            seeded["seconds"] = round(time.perf_counter() - started, 2)
+            log(f'Seeded {seeded["price_types"]} price types and {seeded["history"]} history rows '
+                f'in {seeded["seconds"]}s')
+
+            user = get_user_model().objects.create_superuser("benchmark", "benchmark@example.com", "benchmark")
+            client = Client()
+            client.force_login(user)
+
+            results = {}
+            for name, method, url, data in benchmark_targets():
+                if views and name not in views:
+                    continue
+                results[name] = measure(client, method, url, data, iterations)
+                log(f'{name}: p50 {results[name]["p50_ms"]}ms, p95 {results[name]["p95_ms"]}ms, '
+                    f'{results[name]["queries"]} queries')
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+    return {
+        "generated_at": timezone.now().isoformat(),
+        "environment": {
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "database": connection.vendor,
+        },
+        "config": {
+            "categories": categories,
+            "types_per_category": types_per_category,
+            "history_per_type": history_per_type,
+            "iterations": iterations,
+        },
+        "seed": seeded,
+        "views": results,
+    }
@@ -0,0 +1,175 @@
+"""
+Versioned snapshot of the public price board.
+
+The board (active categories, their active price types and current prices)
+only changes when an operator saves prices or edits categories, so it is built
+once and shared through the cache configured as ``PRICING_CACHE_ALIAS``
+(local memory, file or a Redis-compatible server, see settings).
+
+Every write bumps the board version after commit; the snapshot stored under
+the old version is never read again and the next request rebuilds it.
+Hit/miss/rebuild counters live in the same cache so every worker reports the
+same numbers.
+"""
+import logging
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils import timezone
+
+from .jobs import enqueue, task
+from .models import Category, PriceType
+from .replica import current_data_only
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = "pricing:board:version"
+# The "v2" schema tag changes whenever the snapshot's shape does, so entries
+# cached by an older deploy (e.g. without the rolling stats) are never read
+SNAPSHOT_KEY = "pricing:board:snapshot:v2:{version}"
+STAT_KEYS = {
+    "hits": "pricing:board:stats:hits",
+    "misses": "pricing:board:stats:misses",
+    "rebuilds": "pricing:board:stats:rebuilds",
+}
+
+
+def get_cache():
+    return caches[getattr(settings, "PRICING_CACHE_ALIAS", "default")]
+
+
+def _timeout():
+    return getattr(settings, "PRICING_BOARD_CACHE_TIMEOUT", 3600)
+
+
+def incr_counter(key, delta=1):
+    cache = get_cache()
+    try:
+        return cache.incr(key, delta)
+    except ValueError:
+        # Missing key: create it, tolerating another worker doing the same
+        cache.add(key, 0, timeout=None)
+        return cache.incr(key, delta)
+
+
+def get_board_version():
+    version = get_cache().get(VERSION_KEY)
+    if version is None:
+        get_cache().add(VERSION_KEY, 1, timeout=None)
+        version = get_cache().get(VERSION_KEY, 1)
+    return version
+
+
+def build_board():
+    """Build the board snapshot from the database (two queries, rolling stats joined in)."""
+    categories = {
+        category["id"]: {**category, "price_types": []}
+        for category in Category.objects.filter(is_active=True).order_by("name").values(
+            "id", "name", "slug", "description", "updated_at"
+        )
+    }
+
+    price_types = PriceType.objects.filter(
+        is_active=True, category_id__in=list(categories)
+    ).order_by("category__name", "action", "name").values(
+        "id", "category_id", "name", "action", "base_currency", "target_currency",
+        "current_price_id", "current_price_value", "current_price_updated_at",
+        "rolling_stats__min_24h", "rolling_stats__max_24h", "rolling_stats__change_24h",
+        "rolling_stats__change_7d",
+    )
+
+    last_modified = None
+    for price_type in price_types:
+        categories[price_type["category_id"]]["price_types"].append({
+            "id": price_type["id"],
+            "name": price_type["name"],
+            "action": price_type["action"],
+            "base_currency": price_type["base_currency"],
+            "target_currency": price_type["target_currency"],
+            "price_id": price_type["current_price_id"],
+            "price": price_type["current_price_value"],
+            "updated_at": price_type["current_price_updated_at"],
+            "low_24h": price_type["rolling_stats__min_24h"],
+            "high_24h": price_type["rolling_stats__max_24h"],
+            "change_24h": price_type["rolling_stats__change_24h"],
+            "change_7d": price_type["rolling_stats__change_7d"],
+        })
+        updated_at = price_type["current_price_updated_at"]
+        if updated_at and (last_modified is None or updated_at > last_modified):
+            last_modified = updated_at
+
+    return {
+        "generated_at": timezone.now(),
+        "last_modified": last_modified,
+        "categories": list(categories.values()),
+    }
+
+
+def get_board():
+    """Return the current board snapshot, rebuilding it on a cache miss."""
+    cache = get_cache()
+    version = get_board_version()
+    snapshot = cache.get(SNAPSHOT_KEY.format(version=version))
+    if snapshot is not None:
+        incr_counter(STAT_KEYS["hits"])
+        return snapshot
+
+    incr_counter(STAT_KEYS["misses"])
+    return rebuild_board(version)
+
+
+def rebuild_board(version=None):
+    """Build the snapshot and store it under `version` (the current one by default)."""
+    if version is None:
+        version = get_board_version()
+    with current_data_only():
+        snapshot = build_board()
+    snapshot["version"] = version
+    get_cache().set(SNAPSHOT_KEY.format(version=version), snapshot, timeout=_timeout())
+    incr_counter(STAT_KEYS["rebuilds"])
+    return snapshot
+
+
+def get_category_board(slug, board=None):
+    """Return the entry for one category of `board` (the current snapshot by default), or None."""
+    if board is None:
+        board = get_board()
+    for category in board["categories"]:
+        if category["slug"] == slug:
+            return category
+    return None
+
+
+@task("pricing.rebuild_board")
+def rebuild_board_job():
+    """Build the current snapshot unless a reader already has (job task)"""
+    version = get_board_version()
+    if get_cache().get(SNAPSHOT_KEY.format(version=version)) is None:
+        rebuild_board(version)
+
+
+def _bump_version(rebuild):
+    version = incr_counter(VERSION_KEY)
+    logger.info(f'Price board cache invalidated (version {version})')
+    if rebuild:
+        enqueue("pricing.rebuild_board")
+
+
+def invalidate_board(rebuild=False):
+    """
+    Bump the board version once the current transaction commits.
+
+    With ``rebuild=True`` a job builds the new snapshot ahead of the next
+    read (needs a cache shared with the worker, i.e. not locmem).
+    """
+    transaction.on_commit(lambda: _bump_version(rebuild))
+
+
+def board_cache_stats():
+    cache = get_cache()
+    stats = {name: cache.get(key, 0) for name, key in STAT_KEYS.items()}
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_ratio"] = round(stats["hits"] / lookups, 4) if lookups else None
+    stats["version"] = get_board_version()
+    return stats
@@ -0,0 +1,167 @@
+"""
+OHLC candle rollups of PriceHistory.
+
+Candles are kept per price type at 1-minute, 1-hour and 1-day intervals
+(UTC buckets). New history rows are folded in as they are written (see the
+``price_history_recorded`` receiver in pricing.signals); ``rebuild_candles``
+recomputes them from scratch for backfills. Charts and reports should call
+``get_candles``, which reads the smallest adequate rollup for the range.
+"""
+import datetime
+import logging
+
+from .db import write_transaction
+from .models import PriceCandle, PriceHistory
+
+logger = logging.getLogger(__name__)
+
+INTERVALS = {
+    "1m": datetime.timedelta(minutes=1),
+    "1h": datetime.timedelta(hours=1),
+    "1d": datetime.timedelta(days=1),
+}
+
+CANDLE_FIELDS = ["open", "high", "low", "close", "change_count", "open_at", "close_at"]
+
+
+def bucket_start(moment, interval):
+    """Start of the UTC bucket of `interval` containing `moment`"""
+    moment = moment.astimezone(datetime.timezone.utc).replace(second=0, microsecond=0)
+    if interval == "1h":
+        moment = moment.replace(minute=0)
+    elif interval == "1d":
+        moment = moment.replace(hour=0, minute=0)
+    return moment
+
+
+def _new_candle(price_type_id, interval, start, price, at):
+    return PriceCandle(
+        price_type_id=price_type_id, interval=interval, bucket_start=start,
+        open=price, high=price, low=price, close=price, change_count=1,
+        open_at=at, close_at=at,
+    )
+
+
+def _merge(candle, price, at):
+    """Fold one price observed at `at` into an existing candle"""
+    if at < candle.open_at:
+        candle.open, candle.open_at = price, at
+    if at >= candle.close_at:
+        candle.close, candle.close_at = price, at
+    candle.high = max(candle.high, price)
+    candle.low = min(candle.low, price)
+    candle.change_count += 1
+
+
+def apply_history(rows):
+    """
+    Fold freshly written PriceHistory rows into their candles.
+
+    Costs one query to load the touched candles plus one upsert
+    (``INSERT ... ON CONFLICT DO UPDATE``), whatever the number of rows.
+    The caller holds the write lock, so the loaded candles cannot change
+    in between.
+    """
+    if not rows:
+        return
+
+    observations = {}
+    for row in rows:
+        for interval in INTERVALS:
+            key = (row.price_type_id, interval, bucket_start(row.changed_at, interval))
+            observations.setdefault(key, []).append((row.changed_at, row.new_price))
+
+    existing = {
+        (candle.price_type_id, candle.interval, candle.bucket_start): candle
+        for candle in PriceCandle.objects.filter(
+            price_type_id__in={key[0] for key in observations},
+            bucket_start__in={key[2] for key in observations},
+        )
+    }
+
+    candles = []
+    for key, points in observations.items():
+        points.sort(key=lambda point: point[0])
+        candle = existing.get(key)
+        if candle is None:
+            at, price = points[0]
+            candle = _new_candle(*key, price, at)
+            points = points[1:]
+        else:
+            candle.pk = None  # matched on the bucket, not the id
+        for at, price in points:
+            _merge(candle, price, at)
+        candles.append(candle)
+
+    PriceCandle.objects.bulk_create(
+        candles,
+        update_conflicts=True,
+        unique_fields=["price_type", "interval", "bucket_start"],
+        update_fields=CANDLE_FIELDS,
+    )
+
+
+def rebuild_candles(price_type_ids=None, batch_size=2000):
+    """
+    Recompute candles from PriceHistory, streaming rows in (price type, time)
+    order so memory stays bounded by `batch_size`. Returns the number of
+    candles written.
+    """
+    history = PriceHistory.objects.order_by("price_type_id", "changed_at", "id")
+    candles = PriceCandle.objects.all()
+    if price_type_ids is not None:
+        history = history.filter(price_type_id__in=price_type_ids)
+        candles = candles.filter(price_type_id__in=price_type_ids)
+
+    written = 0
+    pending = []
+    open_candles = {}
+
+    def flush():
+        nonlocal written
+        PriceCandle.objects.bulk_create(pending)
+        written += len(pending)
+        pending.clear()
+
+    with write_transaction():
+        candles.delete()
+        for row in history.values("price_type_id", "changed_at", "new_price").iterator(chunk_size=batch_size):
+            for interval in INTERVALS:
+                start = bucket_start(row["changed_at"], interval)
+                candle = open_candles.get(interval)
+                if candle is not None and candle.price_type_id == row["price_type_id"] and candle.bucket_start == start:
+                    _merge(candle, row["new_price"], row["changed_at"])
+                    continue
+                if candle is not None:
+                    pending.append(candle)
+                open_candles[interval] = _new_candle(
+                    row["price_type_id"], interval, start, row["new_price"], row["changed_at"]
+                )
+            if len(pending) >= batch_size:
+                flush()
+        pending.extend(open_candles.values())
+        flush()
+
+    logger.info(f'Rebuilt {written} price candle(s)')
+    return written
+
+
+def choose_interval(start, end, max_points=500):
+    """Finest interval that covers start..end in at most `max_points` candles"""
+    span = end - start
+    for interval, length in INTERVALS.items():
+        if span / length <= max_points:
+            return interval
+    return "1d"
+
+
+def get_candles(price_type_id, start, end, max_points=500, interval=None):
+    """Candles for one price type over start..end from the smallest adequate rollup"""
+    interval = interval or choose_interval(start, end, max_points)
+    candles = PriceCandle.objects.filter(
+        price_type_id=price_type_id,
+        interval=interval,
+        bucket_start__gte=bucket_start(start, interval),
+        bucket_start__lt=end,
+    ).order_by("bucket_start")
+    return interval, candles
@@ -0,0 +1,229 @@
+"""
+Derived cross rates over the currency graph.
+
+Every active price type with a current price is an edge of its action's
+graph: ``base -> target`` at the price and ``target -> base`` at its inverse.
+For each action and pair of currencies the engine keeps the path with the
+fewest hops (ties go to the lowest price type ids) and the rate along it,
+e.g. Tether -> Euro through Rial.
+
+The matrix is built once and shared through the pricing cache. A price
+change only recomputes the entries whose stored path uses that price type;
+anything that changes the graph itself (a price type gaining or losing its
+current price, being edited, deactivated or deleted) drops the matrix so the
+next read rebuilds it.
+"""
+import logging
+import time
+from collections import deque
+from decimal import Decimal, localcontext
+
+from django.conf import settings
+from django.db import transaction
+
+from .cache import get_cache
+from .models import PriceType
+
+logger = logging.getLogger(__name__)
+
+MATRIX_KEY = "pricing:cross-rates:matrix"
+LOCK_KEY = "pricing:cross-rates:lock"
+LOCK_WAIT = 2.0
+
+RATE_PRECISION = 12
+
+
+def _timeout():
+    return getattr(settings, "PRICING_BOARD_CACHE_TIMEOUT", 3600)
+
+
+def currency_key(name):
+    return name.strip().upper()
+
+
+class CrossRateMatrix:
+    """Best-path rates for every reachable currency pair, per action"""
+
+    def __init__(self):
+        self.currencies = {}  # key -> display name
+        self.edge_prices = {}  # price_type_id -> current price
+        self.edges = {}  # price_type_id -> (action, base key, target key)
+        self.unpriced = set()  # active price types without a current price
+        self.paths = {}  # (action, source, target) -> ((price_type_id, inverted), ...)
+        self.rates = {}  # (action, source, target) -> Decimal
+        self.dependents = {}  # price_type_id -> {(action, source, target), ...}
+
+    @classmethod
+    def build(cls):
+        """Build the matrix from the active price types (one query)"""
+        matrix = cls()
+        graphs = {action: {} for action, _ in PriceType.ACTION_CHOICES}
+        price_types = PriceType.objects.filter(is_active=True, category__is_active=True).order_by("id").values_list(
+            "id", "action", "base_currency", "target_currency", "current_price_value",
+        )
+        for price_type_id, action, base, target, price in price_types:
+            base_key, target_key = currency_key(base), currency_key(target)
+            if price is None or price <= 0:
+                matrix.unpriced.add(price_type_id)
+                continue
+            if base_key == target_key:
+                continue
+            matrix.currencies.setdefault(base_key, base.strip())
+            matrix.currencies.setdefault(target_key, target.strip())
+            matrix.edge_prices[price_type_id] = price
+            matrix.edges[price_type_id] = (action, base_key, target_key)
+            graph = graphs[action]
+            graph.setdefault(base_key, []).append((target_key, price_type_id, False))
+            graph.setdefault(target_key, []).append((base_key, price_type_id, True))
+
+        for action, graph in graphs.items():
+            for source in sorted(graph):
+                matrix._add_paths(action, graph, source)
+        return matrix
+
+    def _add_paths(self, action, graph, source):
+        """Breadth-first search from `source`: fewest hops to every reachable currency"""
+        previous = {source: None}
+        queue = deque([source])
+        while queue:
+            currency = queue.popleft()
+            for neighbour, price_type_id, inverted in graph[currency]:
+                if neighbour not in previous:
+                    previous[neighbour] = (currency, price_type_id, inverted)
+                    queue.append(neighbour)
+
+        for target in previous:
+            if target == source:
+                continue
+            path = []
+            currency = target
+            while previous[currency] is not None:
+                currency, price_type_id, inverted = previous[currency]
+                path.append((price_type_id, inverted))
+            key = (action, source, target)
+            self.paths[key] = tuple(reversed(path))
+            self.rates[key] = self._path_rate(self.paths[key])
+            for price_type_id, _ in path:
+                self.dependents.setdefault(price_type_id, set()).add(key)
+
+    def _path_rate(self, path):
+        rate = Decimal(1)
+        for price_type_id, inverted in path:
+            price = self.edge_prices[price_type_id]
+            rate = rate / price if inverted else rate * price
+        return rate
+
+    def apply(self, prices):
+        """
+        Update the entries affected by new current prices ``{price_type_id: price}``.
+
+        Returns the number of entries recomputed, or None when a change alters
+        the graph itself and the matrix has to be rebuilt.
+        """
+        affected = set()
+        for price_type_id, price in prices.items():
+            if price_type_id in self.unpriced:
+                return None
+            if price_type_id not in self.edge_prices:
+                continue  # inactive type, not part of the graph
+            if price is None or price <= 0:
+                return None
+            self.edge_prices[price_type_id] = price
+            affected |= self.dependents.get(price_type_id, set())
+
+        for key in affected:
+            self.rates[key] = self._path_rate(self.paths[key])
+        return len(affected)
+
+    def rate(self, source, target, action="buy"):
+        """Rate entry for converting 1 `source` into `target`, or None if unreachable"""
+        source, target = currency_key(source), currency_key(target)
+        key = (action, source, target)
+        if key not in self.rates:
+            return None
+        path = []
+        for price_type_id, inverted in self.paths[key]:
+            _, base, quote = self.edges[price_type_id]
+            price = self.edge_prices[price_type_id]
+            path.append({
+                "price_type": price_type_id,
+                "from": self.currencies[quote if inverted else base],
+                "to": self.currencies[base if inverted else quote],
+                "rate": display_rate(1 / price if inverted else price),
+            })
+        return {
+            "from": self.currencies[source],
+            "to": self.currencies[target],
+            "action": action,
+            "rate": display_rate(self.rates[key]),
+            "hops": len(path),
+            "path": path,
+        }
+
+    def table(self, action="buy", source=None):
+        """``{source: {target: rate}}`` for `action`, optionally for one source currency"""
+        source = currency_key(source) if source else None
+        table = {}
+        for (entry_action, entry_source, entry_target), rate in sorted(self.rates.items()):
+            if entry_action != action or (source and entry_source != source):
+                continue
+            table.setdefault(self.currencies[entry_source], {})[self.currencies[entry_target]] = display_rate(rate)
+        return table
+
+
+def display_rate(rate):
+    with localcontext() as context:
+        context.prec = RATE_PRECISION
+        return +rate
+
+
+def get_cross_rates():
+    """The shared cross-rate matrix, rebuilt on a cache miss"""
+    cache = get_cache()
+    matrix = cache.get(MATRIX_KEY)
+    if matrix is None:
+        matrix = CrossRateMatrix.build()
+        cache.set(MATRIX_KEY, matrix, timeout=_timeout())
+        logger.info(f'Cross-rate matrix rebuilt ({len(matrix.rates)} rate(s))')
+    return matrix
+
+
+def cross_rate(source, target, action="buy"):
+    return get_cross_rates().rate(source, target, action)
+
+
+def _drop_matrix():
+    get_cache().delete(MATRIX_KEY)
+
+
+def invalidate_cross_rates():
+    """Drop the matrix after commit; the graph changed and needs a rebuild"""
+    transaction.on_commit(_drop_matrix)
+
+
+def _apply_current_prices(price_type_ids):
+    cache = get_cache()
+    deadline = time.monotonic() + LOCK_WAIT
+    while not cache.add(LOCK_KEY, 1, timeout=30):
+        if time.monotonic() > deadline:
+            # Someone else holds the matrix for too long: rebuild rather than race
+            _drop_matrix()
+            return
+        time.sleep(0.05)
+    try:
+        matrix = cache.get(MATRIX_KEY)
+        if matrix is None:
+            return
+        prices = dict(PriceType.objects.filter(pk__in=price_type_ids).values_list("id", "current_price_value"))
+        if matrix.apply(prices) is None:
+            _drop_matrix()
+        else:
+            cache.set(MATRIX_KEY, matrix, timeout=_timeout())
+    finally:
+        cache.delete(LOCK_KEY)
+
+
+def update_cross_rates(price_type_ids):
+    """Recompute the rates depending on these price types once the transaction commits"""
+    price_type_ids = set(price_type_ids)
+    transaction.on_commit(lambda: _apply_current_prices(price_type_ids))
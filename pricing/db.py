@@ -0,0 +1,126 @@
+"""
+SQLite concurrency settings and the single-writer path for price writes.
+
+Every new SQLite connection gets the ``SQLITE_PRAGMAS`` from settings
+(``synchronous``, ``busy_timeout``, cache and mmap sizes). WAL journaling is
+a property of the database file, switched on once by a migration (pricing
+0011) so opening a connection never rewrites the file. In WAL mode readers
+work from a snapshot and never wait for a writer; only writers exclude each
+other.
+
+Writers are serialized by ``write_transaction``: within a process, writes
+queue on a lock (at most ``PRICING_WRITE_QUEUE_SIZE`` waiting, each for at
+most ``PRICING_WRITE_TIMEOUT`` seconds, otherwise ``WriterBusy``) instead of
+all polling SQLite's busy handler at once. Across processes the
+``IMMEDIATE`` transaction mode (see DATABASES) takes SQLite's write lock at
+BEGIN, so a transaction waits for it up to ``busy_timeout`` rather than
+failing with "database is locked" halfway through.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+SLOW_WAIT = 1.0  # log writes that queued longer than this (seconds)
+
+# Pragmas that change the database file, not applied to read-only connections
+WRITE_PRAGMAS = {"journal_mode", "synchronous"}
+
+
+class WriterBusy(Exception):
+    """Too many writes are queued, or one waited too long for its turn"""
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    """Apply SQLITE_PRAGMAS to each new SQLite connection"""
+    if connection.vendor != "sqlite":
+        return
+    read_only = "mode=ro" in str(connection.settings_dict["NAME"])
+    with connection.cursor() as cursor:
+        for name, value in getattr(settings, "SQLITE_PRAGMAS", {}).items():
+            if not (read_only and name in WRITE_PRAGMAS):
+                cursor.execute(f"PRAGMA {name} = {value}")
+
+
+class _Writer:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.guard = threading.Lock()
+        self.waiting = 0
+
+    def acquire(self, queue_size, timeout):
+        with self.guard:
+            if self.waiting >= queue_size:
+                raise WriterBusy(f"{self.waiting} write(s) already queued")
+            self.waiting += 1
+        started = time.monotonic()
+        try:
+            if not self.lock.acquire(timeout=timeout):
+                raise WriterBusy(f"Waited {timeout}s for the database writer")
+        finally:
+            with self.guard:
+                self.waiting -= 1
+        waited = time.monotonic() - started
+        if waited > SLOW_WAIT:
+            logger.warning(f'Write queued for {waited:.2f}s behind other writers')
+
+    def release(self):
+        self.lock.release()
+
+
+_writers = {}
+_writers_guard = threading.Lock()
+
+
+def _writer(using):
+    with _writers_guard:
+        return _writers.setdefault(using, _Writer())
+
+
+def writer_queue_length(using=DEFAULT_DB_ALIAS):
+    """Writes currently waiting for the writer in this process"""
+    return _writer(using).waiting
+
+
+@contextmanager
+def write_transaction(using=None):
+    """
+    ``transaction.atomic()`` for price writes, entered one at a time per
+    process. Inside an existing transaction (which already holds the write
+    lock) it is a plain savepoint. Raises WriterBusy when the queue is full
+    or the wait times out. The writer is released as soon as the
+    transaction commits, before its ``on_commit`` callbacks run.
+    """
+    using = using or DEFAULT_DB_ALIAS
+    connection = transaction.get_connection(using)
+    if connection.vendor != "sqlite" or connection.in_atomic_block:
+        with transaction.atomic(using=using):
+            yield
+        return
+
+    writer = _writer(using)
+    writer.acquire(settings.PRICING_WRITE_QUEUE_SIZE, settings.PRICING_WRITE_TIMEOUT)
+    released = False
+
+    def release():
+        nonlocal released
+        if not released:
+            released = True
+            writer.release()
+
+    try:
+        with transaction.atomic(using=using):
+            # First commit hook, so callbacks (cache rebuilds, job enqueues)
+            # never hold up the next writer; on rollback `finally` releases
+            transaction.on_commit(release, using=using)
+            yield
+    finally:
+        release()
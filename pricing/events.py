@@ -0,0 +1,189 @@
+"""
+Server-Sent Events for price changes.
+
+Every time a Price becomes current a PriceHistory row is written, and its id
+doubles as the SSE event id, which lets clients resume with ``Last-Event-ID``.
+
+Each worker runs one ``PriceEventBroker``: a single polling task reads new
+history rows and fans them out to per-connection asyncio queues. Idle
+connections therefore cost a queue and a suspended coroutine, not a thread,
+and the database sees one query per poll interval per worker regardless of
+the number of subscribers. The stream needs the ASGI entry point
+(``Pardis_panel.asgi``); under WSGI it is refused.
+
+A client that resumes further behind than ``PRICING_SSE_REPLAY_LIMIT``
+events gets a ``reset`` event instead of a partial replay: it should
+refetch the whole board from the JSON feed and carry on from the reset's id.
+"""
+import asyncio
+import json
+import logging
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.urls import reverse
+
+from .models import PriceHistory
+
+logger = logging.getLogger(__name__)
+
+EVENT_FIELDS = (
+    "id", "price_type_id", "price_type__category_id", "new_price", "change_percentage", "changed_at",
+)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _event_queryset(after_id, category_ids=None):
+    queryset = PriceHistory.objects.filter(id__gt=after_id).order_by("id")
+    if category_ids:
+        queryset = queryset.filter(price_type__category_id__in=category_ids)
+    return queryset.values(*EVENT_FIELDS)
+
+
+async def fetch_events(after_id, category_ids=None, limit=500):
+    """History rows newer than `after_id`, oldest first"""
+    return [row async for row in _event_queryset(after_id, category_ids)[:limit]]
+
+
+async def latest_event_id():
+    row = await PriceHistory.objects.order_by("-id").values("id").afirst()
+    return row["id"] if row else 0
+
+
+def _message(event_id, event, data):
+    return f"id: {event_id}\nevent: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder, separators=(',', ':'))}\n\n"
+
+
+def format_event(row):
+    """Render a history row as a compact SSE message"""
+    data = {
+        "price_type": row["price_type_id"],
+        "price": row["new_price"],
+        "change": row["change_percentage"],
+        "at": row["changed_at"],
+    }
+    return _message(row["id"], "price", data)
+
+
+def format_reset(event_id):
+    """Tell a client that missed too much to reload the board from the feed"""
+    return _message(event_id, "reset", {"feed": reverse("pricing:price_feed")})
+
+
+class Subscription:
+    """One SSE connection's queue and category filter"""
+
+    def __init__(self, category_ids=None, maxsize=100):
+        self.category_ids = set(category_ids or ())
+        self.queue = asyncio.Queue(maxsize=maxsize)
+
+    def wants(self, row):
+        return not self.category_ids or row["price_type__category_id"] in self.category_ids
+
+    def offer(self, row):
+        """Queue `row`; a subscriber that cannot keep up is closed so it resumes from its last id"""
+        try:
+            self.queue.put_nowait(row)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    def close(self):
+        # Make room for the sentinel so the stream always sees it
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+
+class PriceEventBroker:
+    """Polls PriceHistory once per interval and fans rows out to subscribers"""
+
+    def __init__(self):
+        self._subscribers = set()
+        self._task = None
+        self._last_id = None
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def subscribe(self, category_ids=None):
+        subscription = Subscription(category_ids, maxsize=_setting("PRICING_SSE_QUEUE_SIZE", 100))
+        self._subscribers.add(subscription)
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self._subscribers.discard(subscription)
+
+    async def _run(self):
+        interval = _setting("PRICING_SSE_POLL_INTERVAL", 1.0)
+        try:
+            if self._last_id is None:
+                self._last_id = await latest_event_id()
+            while self._subscribers:
+                for row in await fetch_events(self._last_id):
+                    self._last_id = row["id"]
+                    self._publish(row)
+                await asyncio.sleep(interval)
+        except Exception as e:
+            logger.error(f'Price event broker stopped: {str(e)}')
+            for subscription in list(self._subscribers):
+                subscription.close()
+        finally:
+            # Without subscribers nothing is delivered, so start from "now" next time
+            self._last_id = None
+
+    def _publish(self, row):
+        for subscription in list(self._subscribers):
+            if subscription.wants(row) and not subscription.offer(row):
+                logger.warning('Closing slow price stream subscriber')
+                self.unsubscribe(subscription)
+                subscription.close()
+
+
+broker = PriceEventBroker()
+
+
+async def event_stream(category_ids=None, last_event_id=None):
+    """
+    Async iterator of SSE messages: replays events after `last_event_id`
+    (or sends a ``reset`` when there are more than PRICING_SSE_REPLAY_LIMIT),
+    then follows live changes with periodic keep-alive comments.
+    """
+    heartbeat = _setting("PRICING_SSE_HEARTBEAT", 15)
+    subscription = broker.subscribe(category_ids)
+    try:
+        yield f"retry: {int(_setting('PRICING_SSE_RETRY_MS', 5000))}\n\n"
+
+        sent_id = last_event_id
+        if last_event_id is not None:
+            limit = _setting("PRICING_SSE_REPLAY_LIMIT", 500)
+            backlog = await fetch_events(last_event_id, category_ids, limit=limit + 1)
+            if len(backlog) > limit:
+                # Live events after this id are still delivered below
+                sent_id = await latest_event_id()
+                yield format_reset(sent_id)
+                backlog = []
+            for row in backlog:
+                sent_id = row["id"]
+                yield format_event(row)
+
+        while True:
+            try:
+                row = await asyncio.wait_for(subscription.queue.get(), timeout=heartbeat)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            if row is None:
+                break
+            if sent_id is not None and row["id"] <= sent_id:
+                continue
+            sent_id = row["id"]
+            yield format_event(row)
+    finally:
+        broker.unsubscribe(subscription)
@@ -0,0 +1,109 @@
+"""
+Streaming exports of current prices and price history.
+
+Rows are read from the database in server-side chunks with ``.iterator()``
+and written out one at a time, so memory use does not depend on how much
+history is exported. CSV is always available; XLSX needs the optional
+``openpyxl`` package and is written in its write-only (streaming) mode.
+"""
+import csv
+import tempfile
+
+from .history import filter_history
+from .models import PriceType
+
+try:
+    import openpyxl
+except ImportError:  # pragma: no cover - optional dependency
+    openpyxl = None
+
+CHUNK_SIZE = 2000
+
+DATASETS = ("prices", "history")
+FORMATS = ("csv", "xlsx")
+
+PRICE_HEADER = [
+    "category", "category_slug", "price_type_id", "price_type", "action",
+    "base_currency", "target_currency", "price", "updated_at",
+]
+HISTORY_HEADER = [
+    "id", "changed_at", "category", "category_slug", "price_type_id", "price_type", "action",
+    "old_price", "new_price", "change_percentage",
+]
+
+
+def xlsx_available():
+    return openpyxl is not None
+
+
+def current_price_rows():
+    """Header and one row per price type with its current price"""
+    yield PRICE_HEADER
+    price_types = PriceType.objects.order_by("category__name", "action", "name").values_list(
+        "category__name", "category__slug", "id", "name", "action",
+        "base_currency", "target_currency", "current_price_value", "current_price_updated_at",
+    )
+    yield from price_types.iterator(chunk_size=CHUNK_SIZE)
+
+
+def history_rows(filters):
+    """Header and one row per PriceHistory change matching `filters`, oldest first"""
+    yield HISTORY_HEADER
+    history = filter_history(filters).order_by("changed_at", "id").values_list(
+        "id", "changed_at", "price_type__category__name", "price_type__category__slug",
+        "price_type_id", "price_type__name", "price_type__action",
+        "old_price", "new_price", "change_percentage",
+    )
+    yield from history.iterator(chunk_size=CHUNK_SIZE)
+
+
+def export_rows(dataset, filters=None):
+    if dataset == "history":
+        return history_rows(filters or {})
+    return current_price_rows()
+
+
+def _cell(value):
+    if value is None:
+        return ""
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return value
+
+
+class _Echo:
+    """File-like object whose write() just returns the line for streaming"""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows, bom=True):
+    """Encode rows as CSV text lines (with a UTF-8 BOM so Excel detects the encoding)"""
+    writer = csv.writer(_Echo())
+    if bom:
+        yield "\ufeff"
+    for row in rows:
+        yield writer.writerow([_cell(value) for value in row])
+
+
+def write_xlsx(rows, fileobj, title="Export"):
+    """Write rows into `fileobj` as an XLSX workbook in write-only mode"""
+    if openpyxl is None:
+        raise RuntimeError("XLSX export requires the openpyxl package")
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet(title=title)
+    for row in rows:
+        sheet.append([
+            value.replace(tzinfo=None) if getattr(value, "tzinfo", None) else value
+            for value in row
+        ])
+    workbook.save(fileobj)
+
+
+def xlsx_file(rows, title="Export"):
+    """Spool the workbook to a temporary file and return it rewound for streaming"""
+    spool = tempfile.TemporaryFile()
+    write_xlsx(rows, spool, title=title)
+    spool.seek(0)
+    return spool
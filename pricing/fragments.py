@@ -0,0 +1,104 @@
+"""
+Versioned template fragment cache.
+
+``{% cachefragment "name" obj ... %}`` (pricing_cache tag library) caches
+the enclosed markup under a key built from each argument's version: for a
+model instance its pk, ``updated_at`` and, for price types, the
+``current_price_updated_at`` mirrored from the current Price; for a list
+the versions of its items; anything else as is. Writes move those
+timestamps (``auto_now`` on save, the current price pointer on every price
+change), so a changed object simply gets a new key and only its fragments
+re-render. Nothing is ever invalidated explicitly; old entries age out.
+
+Fragments live in the ``PRICING_FRAGMENT_CACHE_ALIAS`` cache (per-process
+memory by default, version keys make that safe). With
+``PRICING_FRAGMENT_CACHE_METRICS`` on, hit/miss counts are batched in
+process and added to the shared pricing cache every ``FLUSH_EVERY``
+lookups.
+"""
+import hashlib
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import models
+
+from .cache import get_cache, incr_counter
+
+FRAGMENT_KEY = "pricing:fragment:{name}:{digest}"
+STAT_KEYS = {
+    "hits": "pricing:fragments:stats:hits",
+    "misses": "pricing:fragments:stats:misses",
+}
+VERSION_FIELDS = ("updated_at", "current_price_updated_at")
+FLUSH_EVERY = 50
+
+
+def get_fragment_cache():
+    return caches[getattr(settings, "PRICING_FRAGMENT_CACHE_ALIAS", "default")]
+
+
+def fragment_version(value):
+    """Hashable version of a fragment argument"""
+    if isinstance(value, models.Model):
+        return (value._meta.label_lower, value.pk) + tuple(
+            getattr(value, field) for field in VERSION_FIELDS if hasattr(value, field)
+        )
+    if isinstance(value, (list, tuple)):
+        return tuple(fragment_version(item) for item in value)
+    return value
+
+
+def fragment_key(name, values):
+    digest = hashlib.md5(repr([fragment_version(value) for value in values]).encode()).hexdigest()
+    return FRAGMENT_KEY.format(name=name, digest=digest)
+
+
+class _Counters:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = {"hits": 0, "misses": 0}
+
+    def record(self, hit):
+        with self.lock:
+            self.pending["hits" if hit else "misses"] += 1
+            if sum(self.pending.values()) < FLUSH_EVERY:
+                return
+            pending, self.pending = self.pending, {"hits": 0, "misses": 0}
+        self.flush(pending)
+
+    def flush(self, pending):
+        for name, count in pending.items():
+            if count:
+                incr_counter(STAT_KEYS[name], count)
+
+    def unflushed(self):
+        with self.lock:
+            return dict(self.pending)
+
+
+_counters = _Counters()
+
+
+def cached_fragment(name, values, render):
+    """Return the cached markup for (`name`, versions of `values`), rendering it on a miss"""
+    cache = get_fragment_cache()
+    key = fragment_key(name, values)
+    content = cache.get(key)
+    if getattr(settings, "PRICING_FRAGMENT_CACHE_METRICS", False):
+        _counters.record(content is not None)
+    if content is None:
+        content = render()
+        cache.set(key, content, timeout=getattr(settings, "PRICING_FRAGMENT_CACHE_TIMEOUT", 3600))
+    return content
+
+
+def fragment_cache_stats():
+    cache = get_cache()
+    stats = {name: cache.get(key, 0) for name, key in STAT_KEYS.items()}
+    for name, count in _counters.unflushed().items():
+        stats[name] += count
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_ratio"] = round(stats["hits"] / lookups, 4) if lookups else None
+    stats["enabled"] = getattr(settings, "PRICING_FRAGMENT_CACHE_METRICS", False)
+    return stats
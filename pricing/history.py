@@ -0,0 +1,159 @@
+"""
+Query helpers for browsing PriceHistory.
+
+History grows without bound, so every read here is shaped to stay flat as
+it grows: filters are pushed into SQL as index-friendly ranges, pages are
+fetched with keyset (cursor) pagination on ``(changed_at, id)`` instead of
+OFFSET, and the summary counts are one conditional aggregate over a bounded
+time window.
+"""
+import base64
+import datetime
+
+from django.db.models import Count, F, Q, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import PriceHistory, PriceType
+
+PERIODS = {
+    "today": 0,
+    "yesterday": 1,
+    "week": 7,
+    "month": 30,
+}
+
+
+def day_start(day):
+    """Aware datetime at the start of `day` in the current time zone"""
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+
+def day_range(day):
+    """Index-friendly [start, end) datetimes covering the local date `day`"""
+    start = day_start(day)
+    return start, day_start(day + datetime.timedelta(days=1))
+
+
+def encode_cursor(row):
+    raw = f"{row.changed_at.isoformat()}|{row.pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Return (changed_at, id) from a cursor, or None if it is malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        changed_at, pk = raw.rsplit("|", 1)
+        changed_at = parse_datetime(changed_at)
+        if changed_at is None:
+            return None
+        return changed_at, int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def parse_day(value):
+    """Date from YYYY-MM-DD, or None if it is malformed or not a real date"""
+    try:
+        return parse_date(value or "")
+    except ValueError:  # well formed but invalid, e.g. 2024-02-30
+        return None
+
+
+def parse_history_filters(params):
+    """Normalize GET parameters into the filters understood by `filter_history`"""
+    filters = {
+        "category": params.get("category") or "",
+        "price_type": None,
+        "action": params.get("action") if params.get("action") in dict(PriceType.ACTION_CHOICES) else "",
+        "period": params.get("period") if params.get("period") in PERIODS else "",
+        "date_from": parse_day(params.get("date_from")),
+        "date_to": parse_day(params.get("date_to")),
+    }
+    try:
+        filters["price_type"] = int(params.get("price_type") or 0) or None
+    except ValueError:
+        pass
+
+    if filters["period"]:
+        today = timezone.localdate()
+        days = PERIODS[filters["period"]]
+        filters["date_from"] = today - datetime.timedelta(days=days)
+        filters["date_to"] = filters["date_from"] if filters["period"] == "yesterday" else today
+    return filters
+
+
+def filter_history(filters, queryset=None):
+    """Apply parsed filters to a PriceHistory queryset as plain SQL predicates"""
+    queryset = PriceHistory.objects.all() if queryset is None else queryset
+    if filters.get("category"):
+        queryset = queryset.filter(price_type__category__slug=filters["category"])
+    if filters.get("price_type"):
+        queryset = queryset.filter(price_type_id=filters["price_type"])
+    if filters.get("action"):
+        queryset = queryset.filter(price_type__action=filters["action"])
+    if filters.get("date_from"):
+        queryset = queryset.filter(changed_at__gte=day_start(filters["date_from"]))
+    if filters.get("date_to"):
+        queryset = queryset.filter(changed_at__lt=day_range(filters["date_to"])[1])
+    return queryset
+
+
+def keyset_page(queryset, cursor=None, page_size=50):
+    """
+    One page of history, newest first, starting after `cursor`.
+
+    Returns ``(rows, next_cursor)``; ``next_cursor`` is None on the last page.
+    """
+    queryset = queryset.order_by("-changed_at", "-id")
+    position = decode_cursor(cursor) if cursor else None
+    if position:
+        changed_at, pk = position
+        queryset = queryset.filter(Q(changed_at__lt=changed_at) | Q(changed_at=changed_at, id__lt=pk))
+
+    rows = list(queryset[:page_size + 1])
+    next_cursor = encode_cursor(rows[page_size - 1]) if len(rows) > page_size else None
+    return rows[:page_size], next_cursor
+
+
+def history_counts(queryset=None):
+    """Today / yesterday / 7-day / 30-day change counts in one aggregate query"""
+    queryset = PriceHistory.objects.all() if queryset is None else queryset
+    today = timezone.localdate()
+    today_start, tomorrow_start = day_range(today)
+    yesterday_start = day_start(today - datetime.timedelta(days=1))
+    week_start = day_start(today - datetime.timedelta(days=7))
+    month_start = day_start(today - datetime.timedelta(days=30))
+
+    return queryset.filter(changed_at__gte=month_start, changed_at__lt=tomorrow_start).aggregate(
+        today=Count("id", filter=Q(changed_at__gte=today_start)),
+        yesterday=Count("id", filter=Q(changed_at__gte=yesterday_start, changed_at__lt=today_start)),
+        week=Count("id", filter=Q(changed_at__gte=week_start)),
+        month=Count("id"),
+    )
+
+
+def recent_history(price_type_ids, limit=5):
+    """
+    Last `limit` changes of each price type in one windowed query.
+
+    Returns ``{price_type_id: (rows, has_more)}``, rows newest first;
+    ``has_more`` tells whether older rows exist beyond `limit`.
+    """
+    rows = PriceHistory.objects.filter(price_type_id__in=price_type_ids).annotate(
+        position=Window(
+            RowNumber(),
+            partition_by=[F("price_type_id")],
+            order_by=[F("changed_at").desc(), F("id").desc()],
+        )
+    ).filter(position__lte=limit + 1).order_by("price_type_id", "-changed_at", "-id")
+
+    recent = {price_type_id: [] for price_type_id in price_type_ids}
+    for row in rows:
+        recent[row.price_type_id].append(row)
+    return {
+        price_type_id: (rows[:limit], len(rows) > limit)
+        for price_type_id, rows in recent.items()
+    }
@@ -0,0 +1,231 @@
+"""
+Bulk import of prices and price history from CSV or JSONL dumps.
+
+Each record is one price observation for a price type, resolved by category
+slug and price type name (or ``price_type_id``) through a single lookup map.
+Observations are written as PriceHistory rows in chunks with ``bulk_create``;
+afterwards the newest observation of every touched type becomes its current
+price. The column names produced by ``export_prices history`` are accepted,
+so exports can be re-imported elsewhere.
+"""
+import csv
+import datetime
+import json
+import time
+from dataclasses import dataclass, field
+from decimal import Decimal, InvalidOperation
+
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .cache import invalidate_board
+from .crossrates import invalidate_cross_rates
+from .db import write_transaction
+from .models import Price, PriceHistory, PriceType, change_percentage, history_note, price_history_recorded
+
+CATEGORY_KEYS = ("category_slug", "category")
+PRICE_KEYS = ("new_price", "price")
+TIME_KEYS = ("changed_at", "updated_at", "created_at", "at")
+
+
+class ImportRowError(ValueError):
+    pass
+
+
+@dataclass
+class ImportReport:
+    rows: int = 0
+    imported: int = 0
+    errors: list = field(default_factory=list)
+    current_updated: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+
+def read_records(path, file_format=None):
+    """
+    Yield dict records from a CSV or JSONL file, one at a time. A JSONL line
+    that does not decode is yielded as an ImportRowError, so the importer
+    reports it as a row error and carries on.
+    """
+    file_format = file_format or ("jsonl" if str(path).endswith((".jsonl", ".json")) else "csv")
+    with open(path, encoding="utf-8-sig", newline="") as fileobj:
+        if file_format == "csv":
+            yield from csv.DictReader(fileobj)
+        else:
+            for line in fileobj:
+                line = line.strip()
+                if line:
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError as e:
+                        yield ImportRowError(f"invalid JSON: {e.msg}")
+
+
+def _first(record, keys):
+    for key in keys:
+        value = record.get(key)
+        if value not in (None, ""):
+            return value
+    return None
+
+
+def _decimal(value, name):
+    try:
+        value = Decimal(str(value).strip())
+    except (InvalidOperation, ValueError):
+        raise ImportRowError(f"invalid {name} {value!r}")
+    if not value.is_finite() or value <= 0:
+        raise ImportRowError(f"{name} must be greater than zero")
+    return value
+
+
+class PriceImporter:
+    """Resolves and writes imported observations chunk by chunk"""
+
+    def __init__(self, chunk_size=1000, dry_run=False, update_current=True):
+        self.chunk_size = chunk_size
+        self.dry_run = dry_run
+        self.update_current = update_current
+        self.now = timezone.now()
+        # One query for the whole import: (category slug, name) and id -> PriceType
+        self.price_types = {}
+        self.price_types_by_id = {}
+        for price_type in PriceType.objects.select_related("category").only(
+            "id", "name", "category__slug", *PriceType.CURRENT_PRICE_FIELDS
+        ):
+            self.price_types[(price_type.category.slug, price_type.name)] = price_type
+            self.price_types_by_id[price_type.id] = price_type
+        # Last known price and newest observation per type while importing
+        self.last_price = {pt.id: pt.current_price_value for pt in self.price_types_by_id.values()}
+        self.latest = {}
+
+    def resolve(self, record):
+        price_type_id = record.get("price_type_id")
+        if price_type_id not in (None, ""):
+            try:
+                price_type = self.price_types_by_id.get(int(price_type_id))
+            except (TypeError, ValueError):
+                price_type = None
+        else:
+            try:
+                price_type = self.price_types.get((_first(record, CATEGORY_KEYS), record.get("price_type")))
+            except TypeError:  # unhashable JSON values (lists, objects)
+                price_type = None
+        if price_type is None:
+            raise ImportRowError("unknown price type")
+        return price_type
+
+    def build(self, record):
+        if isinstance(record, ImportRowError):
+            raise record
+        if not isinstance(record, dict):
+            raise ImportRowError("record is not an object")
+        price_type = self.resolve(record)
+        new_price = _first(record, PRICE_KEYS)
+        if new_price is None:
+            raise ImportRowError("missing price")
+        new_price = _decimal(new_price, "price")
+
+        changed_at = _first(record, TIME_KEYS)
+        if changed_at is None:
+            changed_at = self.now
+        else:
+            try:
+                changed_at = parse_datetime(str(changed_at))
+            except ValueError:  # well formed but out of range
+                changed_at = None
+            if changed_at is None:
+                raise ImportRowError("invalid timestamp")
+            if timezone.is_naive(changed_at):
+                changed_at = timezone.make_aware(changed_at, datetime.timezone.utc)
+
+        old_price = record.get("old_price")
+        old_price = _decimal(old_price, "old_price") if old_price not in (None, "") else self.last_price.get(price_type.id)
+
+        self.last_price[price_type.id] = new_price
+        latest = self.latest.get(price_type.id)
+        if latest is None or changed_at >= latest[0]:
+            self.latest[price_type.id] = (changed_at, new_price)
+
+        return PriceHistory(
+            price_type=price_type,
+            old_price=old_price,
+            new_price=new_price,
+            change_percentage=change_percentage(old_price, new_price),
+            changed_at=changed_at,
+            notes=record.get("notes") or f"Imported: {history_note(old_price, new_price)}",
+        )
+
+    def write_chunk(self, rows):
+        if self.dry_run or not rows:
+            return
+        with write_transaction():
+            PriceHistory.objects.bulk_create(rows)
+            price_history_recorded.send(sender=PriceHistory, rows=rows)
+
+    def apply_current_prices(self):
+        """Make the newest imported observation of each type its current price"""
+        if self.dry_run or not self.update_current or not self.latest:
+            return 0
+
+        with write_transaction():
+            current = {
+                price.price_type_id: price
+                for price in Price.objects.filter(price_type_id__in=list(self.latest), is_current=True)
+            }
+            to_update, to_create = [], []
+            for price_type_id, (changed_at, new_price) in self.latest.items():
+                price = current.get(price_type_id)
+                if price is None:
+                    to_create.append(Price(
+                        price_type_id=price_type_id, price=new_price, is_current=True,
+                        created_at=changed_at, updated_at=changed_at,
+                    ))
+                elif changed_at >= price.updated_at:
+                    price.price, price.updated_at = new_price, changed_at
+                    to_update.append(price)
+
+            Price.objects.bulk_update(to_update, ["price", "updated_at"])
+            created = Price.objects.bulk_create(to_create)
+            # bulk_create applies auto_now; imported prices keep their own time
+            for price in created:
+                price.updated_at = price.created_at
+            Price.objects.bulk_update(created, ["updated_at"])
+
+            price_types = []
+            for price in to_update + created:
+                price_type = self.price_types_by_id[price.price_type_id]
+                price_type.set_current_price(price)
+                price_types.append(price_type)
+            PriceType.objects.bulk_update(price_types, PriceType.CURRENT_PRICE_FIELDS)
+            invalidate_board()
+            invalidate_cross_rates()
+        return len(price_types)
+
+    def run(self, records, on_chunk=None):
+        report = ImportReport()
+        started = time.monotonic()
+        chunk = []
+        for line_number, record in enumerate(records, start=1):
+            report.rows += 1
+            try:
+                chunk.append(self.build(record))
+            except ImportRowError as e:
+                report.errors.append((line_number, str(e)))
+                continue
+            if len(chunk) >= self.chunk_size:
+                self.write_chunk(chunk)
+                report.imported += len(chunk)
+                chunk = []
+                if on_chunk:
+                    on_chunk(report, time.monotonic() - started)
+        self.write_chunk(chunk)
+        report.imported += len(chunk)
+
+        report.current_updated = self.apply_current_prices()
+        report.elapsed = time.monotonic() - started
+        return report
@@ -0,0 +1,249 @@
+"""
+Durable background jobs stored in the database.
+
+Work that does not have to finish before the response (alert delivery,
+rebuilding the board snapshot, ...) is registered with ``@task`` and queued
+with ``enqueue``, which inserts the Job row once the current transaction
+commits, so rolled back writes never leave work behind. ``manage.py
+run_jobs`` processes the queue on a thread pool:
+
+* jobs are claimed with a conditional UPDATE (pending -> running), so
+  several workers can poll the same SQLite file without taking a job twice
+* a failing job is retried with exponential backoff until ``max_attempts``,
+  then kept as ``failed`` with its traceback
+* the worker touches ``heartbeat_at`` of its running jobs every
+  ``HEARTBEAT_INTERVAL``; jobs whose heartbeat is older than ``STALE_AFTER``
+  (their worker died) are put back, however long a healthy job runs
+
+``queue_stats`` reports depth, latency and failures (also shown at
+``jobs/stats/`` and by ``run_jobs --stats``).
+"""
+import datetime
+import logging
+import os
+import random
+import socket
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Avg, Count, DurationField, ExpressionWrapper, F, Max, Min, Q
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+TASKS = {}
+
+BACKOFF_BASE = 5  # seconds before the first retry, doubled on every attempt
+BACKOFF_MAX = 600
+STALE_AFTER = datetime.timedelta(minutes=10)
+STALE_CHECK_INTERVAL = 60
+HEARTBEAT_INTERVAL = 30  # seconds, well below STALE_AFTER
+
+
+def task(name):
+    """Register the decorated function as the job task `name`"""
+    def decorator(func):
+        TASKS[name] = func
+        return func
+    return decorator
+
+
+def enqueue(name, payload=None, delay=None, max_attempts=None):
+    """
+    Queue task `name` with keyword arguments `payload` (JSON serializable)
+    after the current transaction commits (immediately outside one).
+    """
+    if name not in TASKS:
+        raise ValueError(f"Unknown job task: {name}")
+    now = timezone.now()
+    job = Job(
+        task=name,
+        payload=payload or {},
+        run_at=now + datetime.timedelta(seconds=delay) if delay else now,
+        created_at=now,
+        max_attempts=max_attempts or getattr(settings, "JOB_QUEUE_MAX_ATTEMPTS", 5),
+    )
+    transaction.on_commit(job.save)
+    return job
+
+
+def backoff(attempts):
+    """Seconds to wait before retrying after `attempts` failed attempts (with jitter)"""
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempts - 1))
+    return delay * random.uniform(0.8, 1.2)
+
+
+def claim(limit, worker="worker"):
+    """Mark up to `limit` due pending jobs as running for `worker` and return them"""
+    now = timezone.now()
+    ids = list(
+        Job.objects.filter(status=Job.PENDING, run_at__lte=now)
+        .order_by("run_at", "id").values_list("id", flat=True)[:limit]
+    )
+    if not ids:
+        return []
+    token = f"{worker}:{uuid.uuid4().hex[:8]}"
+    Job.objects.filter(pk__in=ids, status=Job.PENDING).update(
+        status=Job.RUNNING, locked_by=token, started_at=now, heartbeat_at=now, attempts=F("attempts") + 1,
+    )
+    return list(Job.objects.filter(locked_by=token, status=Job.RUNNING).order_by("run_at", "id"))
+
+
+def _finish(job, **fields):
+    Job.objects.filter(pk=job.pk, locked_by=job.locked_by).update(**fields)
+
+
+def execute(job):
+    """Run one claimed job and record the outcome"""
+    started = time.monotonic()
+    try:
+        func = TASKS.get(job.task)
+        if func is None:
+            _finish(job, status=Job.FAILED, finished_at=timezone.now(), last_error=f"Unknown task {job.task}")
+            logger.error(f'Job {job.pk} failed: unknown task {job.task}')
+            return
+        try:
+            func(**job.payload)
+        except Exception as e:
+            now = timezone.now()
+            error = traceback.format_exc()
+            if job.attempts >= job.max_attempts:
+                _finish(job, status=Job.FAILED, finished_at=now, last_error=error)
+                logger.error(f'Job {job.pk} ({job.task}) failed after {job.attempts} attempt(s): {str(e)}')
+            else:
+                delay = backoff(job.attempts)
+                _finish(
+                    job, status=Job.PENDING, locked_by="", last_error=error,
+                    run_at=now + datetime.timedelta(seconds=delay),
+                )
+                logger.warning(f'Job {job.pk} ({job.task}) attempt {job.attempts} failed, retrying in {delay:.0f}s: {str(e)}')
+        else:
+            _finish(job, status=Job.DONE, finished_at=timezone.now(), last_error="")
+            logger.info(f'Job {job.pk} ({job.task}) done in {(time.monotonic() - started) * 1000:.0f}ms')
+    finally:
+        connection.close()
+
+
+def heartbeat(jobs):
+    """Mark claimed `jobs` as still running (unless they were requeued since)"""
+    if jobs:
+        Job.objects.filter(
+            pk__in=[job.pk for job in jobs], locked_by__in={job.locked_by for job in jobs}, status=Job.RUNNING,
+        ).update(heartbeat_at=timezone.now())
+
+
+def requeue_stale(older_than=STALE_AFTER):
+    """Put back running jobs whose worker stopped sending heartbeats; returns how many"""
+    cutoff = timezone.now() - older_than
+    count = Job.objects.filter(status=Job.RUNNING).filter(
+        Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, started_at__lt=cutoff)
+    ).update(status=Job.PENDING, locked_by="")
+    if count:
+        logger.warning(f'Requeued {count} stale job(s)')
+    return count
+
+
+def purge_jobs(days):
+    """Delete finished jobs older than `days` days; failed jobs are kept"""
+    count, _ = Job.objects.filter(
+        status=Job.DONE, finished_at__lt=timezone.now() - datetime.timedelta(days=days)
+    ).delete()
+    return count
+
+
+class Worker:
+    """Polls the queue and runs claimed jobs on a thread pool"""
+
+    def __init__(self, concurrency=4, poll_interval=1.0):
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.name = f"{socket.gethostname()}:{os.getpid()}"
+        self.stopping = threading.Event()
+
+    def stop(self):
+        self.stopping.set()
+
+    def run(self, once=False):
+        """Process jobs until stopped; with `once`, until no job is due"""
+        processed = 0
+        last_stale_check = 0
+        last_heartbeat = time.monotonic()
+        running = {}  # future -> job
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="jobs") as executor:
+            while not self.stopping.is_set():
+                if time.monotonic() - last_stale_check > STALE_CHECK_INTERVAL:
+                    requeue_stale()
+                    last_stale_check = time.monotonic()
+
+                running = {future: job for future, job in running.items() if not future.done()}
+                if time.monotonic() - last_heartbeat > HEARTBEAT_INTERVAL:
+                    heartbeat(list(running.values()))
+                    last_heartbeat = time.monotonic()
+
+                free = self.concurrency - len(running)
+                jobs = claim(free, self.name) if free else []
+                for job in jobs:
+                    running[executor.submit(execute, job)] = job
+                processed += len(jobs)
+
+                if jobs and len(running) < self.concurrency:
+                    continue
+                if running:
+                    wait(running, timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+                elif once:
+                    break
+                else:
+                    self.stopping.wait(self.poll_interval)
+        connection.close()
+        return processed
+
+
+def _milliseconds(value):
+    return round(value.total_seconds() * 1000, 1) if value is not None else None
+
+
+def queue_stats(window=datetime.timedelta(hours=1)):
+    """Queue depth, latency and failure counts (latency over the last `window`)"""
+    now = timezone.now()
+    counts = dict(Job.objects.order_by().values_list("status").annotate(count=Count("id")))
+    pending = Job.objects.filter(status=Job.PENDING)
+    oldest_due = pending.filter(run_at__lte=now).aggregate(oldest=Min("run_at"))["oldest"]
+
+    recent = Job.objects.filter(finished_at__gte=now - window)
+    latency = recent.filter(status=Job.DONE).aggregate(
+        done=Count("id"),
+        retried=Count("id", filter=Q(attempts__gt=1)),
+        avg_wait=Avg(ExpressionWrapper(F("started_at") - F("run_at"), output_field=DurationField())),
+        avg_total=Avg(ExpressionWrapper(F("finished_at") - F("created_at"), output_field=DurationField())),
+        max_total=Max(ExpressionWrapper(F("finished_at") - F("created_at"), output_field=DurationField())),
+    )
+    failed_by_task = dict(
+        recent.filter(status=Job.FAILED).order_by().values_list("task").annotate(count=Count("id"))
+    )
+
+    depth = pending.filter(run_at__lte=now).count()
+    return {
+        "depth": depth,
+        "scheduled": counts.get(Job.PENDING, 0) - depth,
+        "running": counts.get(Job.RUNNING, 0),
+        "done": counts.get(Job.DONE, 0),
+        "failed": counts.get(Job.FAILED, 0),
+        "oldest_pending_seconds": round((now - oldest_due).total_seconds(), 1) if oldest_due else None,
+        "window_seconds": int(window.total_seconds()),
+        "recent": {
+            "done": latency["done"],
+            "retried": latency["retried"],
+            "failed": sum(failed_by_task.values()),
+            "failed_by_task": failed_by_task,
+            "avg_wait_ms": _milliseconds(latency["avg_wait"]),
+            "avg_latency_ms": _milliseconds(latency["avg_total"]),
+            "max_latency_ms": _milliseconds(latency["max_total"]),
+        },
+    }
@@ -0,0 +1,40 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pricing.benchmarks import run_benchmarks
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the pricing views and admin changelists on a seeded throwaway database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categories', type=int, default=10, help='Categories to seed')
+        parser.add_argument('--types', type=int, default=10, help='Price types per category')
+        parser.add_argument('--history', type=int, default=100, help='History rows per price type')
+        parser.add_argument('--iterations', type=int, default=20, help='Timed runs per view')
+        parser.add_argument('--view', action='append', dest='views',
+                            help='Only benchmark this view (repeatable), e.g. price_list')
+        parser.add_argument('--output', type=str, default='benchmark.json',
+                            help='JSON report path ("-" for stdout)')
+
+    def handle(self, *args, **options):
+        if min(options['categories'], options['types'], options['iterations']) < 1 or options['history'] < 0:
+            raise CommandError('Seed sizes and --iterations must be positive')
+
+        report = run_benchmarks(
+            categories=options['categories'],
+            types_per_category=options['types'],
+            history_per_type=options['history'],
+            iterations=options['iterations'],
+            views=options['views'],
+            log=self.stdout.write,
+        )
+
+        data = json.dumps(report, indent=2)
+        if options['output'] == '-':
+            self.stdout.write(data)
+            return
+        with open(options['output'], 'w', encoding='utf-8') as fileobj:
+            fileobj.write(data + '\n')
+        self.stdout.write(self.style.SUCCESS(f'Wrote benchmark report to {options["output"]}'))
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from pricing.exports import DATASETS, FORMATS, csv_lines, export_rows, write_xlsx, xlsx_available
+from pricing.history import parse_day, parse_history_filters
+
+
+class Command(BaseCommand):
+    help = 'Export current prices or price history as CSV (or XLSX) without loading it all in memory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=DATASETS, help='What to export')
+        parser.add_argument('--format', choices=FORMATS, default='csv', help='Output format')
+        parser.add_argument('--output', '-o', type=str, help='Output file (CSV defaults to stdout)')
+        parser.add_argument('--from', dest='date_from', type=str, help='History start date (YYYY-MM-DD)')
+        parser.add_argument('--to', dest='date_to', type=str, help='History end date, inclusive (YYYY-MM-DD)')
+        parser.add_argument('--category', type=str, help='Only this category slug')
+        parser.add_argument('--price-type', type=int, help='Only this price type id')
+
+    def handle(self, *args, **options):
+        for option in ('date_from', 'date_to'):
+            if options[option] and parse_day(options[option]) is None:
+                raise CommandError(f'Invalid date: {options[option]} (expected YYYY-MM-DD)')
+        filters = parse_history_filters({
+            'date_from': options['date_from'],
+            'date_to': options['date_to'],
+            'category': options['category'],
+            'price_type': options['price_type'],
+        })
+        rows = export_rows(options['dataset'], filters)
+
+        if options['format'] == 'xlsx':
+            if not xlsx_available():
+                raise CommandError('XLSX export requires the openpyxl package')
+            if not options['output']:
+                raise CommandError('--output is required for XLSX exports')
+            with open(options['output'], 'wb') as fileobj:
+                write_xlsx(rows, fileobj, title=options['dataset'].title())
+        elif options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as fileobj:
+                fileobj.writelines(csv_lines(rows))
+        else:
+            for line in csv_lines(rows, bom=False):
+                self.stdout.write(line, ending='')
+            return
+
+        self.stdout.write(self.style.SUCCESS(f'Exported {options["dataset"]} to {options["output"]}'))
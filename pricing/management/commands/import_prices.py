@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from pricing.imports import PriceImporter, read_records
+
+
+class Command(BaseCommand):
+    help = 'Import prices and price history from a CSV or JSONL file in chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', type=str, help='CSV or JSONL file to import')
+        parser.add_argument('--format', choices=['csv', 'jsonl'],
+                            help='File format (detected from the extension by default)')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Rows per bulk insert')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Parse and validate every row without writing anything')
+        parser.add_argument('--history-only', action='store_true',
+                            help='Only add history rows, leave current prices untouched')
+        parser.add_argument('--max-errors', type=int, default=20, help='Number of row errors to print')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive')
+
+        importer = PriceImporter(
+            chunk_size=options['chunk_size'],
+            dry_run=options['dry_run'],
+            update_current=not options['history_only'],
+        )
+
+        def progress(report, elapsed):
+            self.stdout.write(f'{report.imported} rows imported ({report.imported / elapsed:.0f} rows/s)')
+
+        try:
+            report = importer.run(read_records(options['path'], options['format']), on_chunk=progress)
+        except (OSError, ValueError) as e:
+            raise CommandError(f'Could not read {options["path"]}: {e}')
+
+        for line_number, error in report.errors[:options['max_errors']]:
+            self.stdout.write(self.style.WARNING(f'Row {line_number}: {error}'))
+
+        prefix = '[dry run] ' if options['dry_run'] else ''
+        self.stdout.write(self.style.SUCCESS(
+            f'{prefix}{report.imported} of {report.rows} row(s) imported, {len(report.errors)} error(s), '
+            f'{report.current_updated} current price(s) updated in {report.elapsed:.2f}s '
+            f'({report.rows_per_second:.0f} rows/s)'
+        ))
@@ -0,0 +1,50 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+
+from pricing.analytics import DEFAULT_DAYS, DEFAULT_WINDOWS, get_analytics, numpy_available
+from pricing.models import PriceType
+
+
+class Command(BaseCommand):
+    help = 'Show volatility, moving averages, max drawdown and correlations of price types'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--price-type', type=int, action='append', dest='price_types',
+                            help='Price type id (repeatable, default: every active priced type)')
+        parser.add_argument('--days', type=int, default=DEFAULT_DAYS, help='History window in days')
+        parser.add_argument('--window', type=int, action='append', dest='windows',
+                            help=f'Moving average window in days (repeatable, default: {DEFAULT_WINDOWS})')
+        parser.add_argument('--json', action='store_true', help='Print the full result as JSON')
+
+    def handle(self, *args, **options):
+        if not numpy_available():
+            raise CommandError('Analytics require the numpy package')
+        if options['days'] < 2:
+            raise CommandError('--days must be at least 2')
+        if any(window < 1 for window in options['windows'] or ()):
+            raise CommandError('--window must be at least 1')
+
+        price_type_ids = options['price_types'] or list(
+            PriceType.objects.filter(is_active=True, current_price__isnull=False).values_list('id', flat=True)
+        )
+        windows = tuple(options['windows'] or DEFAULT_WINDOWS)
+        result = get_analytics(price_type_ids, days=options['days'], windows=windows)
+
+        if options['json']:
+            self.stdout.write(json.dumps(result, indent=2, cls=DjangoJSONEncoder))
+            return
+
+        for price_type_id, metrics in result['metrics'].items():
+            averages = ', '.join(f'SMA{window}={value}' for window, value in metrics['moving_averages'].items())
+            self.stdout.write(
+                f'{price_type_id} {metrics["name"]}: last={metrics["last"]} '
+                f'volatility={metrics["volatility"]} drawdown={metrics["max_drawdown"]} {averages}'
+            )
+        if result['correlation']:
+            self.stdout.write(f'Correlation ({", ".join(map(str, result["correlation"]["price_types"]))}):')
+            for row in result['correlation']['matrix']:
+                # None where a series is constant (no defined correlation)
+                self.stdout.write('  ' + ' '.join(f'{"—" if value is None else value:>7}' for value in row))
+        self.stdout.write(self.style.SUCCESS(f'Analytics for {len(result["metrics"])} price type(s)'))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from pricing.candles import rebuild_candles
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the OHLC price candles (1m/1h/1d) from PriceHistory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--price-type', type=int, action='append', dest='price_types',
+                            help='Only rebuild this price type id (repeatable)')
+        parser.add_argument('--batch-size', type=int, default=2000,
+                            help='Rows read and candles written per batch')
+
+    def handle(self, *args, **options):
+        written = rebuild_candles(options['price_types'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {written} candle(s)'))
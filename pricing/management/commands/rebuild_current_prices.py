@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from pricing.services import rebuild_current_price_pointers
+
+
+class Command(BaseCommand):
+    help = 'Rebuild and verify the denormalized current price pointer on every PriceType'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Only verify the pointers and exit with an error if any are stale')
+
+    def handle(self, *args, **options):
+        check_only = options['check']
+        stale = rebuild_current_price_pointers(fix=not check_only)
+
+        for price_type in stale:
+            self.stdout.write(f'Stale pointer: {price_type.name} (id={price_type.id})')
+
+        if not stale:
+            self.stdout.write(self.style.SUCCESS('All current price pointers are up to date'))
+        elif check_only:
+            raise CommandError(f'{len(stale)} price type(s) have a stale current price pointer')
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Rebuilt {len(stale)} current price pointer(s)'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from pricing.stats import refresh_stats
+
+
+class Command(BaseCommand):
+    help = 'Recompute the rolling 24h/7d price stats from PriceHistory (run periodically)'
+
+    def handle(self, *args, **options):
+        written = refresh_stats()
+        self.stdout.write(self.style.SUCCESS(f'Refreshed rolling stats for {written} price type(s)'))
@@ -0,0 +1,43 @@
+import json
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from pricing.jobs import Worker, purge_jobs, queue_stats
+
+
+class Command(BaseCommand):
+    help = 'Run the background job worker (alert delivery, board cache rebuilds)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=getattr(settings, 'JOB_QUEUE_CONCURRENCY', 4),
+                            help='Jobs run in parallel')
+        parser.add_argument('--poll-interval', type=float, default=getattr(settings, 'JOB_QUEUE_POLL_INTERVAL', 1.0),
+                            help='Seconds between polls of an empty queue')
+        parser.add_argument('--once', action='store_true', help='Exit when no job is due')
+        parser.add_argument('--stats', action='store_true', help='Print queue depth, latency and failures, then exit')
+        parser.add_argument('--purge', type=int, metavar='DAYS',
+                            help='Delete jobs that finished more than DAYS days ago, then exit')
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            self.stdout.write(json.dumps(queue_stats(), indent=2))
+            return
+        if options['purge'] is not None:
+            deleted = purge_jobs(options['purge'])
+            self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} finished job(s)'))
+            return
+        if options['concurrency'] < 1:
+            raise CommandError('--concurrency must be at least 1')
+
+        worker = Worker(concurrency=options['concurrency'], poll_interval=options['poll_interval'])
+        signal.signal(signal.SIGTERM, lambda signum, frame: worker.stop())
+        self.stdout.write(f'Worker {worker.name} started with {worker.concurrency} thread(s)')
+        try:
+            processed = worker.run(once=options['once'])
+        except KeyboardInterrupt:
+            worker.stop()
+            processed = None
+        if processed is not None:
+            self.stdout.write(self.style.SUCCESS(f'Processed {processed} job(s)'))
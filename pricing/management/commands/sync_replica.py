@@ -0,0 +1,33 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from pricing.replica import sync_replica
+
+
+class Command(BaseCommand):
+    help = 'Copy the primary database to the read replica file (DATABASE_REPLICA)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float,
+                            help='Keep syncing every INTERVAL seconds instead of once')
+
+    def handle(self, *args, **options):
+        if not settings.DATABASE_REPLICA:
+            raise CommandError('DATABASE_REPLICA is not set')
+        if settings.DATABASES['default']['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError('sync_replica copies SQLite databases only')
+
+        while True:
+            result = sync_replica(settings.DATABASE_REPLICA)
+            self.stdout.write(self.style.SUCCESS(
+                f'Replica synced at board version {result["version"]} '
+                f'({result["bytes"] // 1024} KiB in {result["seconds"]}s)'
+            ))
+            if not options['interval']:
+                break
+            try:
+                time.sleep(options['interval'])
+            except KeyboardInterrupt:
+                break
@@ -0,0 +1,49 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pricing.models import Category
+from pricing.services import SKIPPED, bulk_update_prices
+
+
+class Command(BaseCommand):
+    help = 'Update current prices of a category in one batch (PRICE_TYPE_ID=PRICE pairs)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('category', type=str, help='Slug of the category to update')
+        parser.add_argument('prices', nargs='+', help='Assignments in the form PRICE_TYPE_ID=PRICE')
+        parser.add_argument('--json', action='store_true', help='Print the result report as JSON')
+
+    def handle(self, *args, **options):
+        try:
+            category = Category.objects.get(slug=options['category'])
+        except Category.DoesNotExist:
+            raise CommandError(f'Category "{options["category"]}" does not exist')
+
+        submitted = {}
+        for assignment in options['prices']:
+            price_type_id, sep, value = assignment.partition('=')
+            if not sep or not price_type_id.strip().isdigit():
+                raise CommandError(f'Invalid assignment "{assignment}", expected PRICE_TYPE_ID=PRICE')
+            submitted[int(price_type_id)] = value
+
+        report = bulk_update_prices(category, submitted)
+
+        if options['json']:
+            self.stdout.write(json.dumps(report.as_dict(), indent=2))
+            return
+
+        for result in report.results:
+            if result.status == SKIPPED:
+                continue
+            line = f'{result.price_type.name}: {result.status}'
+            if result.changed:
+                line += f' ({result.old_price or "-"} -> {result.new_price})'
+            if result.error:
+                self.stdout.write(self.style.ERROR(f'{line}: {result.error}'))
+            else:
+                self.stdout.write(line)
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Updated {report.updated_count} price(s), {report.error_count} error(s)')
+        )
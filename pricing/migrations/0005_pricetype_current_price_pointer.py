@@ -0,0 +1,47 @@
+# Generated by Django 5.2.7 on 2026-10-17 23:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def populate_current_price_pointer(apps, schema_editor):
+    PriceType = apps.get_model('pricing', 'PriceType')
+    Price = apps.get_model('pricing', 'Price')
+
+    price_types = []
+    for price in Price.objects.filter(is_current=True).iterator():
+        price_types.append(PriceType(
+            pk=price.price_type_id,
+            current_price_id=price.pk,
+            current_price_value=price.price,
+            current_price_updated_at=price.updated_at,
+        ))
+    PriceType.objects.bulk_update(
+        price_types, ['current_price', 'current_price_value', 'current_price_updated_at'], batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pricing', '0004_alter_category_slug'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pricetype',
+            name='current_price',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='pricing.price'),
+        ),
+        migrations.AddField(
+            model_name='pricetype',
+            name='current_price_updated_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='pricetype',
+            name='current_price_value',
+            field=models.DecimalField(blank=True, decimal_places=4, editable=False, max_digits=20, null=True),
+        ),
+        migrations.RunPython(populate_current_price_pointer, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.7 on 2026-10-17 23:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pricing', '0005_pricetype_current_price_pointer'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceCandle',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('interval', models.CharField(choices=[('1m', '1 minute'), ('1h', '1 hour'), ('1d', '1 day')], max_length=2)),
+                ('bucket_start', models.DateTimeField()),
+                ('open', models.DecimalField(decimal_places=4, max_digits=20)),
+                ('high', models.DecimalField(decimal_places=4, max_digits=20)),
+                ('low', models.DecimalField(decimal_places=4, max_digits=20)),
+                ('close', models.DecimalField(decimal_places=4, max_digits=20)),
+                ('change_count', models.PositiveIntegerField(default=0)),
+                ('open_at', models.DateTimeField()),
+                ('close_at', models.DateTimeField()),
+                ('price_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='candles', to='pricing.pricetype')),
+            ],
+            options={
+                'ordering': ['price_type', 'interval', 'bucket_start'],
+                'constraints': [models.UniqueConstraint(fields=('price_type', 'interval', 'bucket_start'), name='unique_candle_per_bucket')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-17 23:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pricing', '0006_pricecandle'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='price',
+            index=models.Index(fields=['price_type', '-created_at'], name='price_type_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='price',
+            index=models.Index(fields=['-created_at'], name='price_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pricehistory',
+            index=models.Index(fields=['price_type', '-changed_at'], name='history_type_changed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pricehistory',
+            index=models.Index(fields=['-changed_at', '-id'], name='history_changed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pricetype',
+            index=models.Index(condition=models.Q(('current_price_updated_at__isnull', False)), fields=['current_price_updated_at'], name='pricetype_current_updated_idx'),
+        ),
+    ]
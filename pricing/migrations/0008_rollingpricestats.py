@@ -0,0 +1,37 @@
+# Generated by Django 5.2.7 on 2026-10-17 23:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pricing', '0007_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollingPriceStats',
+            fields=[
+                ('price_type', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rolling_stats', serialize=False, to='pricing.pricetype')),
+                ('last_price', models.DecimalField(blank=True, decimal_places=4, max_digits=20, null=True)),
+                ('last_changed_at', models.DateTimeField(blank=True, null=True)),
+                ('first_24h', models.DecimalField(blank=True, decimal_places=4, max_digits=20, null=True)),
+                ('min_24h', models.DecimalField(blank=True, decimal_places=4, max_digits=20, null=True)),
+                ('max_24h', models.DecimalField(blank=True, decimal_places=4, max_digits=20, null=True)),
+                ('change_24h', models.DecimalField(blank=True, decimal_places=4, max_digits=8, null=True)),
+                ('count_24h', models.PositiveIntegerField(default=0)),
+                ('first_7d', models.DecimalField(blank=True, decimal_places=4, max_digits=20, null=True)),
+                ('min_7d', models.DecimalField(blank=True, decimal_places=4, max_digits=20, null=True)),
+                ('max_7d', models.DecimalField(blank=True, decimal_places=4, max_digits=20, null=True)),
+                ('change_7d', models.DecimalField(blank=True, decimal_places=4, max_digits=8, null=True)),
+                ('count_7d', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('corrected_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Rolling price stats',
+            },
+        ),
+    ]
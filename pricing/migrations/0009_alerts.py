@@ -0,0 +1,56 @@
+# Generated by Django 5.2.7 on 2026-10-17 23:33
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pricing', '0008_rollingpricestats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlertRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('above', 'Price crosses above'), ('below', 'Price crosses below'), ('change', 'Change within window at least (%)')], max_length=6)),
+                ('threshold', models.DecimalField(decimal_places=4, max_digits=20)),
+                ('window', models.CharField(choices=[('24h', '24 hours'), ('7d', '7 days')], default='24h', max_length=3)),
+                ('cooldown_minutes', models.PositiveIntegerField(default=60)),
+                ('notify_email', models.EmailField(blank=True, max_length=254)),
+                ('is_active', models.BooleanField(default=True)),
+                ('last_fired_at', models.DateTimeField(blank=True, editable=False, null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('price_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='alert_rules', to='pricing.pricetype')),
+            ],
+            options={
+                'ordering': ['price_type', 'kind', 'threshold'],
+            },
+        ),
+        migrations.CreateModel(
+            name='AlertEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('price', models.DecimalField(decimal_places=4, max_digits=20)),
+                ('change_percentage', models.DecimalField(blank=True, decimal_places=4, max_digits=8, null=True)),
+                ('message', models.TextField()),
+                ('fired_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('delivered_at', models.DateTimeField(blank=True, null=True)),
+                ('error', models.TextField(blank=True)),
+                ('rule', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='events', to='pricing.alertrule')),
+            ],
+            options={
+                'ordering': ['-fired_at'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='alertrule',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['price_type'], name='alertrule_active_type_idx'),
+        ),
+    ]
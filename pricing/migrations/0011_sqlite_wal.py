@@ -0,0 +1,27 @@
+from django.db import migrations
+
+
+def enable_wal(apps, schema_editor):
+    """
+    Switch the SQLite database file to WAL journaling. The mode is stored in
+    the file, so it is set once here rather than on every connection.
+    """
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite' or connection.is_in_memory_db():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA journal_mode = WAL')
+
+
+class Migration(migrations.Migration):
+
+    # journal_mode cannot change inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('pricing', '0010_jobs'),
+    ]
+
+    operations = [
+        migrations.RunPython(enable_wal, migrations.RunPython.noop, atomic=False),
+    ]
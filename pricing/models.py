@@ -1,7 +1,32 @@
+from django.conf import settings
 from django.db import models
 from django.utils import timezone
 from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
 from django.utils.text import slugify
+from django.dispatch import Signal
+
+from .db import write_transaction
+
+
+# Sent inside the writing transaction whenever PriceHistory rows are written,
+# by Price.save and by the bulk services (which bypass model signals), with
+# `rows` holding the saved PriceHistory instances.
+price_history_recorded = Signal()
+
+
+def change_percentage(old_price, new_price):
+    """Percentage change from old_price to new_price, or None without a usable old price"""
+    if not old_price or new_price is None:
+        return None
+    return ((new_price - old_price) / old_price) * 100
+
+
+def history_note(old_price, new_price):
+    """Human readable note stored on PriceHistory rows"""
+    if old_price is None:
+        return f"Price set to {new_price}"
+    return f"Price updated from {old_price} to {new_price}"
 
 
 class Category(models.Model):
@@ -53,28 +78,53 @@ class PriceType(models.Model):
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Denormalized pointer to the current Price, kept in sync by Price.save
+    # (and the bulk update service) so hot read paths need no extra queries.
+    # Use `manage.py rebuild_current_prices` to verify or repair it.
+    current_price = models.ForeignKey(
+        "Price", on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name="+"
+    )
+    current_price_value = models.DecimalField(max_digits=20, decimal_places=4, null=True, blank=True, editable=False)
+    current_price_updated_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    CURRENT_PRICE_FIELDS = ["current_price", "current_price_value", "current_price_updated_at"]
+
     def __str__(self):
         return f"{self.category.name} - {self.name}"
 
     def get_current_price(self):
         """Return the current price value or None if not found"""
-        current_price = self.prices.filter(is_current=True).first()
-        return current_price.price if current_price else None
+        return self.current_price_value
     
     def get_current_description(self):
         """Return the current price description or empty string if not found"""
-        current_price = self.prices.filter(is_current=True).first()
-        return current_price.description if current_price else ""
+        if self.current_price_id is None:
+            return ""
+        return getattr(self.current_price, "description", None) or ""
     
     def get_current_price_object(self):
         """Return the current price object or None if not found"""
-        return self.prices.filter(is_current=True).first()
+        return self.current_price
+
+    def set_current_price(self, price):
+        """Point the denormalized current-price fields at `price` (or clear them with None)"""
+        self.current_price = price
+        self.current_price_value = price.price if price else None
+        self.current_price_updated_at = price.updated_at if price else None
 
     class Meta:
         ordering = ["category__name", "action", "name"]
         constraints = [
             models.UniqueConstraint(fields=["category", "name"], name="unique_price_type_name_per_category")
         ]
+        indexes = [
+            # "Updated today" counts filter the pointer timestamp by range
+            models.Index(
+                fields=["current_price_updated_at"],
+                condition=models.Q(current_price_updated_at__isnull=False),
+                name="pricetype_current_updated_idx",
+            ),
+        ]
 
 
 class Price(models.Model):
@@ -89,25 +139,62 @@ class Price(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
 
     def save(self, *args, **kwargs):
-        # اگر این یک قیمت جدید است یا قیمت تغییر کرده
-        if self.pk:  # Existing instance
-            old_instance = Price.objects.get(pk=self.pk)
-            if old_instance.price != self.price and self.is_current:
-                # ایجاد رکورد تاریخچه
-                PriceHistory.objects.create(
+        with write_transaction():
+            history = None
+            # اگر این یک قیمت جدید است یا قیمت تغییر کرده
+            if self.pk:  # Existing instance
+                old_instance = Price.objects.get(pk=self.pk)
+                if old_instance.price != self.price and self.is_current:
+                    # ایجاد رکورد تاریخچه
+                    history = PriceHistory.objects.create(
+                        price_type=self.price_type,
+                        old_price=old_instance.price,
+                        new_price=self.price,
+                        change_percentage=change_percentage(old_instance.price, self.price),
+                        changed_at=timezone.now(),
+                        notes=history_note(old_instance.price, self.price)
+                    )
+            elif self.is_current:
+                # A new current price is recorded against the one it replaces (if any)
+                previous_price = Price.objects.filter(
+                    price_type=self.price_type, is_current=True
+                ).values_list("price", flat=True).first()
+                history = PriceHistory.objects.create(
                     price_type=self.price_type,
-                    old_price=old_instance.price,
+                    old_price=previous_price,
                     new_price=self.price,
-                    change_percentage=((self.price - old_instance.price) / old_instance.price) * 100 if old_instance.price != 0 else 0,
+                    change_percentage=change_percentage(previous_price, self.price),
                     changed_at=timezone.now(),
-                    notes=f"Price updated from {old_instance.price} to {self.price}"
+                    notes=history_note(previous_price, self.price)
                 )
-        
-        # Ensure only one current price per PriceType
+
+            if history is not None:
+                price_history_recorded.send(sender=PriceHistory, rows=[history])
+
+            # Ensure only one current price per PriceType
+            if self.is_current:
+                Price.objects.filter(price_type=self.price_type, is_current=True).exclude(pk=self.pk).update(is_current=False)
+
+            super().save(*args, **kwargs)
+            self._sync_current_pointer()
+
+    def _sync_current_pointer(self):
+        """Keep PriceType's denormalized current-price fields in step with this row"""
         if self.is_current:
-            Price.objects.filter(price_type=self.price_type, is_current=True).exclude(pk=self.pk).update(is_current=False)
-        
-        super().save(*args, **kwargs)
+            updates = {
+                "current_price": self,
+                "current_price_value": self.price,
+                "current_price_updated_at": self.updated_at,
+            }
+            PriceType.objects.filter(pk=self.price_type_id).update(**updates)
+        else:
+            updates = {"current_price": None, "current_price_value": None, "current_price_updated_at": None}
+            if not PriceType.objects.filter(pk=self.price_type_id, current_price=self).update(**updates):
+                return
+
+        if Price.price_type.is_cached(self):
+            for name, value in updates.items():
+                setattr(self.price_type, name, value)
 
     def clean(self):
         if self.price <= 0:
@@ -137,6 +224,12 @@ class Price(models.Model):
                 name="unique_current_price_per_type",
             )
         ]
+        indexes = [
+            # A type's prices in the default (newest first) order; the current
+            # price itself is found through the partial unique constraint above
+            models.Index(fields=["price_type", "-created_at"], name="price_type_created_idx"),
+            models.Index(fields=["-created_at"], name="price_created_idx"),
+        ]
 
 
 class PriceHistory(models.Model):
@@ -151,8 +244,8 @@ class PriceHistory(models.Model):
     notes = models.TextField(blank=True, null=True)
 
     def save(self, *args, **kwargs):
-        if self.old_price and self.new_price and self.old_price != 0:
-            self.change_percentage = ((self.new_price - self.old_price) / self.old_price) * 100
+        if self.old_price and self.new_price:
+            self.change_percentage = change_percentage(self.old_price, self.new_price)
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -161,3 +254,179 @@ class PriceHistory(models.Model):
     class Meta:
         ordering = ["-changed_at"]
         verbose_name_plural = "Price Histories"
+        indexes = [
+            # Per-type timelines, newest first
+            models.Index(fields=["price_type", "-changed_at"], name="history_type_changed_idx"),
+            # Global timeline and keyset pagination on (changed_at, id)
+            models.Index(fields=["-changed_at", "-id"], name="history_changed_idx"),
+        ]
+
+
+class PriceCandle(models.Model):
+    """
+    Open/high/low/close rollup of PriceHistory per price type and interval.
+    Maintained incrementally from new history rows (see pricing.candles).
+    """
+    INTERVAL_CHOICES = [
+        ("1m", "1 minute"),
+        ("1h", "1 hour"),
+        ("1d", "1 day"),
+    ]
+
+    price_type = models.ForeignKey(PriceType, on_delete=models.CASCADE, related_name="candles")
+    interval = models.CharField(max_length=2, choices=INTERVAL_CHOICES)
+    bucket_start = models.DateTimeField()
+    open = models.DecimalField(max_digits=20, decimal_places=4)
+    high = models.DecimalField(max_digits=20, decimal_places=4)
+    low = models.DecimalField(max_digits=20, decimal_places=4)
+    close = models.DecimalField(max_digits=20, decimal_places=4)
+    change_count = models.PositiveIntegerField(default=0)
+    # Times of the rows that set open/close, so late rows land in the right place
+    open_at = models.DateTimeField()
+    close_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.price_type.name} {self.interval} {self.bucket_start:%Y-%m-%d %H:%M}"
+
+    class Meta:
+        ordering = ["price_type", "interval", "bucket_start"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["price_type", "interval", "bucket_start"], name="unique_candle_per_bucket"
+            )
+        ]
+
+
+class RollingPriceStats(models.Model):
+    """
+    Rolling 24-hour and 7-day statistics of one price type. Updated from new
+    history rows as they are written and corrected periodically as old
+    changes leave the windows (see pricing.stats).
+    """
+    price_type = models.OneToOneField(
+        PriceType, on_delete=models.CASCADE, primary_key=True, related_name="rolling_stats"
+    )
+    last_price = models.DecimalField(max_digits=20, decimal_places=4, null=True, blank=True)
+    last_changed_at = models.DateTimeField(null=True, blank=True)
+
+    # "first" is the price in effect when the window opened
+    first_24h = models.DecimalField(max_digits=20, decimal_places=4, null=True, blank=True)
+    min_24h = models.DecimalField(max_digits=20, decimal_places=4, null=True, blank=True)
+    max_24h = models.DecimalField(max_digits=20, decimal_places=4, null=True, blank=True)
+    change_24h = models.DecimalField(max_digits=8, decimal_places=4, null=True, blank=True)
+    count_24h = models.PositiveIntegerField(default=0)
+
+    first_7d = models.DecimalField(max_digits=20, decimal_places=4, null=True, blank=True)
+    min_7d = models.DecimalField(max_digits=20, decimal_places=4, null=True, blank=True)
+    max_7d = models.DecimalField(max_digits=20, decimal_places=4, null=True, blank=True)
+    change_7d = models.DecimalField(max_digits=8, decimal_places=4, null=True, blank=True)
+    count_7d = models.PositiveIntegerField(default=0)
+
+    updated_at = models.DateTimeField(auto_now=True)
+    corrected_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.price_type.name} stats"
+
+    class Meta:
+        verbose_name_plural = "Rolling price stats"
+
+
+class AlertRule(models.Model):
+    """
+    Operator-defined alert on one price type: the price crossing above or
+    below a bound, or moving by at least `threshold` percent within the
+    rolling window. Evaluated whenever history is written (see pricing.alerts).
+    """
+    KIND_CHOICES = [
+        ("above", "Price crosses above"),
+        ("below", "Price crosses below"),
+        ("change", "Change within window at least (%)"),
+    ]
+    WINDOW_CHOICES = [
+        ("24h", "24 hours"),
+        ("7d", "7 days"),
+    ]
+
+    price_type = models.ForeignKey(PriceType, on_delete=models.CASCADE, related_name="alert_rules")
+    kind = models.CharField(max_length=6, choices=KIND_CHOICES)
+    threshold = models.DecimalField(max_digits=20, decimal_places=4)
+    window = models.CharField(max_length=3, choices=WINDOW_CHOICES, default="24h")
+    cooldown_minutes = models.PositiveIntegerField(default=60)
+    notify_email = models.EmailField(blank=True)
+    is_active = models.BooleanField(default=True)
+    last_fired_at = models.DateTimeField(null=True, blank=True, editable=False)
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name="+"
+    )
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.price_type.name}: {self.get_kind_display()} {self.threshold}"
+
+    class Meta:
+        ordering = ["price_type", "kind", "threshold"]
+        indexes = [
+            # The evaluator only reads the active rules of the changed types
+            models.Index(fields=["price_type"], condition=models.Q(is_active=True), name="alertrule_active_type_idx"),
+        ]
+
+
+class AlertEvent(models.Model):
+    """One firing of an AlertRule and the outcome of its notification"""
+    rule = models.ForeignKey(AlertRule, on_delete=models.CASCADE, related_name="events")
+    price = models.DecimalField(max_digits=20, decimal_places=4)
+    change_percentage = models.DecimalField(max_digits=8, decimal_places=4, null=True, blank=True)
+    message = models.TextField()
+    fired_at = models.DateTimeField(default=timezone.now)
+    delivered_at = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True)
+
+    def __str__(self):
+        return self.message
+
+    class Meta:
+        ordering = ["-fired_at"]
+
+
+class Job(models.Model):
+    """
+    Deferred work for the background worker (``manage.py run_jobs``).
+    `task` names a function registered in pricing.jobs, called with `payload`
+    as keyword arguments.
+    """
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    ]
+
+    task = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True, encoder=DjangoJSONEncoder)
+    status = models.CharField(max_length=7, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # Touched by the worker while the job runs; a stale one means the worker is gone
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    locked_by = models.CharField(max_length=100, blank=True)
+    last_error = models.TextField(blank=True)
+
+    def __str__(self):
+        return f"{self.task} #{self.pk} ({self.status})"
+
+    class Meta:
+        ordering = ["-created_at"]
+        indexes = [
+            # The worker polls for due pending jobs in run_at order
+            models.Index(fields=["run_at", "id"], condition=models.Q(status="pending"), name="job_pending_idx"),
+            models.Index(fields=["status", "finished_at"], name="job_status_finished_idx"),
+        ]
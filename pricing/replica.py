@@ -0,0 +1,164 @@
+"""
+Optional read replica for the read-only pricing views.
+
+When ``DATABASE_REPLICA`` is set, settings add a read-only ``replica``
+database pointing at that SQLite file, which ``manage.py sync_replica``
+refreshes from the primary with SQLite's online backup API. Views decorated
+with ``replica_view`` (reports, history, exports, the feeds) read pricing
+models from it; everything else, all writes, reads inside a transaction and
+other apps (users, sessions) stay on the primary.
+
+Lag guard: each sync records when it started and the board version it saw.
+A request uses the replica only when no board write has committed since
+(the replica is current) or the last sync is at most ``REPLICA_MAX_LAG``
+seconds old; otherwise it falls back to the primary. Results cached under
+the board version are built inside ``current_data_only()``, so a lagging
+replica never ends up cached as current data.
+"""
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+logger = logging.getLogger(__name__)
+
+REPLICA_ALIAS = "replica"
+REPLICA_APPS = {"pricing"}
+SYNC_KEY = "pricing:replica:synced"
+
+
+@dataclass(frozen=True)
+class ReplicaState:
+    alias: str
+    current: bool  # no board write committed since the last sync
+    lag: float  # seconds since the last sync, 0 when current
+
+
+_replica = ContextVar("use_replica", default=None)
+
+
+class ReplicaRouter:
+    """Send pricing reads to the replica while a replica_view runs"""
+
+    def db_for_read(self, model, **hints):
+        state = _replica.get()
+        if state is None or model._meta.app_label not in REPLICA_APPS:
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None  # read-after-write inside a transaction
+        return state.alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True  # the replica is a copy of the primary
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != REPLICA_ALIAS
+
+
+def replica_state():
+    """The replica if it is configured, synced and within the lag limit, else None"""
+    if REPLICA_ALIAS not in settings.DATABASES:
+        return None
+    from .cache import get_board_version, get_cache
+
+    synced = get_cache().get(SYNC_KEY)
+    if synced is None:
+        return None
+    current = synced["version"] == get_board_version()
+    lag = 0 if current else time.time() - synced["at"]
+    if lag > getattr(settings, "REPLICA_MAX_LAG", 30):
+        logger.info(f'Replica is {lag:.0f}s behind, reading from the primary')
+        return None
+    return ReplicaState(REPLICA_ALIAS, current, lag)
+
+
+@contextmanager
+def use_replica():
+    """Read pricing models from the replica inside this block (if the lag guard allows)"""
+    token = _replica.set(replica_state())
+    try:
+        yield _replica.get()
+    finally:
+        _replica.reset(token)
+
+
+@contextmanager
+def current_data_only():
+    """Fall back to the primary inside this block unless the replica is current"""
+    state = _replica.get()
+    token = _replica.set(state if state is not None and state.current else None)
+    try:
+        yield
+    finally:
+        _replica.reset(token)
+
+
+def _iterate_with(state, iterator):
+    token = _replica.set(state)
+    try:
+        yield from iterator
+    finally:
+        _replica.reset(token)
+
+
+def replica_view(view):
+    """Run a read-only view (and its streamed body) against the replica"""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        with use_replica() as state:
+            response = view(request, *args, **kwargs)
+        if state is not None and getattr(response, "streaming", False) and not response.is_async:
+            # Streamed rows are read after the view returned
+            response.streaming_content = _iterate_with(state, response.streaming_content)
+        return response
+    return wrapper
+
+
+def sync_replica(path=None):
+    """
+    Copy the primary database to the replica file with the SQLite backup API.
+
+    The copy is written next to the replica and swapped in atomically, so
+    open replica connections keep reading the old file. Returns a summary.
+    """
+    from .cache import get_board_version, get_cache
+
+    path = path or settings.DATABASE_REPLICA
+    started = time.time()
+    version = get_board_version()  # read before copying: the copy has at least this version
+
+    fd, temporary = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".sync")
+    os.close(fd)
+    try:
+        primary = connections[DEFAULT_DB_ALIAS]
+        primary.ensure_connection()
+        target = sqlite3.connect(temporary)
+        try:
+            primary.connection.backup(target)
+            # Readers open the replica read-only: keep it out of WAL mode
+            target.execute("PRAGMA journal_mode = DELETE")
+        finally:
+            target.close()
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+
+    get_cache().set(SYNC_KEY, {"at": started, "version": version}, timeout=None)
+    return {
+        "version": version,
+        "seconds": round(time.time() - started, 3),
+        "bytes": os.path.getsize(path),
+    }
@@ -0,0 +1,72 @@
+"""
+Statistics for the reports page.
+
+All numbers come from SQL aggregates in a fixed number of queries (one per
+block of the page), independent of how many categories, price types or
+history rows exist. The result is cached under the current board version,
+so any price or category write (which bumps the version) invalidates it.
+"""
+from django.conf import settings
+from django.db.models import Count, Max, Min, Q
+
+from .cache import get_board_version, get_cache
+from .history import history_counts
+from .models import Category, PriceHistory
+from .replica import current_data_only
+
+REPORT_KEY = "pricing:report:v2:{version}"  # schema tag, as for the board snapshot
+RECENT_LIMIT = 10
+
+
+def build_report():
+    """Compute the report context (3 queries)."""
+    categories = Category.objects.annotate(
+        price_type_count=Count("price_types", distinct=True),
+        priced_count=Count("price_types", filter=Q(price_types__current_price__isnull=False), distinct=True),
+        last_updated=Max("price_types__current_price_updated_at"),
+        min_price=Min("price_types__current_price_value"),
+        max_price=Max("price_types__current_price_value"),
+    ).order_by("-price_type_count", "name").values(
+        "name", "slug", "price_type_count", "priced_count", "last_updated", "min_price", "max_price",
+    )
+
+    category_stats = []
+    total_prices = 0
+    for category in categories:
+        total_prices += category["price_type_count"]
+        category_stats.append({
+            "name": category["name"],
+            "slug": category["slug"],
+            "count": category["price_type_count"],
+            "priced": category["priced_count"],
+            "last_updated": category["last_updated"],
+            "min_price": category["min_price"],
+            "max_price": category["max_price"],
+        })
+    for stat in category_stats:
+        stat["percentage"] = stat["count"] * 100 / total_prices if total_prices else 0
+
+    recent_prices = list(
+        PriceHistory.objects.select_related("price_type__category").order_by("-changed_at", "-id")[:RECENT_LIMIT]
+    )
+
+    return {
+        "total_prices": total_prices,
+        "total_categories": len(category_stats),
+        "category_stats": category_stats,
+        "recent_prices": recent_prices,
+        "history_counts": history_counts(),
+    }
+
+
+def get_report():
+    """Cached report context, rebuilt after any board write or after the timeout."""
+    cache = get_cache()
+    key = REPORT_KEY.format(version=get_board_version())
+    report = cache.get(key)
+    if report is None:
+        with current_data_only():
+            report = build_report()
+        # Time-based counters (today / this week) still need to roll over
+        cache.set(key, report, timeout=getattr(settings, "PRICING_REPORT_CACHE_TIMEOUT", 300))
+    return report
@@ -0,0 +1,236 @@
+"""
+Write-side services for prices.
+
+These functions hold the business logic behind the price entry screens so the
+same code path can be used from views, management commands and API endpoints.
+"""
+from dataclasses import dataclass, field
+from decimal import Decimal, InvalidOperation
+import logging
+
+from django.utils import timezone
+
+from .cache import invalidate_board
+from .crossrates import invalidate_cross_rates
+from .db import write_transaction
+from .models import Price, PriceHistory, PriceType, change_percentage, history_note, price_history_recorded
+
+logger = logging.getLogger(__name__)
+
+PRICE_FIELD_PREFIX = "price_"
+
+# Per-type result statuses
+CREATED = "created"
+UPDATED = "updated"
+UNCHANGED = "unchanged"
+SKIPPED = "skipped"
+INVALID = "invalid"
+
+
+@dataclass
+class PriceUpdateResult:
+    """Outcome of a submitted price for a single PriceType."""
+    price_type: object
+    status: str
+    old_price: Decimal = None
+    new_price: Decimal = None
+    error: str = ""
+
+    @property
+    def changed(self):
+        return self.status in (CREATED, UPDATED)
+
+    def as_dict(self):
+        return {
+            "price_type_id": self.price_type.id,
+            "price_type": self.price_type.name,
+            "status": self.status,
+            "old_price": str(self.old_price) if self.old_price is not None else None,
+            "new_price": str(self.new_price) if self.new_price is not None else None,
+            "error": self.error,
+        }
+
+
+@dataclass
+class BulkUpdateReport:
+    """Per-type results of a bulk price update for one category."""
+    category: object
+    results: list = field(default_factory=list)
+
+    def _count(self, *statuses):
+        return sum(1 for result in self.results if result.status in statuses)
+
+    @property
+    def updated_count(self):
+        """Number of prices created or changed (what operators see as "updated")."""
+        return self._count(CREATED, UPDATED)
+
+    @property
+    def error_count(self):
+        return self._count(INVALID)
+
+    @property
+    def changed(self):
+        return [result for result in self.results if result.changed]
+
+    @property
+    def errors(self):
+        return [result for result in self.results if result.status == INVALID]
+
+    def as_dict(self):
+        return {
+            "category": self.category.slug,
+            "updated_count": self.updated_count,
+            "error_count": self.error_count,
+            "results": [result.as_dict() for result in self.results],
+        }
+
+
+def parse_price_fields(data):
+    """
+    Extract ``{price_type_id: raw_value}`` from form data using the
+    ``price_<id>`` field names rendered by ``price_form.html``.
+    """
+    submitted = {}
+    for key, value in data.items():
+        if not key.startswith(PRICE_FIELD_PREFIX):
+            continue
+        try:
+            price_type_id = int(key[len(PRICE_FIELD_PREFIX):])
+        except ValueError:
+            continue
+        submitted[price_type_id] = value
+    return submitted
+
+
+def _parse_price(value):
+    if isinstance(value, str):
+        value = value.strip()
+    try:
+        new_price = Decimal(value)
+    except (InvalidOperation, TypeError):
+        raise ValueError("Invalid number")
+    if not new_price.is_finite():
+        raise ValueError("Price must be a finite number")
+    if new_price <= 0:
+        raise ValueError("Price must be greater than zero")
+    return new_price
+
+
+def bulk_update_prices(category, submitted):
+    """
+    Apply submitted prices for every price type of ``category`` at once.
+
+    ``submitted`` maps price type ids to raw values; empty values are skipped
+    and ids outside the category are ignored. Current prices are fetched in a
+    single query and all changes, together with their history rows, are
+    written with ``bulk_update``/``bulk_create`` in one transaction.
+    """
+    report = BulkUpdateReport(category=category)
+    now = timezone.now()
+
+    with write_transaction():
+        price_types = list(category.price_types.all())
+        current_prices = {
+            price.price_type_id: price
+            for price in Price.objects.filter(price_type__in=price_types, is_current=True)
+        }
+
+        to_update = []
+        to_create = []
+        history = []
+
+        for price_type in price_types:
+            raw_value = submitted.get(price_type.id)
+            if raw_value is None or (isinstance(raw_value, str) and not raw_value.strip()):
+                report.results.append(PriceUpdateResult(price_type, SKIPPED))
+                continue
+
+            try:
+                new_price = _parse_price(raw_value)
+            except ValueError as e:
+                report.results.append(PriceUpdateResult(price_type, INVALID, error=str(e)))
+                continue
+
+            current_price = current_prices.get(price_type.id)
+            if current_price is None:
+                to_create.append(Price(price_type=price_type, price=new_price, is_current=True, created_at=now))
+                history.append(PriceHistory(
+                    price_type=price_type,
+                    new_price=new_price,
+                    changed_at=now,
+                    notes=history_note(None, new_price),
+                ))
+                report.results.append(PriceUpdateResult(price_type, CREATED, new_price=new_price))
+            elif current_price.price != new_price:
+                old_price = current_price.price
+                current_price.price_type = price_type
+                current_price.price = new_price
+                current_price.updated_at = now
+                to_update.append(current_price)
+                history.append(PriceHistory(
+                    price_type=price_type,
+                    old_price=old_price,
+                    new_price=new_price,
+                    change_percentage=change_percentage(old_price, new_price),
+                    changed_at=now,
+                    notes=history_note(old_price, new_price),
+                ))
+                report.results.append(PriceUpdateResult(price_type, UPDATED, old_price=old_price, new_price=new_price))
+            else:
+                report.results.append(PriceUpdateResult(price_type, UNCHANGED, old_price=new_price, new_price=new_price))
+
+        if to_update:
+            Price.objects.bulk_update(to_update, ["price", "updated_at"])
+        if to_create:
+            Price.objects.bulk_create(to_create)
+        if history:
+            PriceHistory.objects.bulk_create(history)
+            price_history_recorded.send(sender=PriceHistory, rows=history)
+
+        changed_prices = to_update + to_create
+        if changed_prices:
+            for price in changed_prices:
+                price.price_type.set_current_price(price)
+            PriceType.objects.bulk_update(
+                [price.price_type for price in changed_prices], PriceType.CURRENT_PRICE_FIELDS
+            )
+            # bulk writes send no model signals, so refresh the board here
+            invalidate_board(rebuild=True)
+
+    return report
+
+
+def rebuild_current_price_pointers(fix=True):
+    """
+    Compare PriceType's denormalized current-price fields with the Price table.
+
+    Returns the list of price types whose pointer was out of date; with
+    ``fix=True`` those pointers are rewritten from the current Price rows.
+    """
+    current_prices = {
+        price.price_type_id: price
+        for price in Price.objects.filter(is_current=True)
+    }
+
+    stale = []
+    for price_type in PriceType.objects.only("id", "name", *PriceType.CURRENT_PRICE_FIELDS):
+        price = current_prices.get(price_type.id)
+        expected = (
+            price.pk if price else None,
+            price.price if price else None,
+            price.updated_at if price else None,
+        )
+        actual = (price_type.current_price_id, price_type.current_price_value, price_type.current_price_updated_at)
+        if expected != actual:
+            price_type.set_current_price(price)
+            stale.append(price_type)
+
+    if fix and stale:
+        with write_transaction():
+            PriceType.objects.bulk_update(stale, PriceType.CURRENT_PRICE_FIELDS, batch_size=500)
+            invalidate_board()
+            invalidate_cross_rates()
+        logger.info(f'Rebuilt current price pointer for {len(stale)} price type(s)')
+
+    return stale
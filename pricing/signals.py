@@ -1,3 +1,74 @@
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .alerts import evaluate_alerts
+from .cache import invalidate_board
+from .candles import apply_history
+from .crossrates import invalidate_cross_rates, update_cross_rates
+from .models import Category, Price, PriceHistory, PriceType, price_history_recorded
+from .stats import record_history
+
+
+@receiver(pre_delete, sender=Price)
+def clear_current_price_pointer(sender, instance, **kwargs):
+    """Clear PriceType's denormalized current price when that Price is deleted"""
+    PriceType.objects.filter(pk=instance.price_type_id, current_price=instance).update(
+        current_price=None, current_price_value=None, current_price_updated_at=None
+    )
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=PriceType)
+@receiver(post_delete, sender=PriceType)
+@receiver(post_save, sender=Price)
+@receiver(post_delete, sender=Price)
+def invalidate_price_board(sender, **kwargs):
+    """Any change to the board's models makes the cached snapshot stale"""
+    invalidate_board()
+
+
+@receiver(price_history_recorded, sender=PriceHistory)
+def update_price_candles(sender, rows, **kwargs):
+    """Roll new history rows into the OHLC candles in the same transaction"""
+    apply_history(rows)
+
+
+@receiver(price_history_recorded, sender=PriceHistory)
+def update_rolling_stats(sender, rows, **kwargs):
+    """Fold new history rows into the 24h/7d rolling stats in the same transaction"""
+    record_history(rows)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=PriceType)
+@receiver(post_delete, sender=PriceType)
+@receiver(post_delete, sender=Price)
+def invalidate_currency_graph(sender, **kwargs):
+    """Edits to categories or price types (or a removed price) change the graph"""
+    invalidate_cross_rates()
+
+
+@receiver(post_save, sender=Price)
+def invalidate_currency_graph_on_retire(sender, instance, **kwargs):
+    """A price saved as no longer current removes its edge from the graph"""
+    if not instance.is_current:
+        invalidate_cross_rates()
+
+
+@receiver(price_history_recorded, sender=PriceHistory)
+def update_derived_rates(sender, rows, **kwargs):
+    """Recompute only the cross rates whose paths use the changed price types"""
+    update_cross_rates({row.price_type_id for row in rows})
+
+
+@receiver(price_history_recorded, sender=PriceHistory)
+def evaluate_price_alerts(sender, rows, **kwargs):
+    """Check the alert rules of the changed types; registered after the rolling stats receiver it reads"""
+    evaluate_alerts(rows)
+
+
 # from django.db.models.signals import pre_save, post_save
 # from django.dispatch import receiver
 # from django.utils import timezone
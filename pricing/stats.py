@@ -0,0 +1,158 @@
+"""
+Rolling 24-hour and 7-day statistics per price type.
+
+``record_history`` folds freshly written PriceHistory rows into each type's
+RollingPriceStats row (called from the ``price_history_recorded`` receiver,
+in the writer's transaction), so readers get min/max/first/last/change/count
+from one joined row instead of scanning history. Folding can only widen a
+window; ``refresh_stats`` recomputes every row from history with grouped
+aggregates so changes that have aged out of a window drop out again. Run it
+periodically with ``manage.py refresh_price_stats``.
+"""
+import datetime
+import logging
+
+from django.db.models import Count, Max, Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .cache import invalidate_board
+from .db import write_transaction
+from .models import PriceHistory, PriceType, RollingPriceStats, change_percentage
+
+logger = logging.getLogger(__name__)
+
+WINDOWS = {
+    "24h": datetime.timedelta(hours=24),
+    "7d": datetime.timedelta(days=7),
+}
+
+STATS_FIELDS = ["last_price", "last_changed_at", "updated_at"] + [
+    f"{name}_{window}" for window in WINDOWS for name in ("first", "min", "max", "change", "count")
+]
+
+
+def _open_window(stats, window, price):
+    """Start an empty window at `price`"""
+    setattr(stats, f"first_{window}", price)
+    setattr(stats, f"min_{window}", price)
+    setattr(stats, f"max_{window}", price)
+    setattr(stats, f"change_{window}", 0 if price is not None else None)
+    setattr(stats, f"count_{window}", 0)
+
+
+def _fold(stats, window, price, opening=None):
+    """Add one change inside `window`; an empty window opens at `opening` (the price it replaced)"""
+    first = getattr(stats, f"first_{window}")
+    if first is None:
+        first = opening if opening is not None else price
+        _open_window(stats, window, first)
+    setattr(stats, f"min_{window}", min(getattr(stats, f"min_{window}"), price))
+    setattr(stats, f"max_{window}", max(getattr(stats, f"max_{window}"), price))
+    setattr(stats, f"count_{window}", getattr(stats, f"count_{window}") + 1)
+    setattr(stats, f"change_{window}", change_percentage(first, price) or 0)
+
+
+def record_history(rows, now=None):
+    """
+    Fold new PriceHistory rows into the rolling stats of their types.
+
+    One query loads the touched stats rows and one upsert writes them back
+    (the caller holds the write lock). Rows older than a window (e.g.
+    imported backfills) do not touch that window.
+    """
+    if not rows:
+        return
+    now = now or timezone.now()
+
+    by_type = {}
+    for row in sorted(rows, key=lambda row: (row.changed_at, row.pk or 0)):
+        by_type.setdefault(row.price_type_id, []).append(row)
+
+    existing = {stats.pk: stats for stats in RollingPriceStats.objects.filter(price_type_id__in=list(by_type))}
+    all_stats = []
+    for price_type_id, type_rows in by_type.items():
+        stats = existing.get(price_type_id)
+        if stats is None:
+            stats = RollingPriceStats(price_type_id=price_type_id)
+            opening = type_rows[0].old_price
+            for window in WINDOWS:
+                _open_window(stats, window, opening)
+
+        for row in type_rows:
+            for window, length in WINDOWS.items():
+                if row.changed_at >= now - length:
+                    _fold(stats, window, row.new_price, opening=row.old_price)
+            if stats.last_changed_at is None or row.changed_at >= stats.last_changed_at:
+                stats.last_price, stats.last_changed_at = row.new_price, row.changed_at
+        stats.updated_at = now
+        all_stats.append(stats)
+
+    RollingPriceStats.objects.bulk_create(
+        all_stats,
+        update_conflicts=True,
+        unique_fields=["price_type"],
+        update_fields=STATS_FIELDS,
+    )
+
+
+def _window_aggregates(since):
+    """``{price_type_id: {open, low, high, count}}`` for changes since `since` (one query)"""
+    window = PriceHistory.objects.filter(changed_at__gte=since)
+    first_change = window.filter(price_type_id=OuterRef("price_type_id")).order_by("changed_at", "id")
+    rows = window.order_by().values("price_type_id").annotate(
+        low=Min("new_price"),
+        high=Max("new_price"),
+        count=Count("id"),
+        open=Coalesce(
+            Subquery(first_change.values("old_price")[:1]),
+            Subquery(first_change.values("new_price")[:1]),
+        ),
+    )
+    return {row["price_type_id"]: row for row in rows}
+
+
+def refresh_stats(now=None):
+    """
+    Recompute every priced type's rolling stats from history and upsert them.
+
+    Costs one query for the current prices, one grouped aggregate per window
+    and one bulk upsert. Returns the number of rows written.
+    """
+    now = now or timezone.now()
+    windows = {window: _window_aggregates(now - length) for window, length in WINDOWS.items()}
+
+    all_stats = []
+    price_types = PriceType.objects.filter(current_price__isnull=False).values_list(
+        "id", "current_price_value", "current_price_updated_at",
+    )
+    for price_type_id, price, updated_at in price_types:
+        stats = RollingPriceStats(
+            price_type_id=price_type_id, last_price=price, last_changed_at=updated_at,
+            updated_at=now, corrected_at=now,
+        )
+        for window, aggregates in windows.items():
+            row = aggregates.get(price_type_id)
+            if row is None:
+                _open_window(stats, window, price)
+                continue
+            opening = row["open"]
+            setattr(stats, f"first_{window}", opening)
+            setattr(stats, f"min_{window}", min(row["low"], opening))
+            setattr(stats, f"max_{window}", max(row["high"], opening))
+            setattr(stats, f"change_{window}", change_percentage(opening, price) or 0)
+            setattr(stats, f"count_{window}", row["count"])
+        all_stats.append(stats)
+
+    with write_transaction():
+        RollingPriceStats.objects.bulk_create(
+            all_stats,
+            batch_size=500,
+            update_conflicts=True,
+            unique_fields=["price_type"],
+            update_fields=STATS_FIELDS + ["corrected_at"],
+        )
+        invalidate_board()
+
+    logger.info(f'Refreshed rolling stats for {len(all_stats)} price type(s)')
+    return len(all_stats)
@@ -0,0 +1,33 @@
+from django import template
+
+from pricing.fragments import cached_fragment
+
+register = template.Library()
+
+
+class FragmentCacheNode(template.Node):
+    def __init__(self, nodelist, name, vary_on):
+        self.nodelist = nodelist
+        self.name = name
+        self.vary_on = vary_on
+
+    def render(self, context):
+        values = [value.resolve(context) for value in self.vary_on]
+        return cached_fragment(self.name.resolve(context), values, lambda: self.nodelist.render(context))
+
+
+@register.tag
+def cachefragment(parser, token):
+    """
+    Cache the enclosed markup per version of the given objects::
+
+        {% cachefragment "price_row" item.price_type item.stats %} ... {% endcachefragment %}
+
+    See pricing.fragments for how versions are derived.
+    """
+    bits = token.split_contents()
+    if len(bits) < 2:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' tag requires a fragment name")
+    nodelist = parser.parse(("endcachefragment",))
+    parser.delete_first_token()
+    return FragmentCacheNode(nodelist, parser.compile_filter(bits[1]), [parser.compile_filter(bit) for bit in bits[2:]])
@@ -1,3 +1,1676 @@
-from django.test import TestCase
+import copy
+import datetime
+import json
+import math
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from decimal import Decimal
+from importlib import import_module
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
+from django.db import connection, connections, transaction
+from django.template import Context, Template, TemplateSyntaxError
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import http_date
+
+from .analytics import numpy_available
+from .benchmarks import BENCHMARK_SETTINGS, measure, percentile, seed
+from .cache import SNAPSHOT_KEY, get_board, get_board_version, get_cache
+from .candles import INTERVALS, apply_history, bucket_start, choose_interval, get_candles, rebuild_candles
+from .crossrates import MATRIX_KEY, CrossRateMatrix, cross_rate, get_cross_rates
+from .db import WriterBusy, _writer, write_transaction, writer_queue_length
+from .events import event_stream
+from .exports import PRICE_HEADER, xlsx_available
+from .fragments import (
+    FLUSH_EVERY, STAT_KEYS as FRAGMENT_STAT_KEYS, _Counters, cached_fragment, fragment_cache_stats, fragment_key,
+    fragment_version,
+)
+from .history import day_range, filter_history, keyset_page, recent_history
+from .jobs import (
+    BACKOFF_BASE, STALE_AFTER, TASKS, backoff, claim, enqueue, execute, heartbeat, purge_jobs, requeue_stale,
+)
+from .models import (
+    AlertEvent, AlertRule, Category, Job, Price, PriceCandle, PriceHistory, PriceType, RollingPriceStats,
+    price_history_recorded,
+)
+from .replica import REPLICA_ALIAS, SYNC_KEY, ReplicaRouter, current_data_only, sync_replica, use_replica
+from .services import bulk_update_prices, rebuild_current_price_pointers
+from .stats import record_history
+
+
+class QueryPlanIndexTests(TestCase):
+    """
+    EXPLAIN QUERY PLAN checks for the hot current-price and history queries
+    on a seeded database: each must be answered from its composite index
+    rather than a table scan or a temporary sort.
+    """
+    PRICE_TYPES = 40
+    PRICES_PER_TYPE = 25
+    HISTORY_PER_TYPE = 100
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        category = Category.objects.create(name="Tether", slug="tether")
+        price_types = PriceType.objects.bulk_create([
+            PriceType(
+                category=category, name=f"Type {i}", action="buy" if i % 2 else "sell",
+                base_currency="Tether", target_currency="Rial",
+            )
+            for i in range(cls.PRICE_TYPES)
+        ])
+        Price.objects.bulk_create([
+            Price(price_type=price_type, price=Decimal(100 + i), is_current=i == 0)
+            for price_type in price_types
+            for i in range(cls.PRICES_PER_TYPE)
+        ])
+        PriceHistory.objects.bulk_create([
+            PriceHistory(
+                price_type=price_type, new_price=Decimal(100 + i),
+                changed_at=now - datetime.timedelta(minutes=i),
+            )
+            for price_type in price_types
+            for i in range(cls.HISTORY_PER_TYPE)
+        ])
+        PriceType.objects.filter(pk__in=[pt.pk for pt in price_types[:5]]).update(current_price_updated_at=now)
+        cls.price_type = price_types[0]
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def assertUsesIndex(self, queryset, *index_names):
+        plan = queryset.explain()
+        self.assertTrue(
+            any(name in plan for name in index_names),
+            f"expected one of {index_names} in query plan:\n{plan}",
+        )
+        self.assertNotIn("USE TEMP B-TREE FOR ORDER BY", plan)
+
+    def test_current_price_lookup(self):
+        # At most one row, so no ordering is needed
+        self.assertUsesIndex(
+            Price.objects.filter(price_type=self.price_type, is_current=True).order_by(),
+            "unique_current_price_per_type",
+        )
+
+    def test_price_type_prices(self):
+        self.assertUsesIndex(self.price_type.prices.all(), "price_type_created_idx")
+
+    def test_latest_prices(self):
+        self.assertUsesIndex(Price.objects.order_by("-created_at")[:20], "price_created_idx")
+
+    def test_price_type_history(self):
+        self.assertUsesIndex(
+            PriceHistory.objects.filter(price_type=self.price_type).order_by("-changed_at")[:50],
+            "history_type_changed_idx",
+        )
+
+    def test_history_keyset_page(self):
+        rows, cursor = keyset_page(PriceHistory.objects.all(), page_size=50)
+        queryset = PriceHistory.objects.order_by("-changed_at", "-id").filter(
+            changed_at__lt=rows[-1].changed_at
+        )[:51]
+        self.assertUsesIndex(queryset, "history_changed_idx")
+
+    def test_history_date_range(self):
+        today = timezone.localdate()
+        queryset = filter_history({"date_from": today, "date_to": today}).order_by("-changed_at", "-id")[:50]
+        self.assertUsesIndex(queryset, "history_changed_idx")
+
+    def test_updated_today_count(self):
+        start, end = day_range(timezone.localdate())
+        self.assertUsesIndex(
+            PriceType.objects.filter(current_price_updated_at__gte=start, current_price_updated_at__lt=end),
+            "pricetype_current_updated_idx",
+        )
+
+
+def make_category(name, size, **fields):
+    """Category `name` with `size` active buy price types (no prices yet)"""
+    category = Category.objects.create(name=name, slug=name.lower(), **fields)
+    PriceType.objects.bulk_create([
+        PriceType(
+            category=category, name=f"{name} {i}", action="buy",
+            base_currency=name, target_currency=f"C{i}",
+        )
+        for i in range(size)
+    ])
+    return category
+
+
+def set_current_price(price_type, value, at=None):
+    """Current Price row and pointer for `price_type` without going through Price.save"""
+    at = at or timezone.now()
+    [price] = Price.objects.bulk_create([Price(price_type=price_type, price=value, is_current=True, created_at=at)])
+    Price.objects.filter(pk=price.pk).update(updated_at=at)  # not auto_now
+    PriceType.objects.filter(pk=price_type.pk).update(
+        current_price=price, current_price_value=value, current_price_updated_at=at,
+    )
+    return price
+
+
+# Per-process caches for tests that read the board, so nothing is written to
+# the file-based pricing cache; cleared per test, as the database is rolled back
+CACHE_ALIASES = ("default", "pricing", "fragments")
+isolated_caches = override_settings(CACHES={
+    alias: {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": f"test-{alias}"}
+    for alias in CACHE_ALIASES
+})
+
+
+def clear_caches():
+    for alias in CACHE_ALIASES:
+        caches[alias].clear()
+
+
+class BulkSavePathTests(TestCase):
+    """
+    The board save path (prices, history, candles, rolling stats, cross
+    rates, alerts) costs a fixed number of queries whatever the board size
+    (up to SQLite's parameter limit, past which inserts are batched), and
+    candles and stats are upserted rather than bulk-updated with CASE.
+    """
+
+    def save_board(self, category, offset):
+        submitted = {
+            price_type.id: str(1000 + offset + i)
+            for i, price_type in enumerate(category.price_types.order_by("id"))
+        }
+        with CaptureQueriesContext(connection) as queries:
+            report = bulk_update_prices(category, submitted)
+        return report, [query["sql"] for query in queries.captured_queries]
+
+    def test_queries_independent_of_board_size(self):
+        counts = {}
+        for name, size in (("Small", 2), ("Large", 30)):
+            category = make_category(name, size)
+            self.save_board(category, 0)  # creates prices, candles and stats
+            report, queries = self.save_board(category, 50)
+            self.assertEqual(report.updated_count, size)
+            counts[size] = len(queries)
+        self.assertEqual(counts[2], counts[30])
+
+    def test_candles_and_stats_are_upserted(self):
+        category = make_category("Tether", 100)
+        self.save_board(category, 0)
+        _, queries = self.save_board(category, 50)
+        for table in ("pricing_pricecandle", "pricing_rollingpricestats"):
+            self.assertFalse([sql for sql in queries if sql.startswith(f'UPDATE "{table}"')])
+            self.assertTrue([sql for sql in queries if sql.startswith(f'INSERT INTO "{table}"') and "ON CONFLICT" in sql])
+
+    def test_update_folds_into_candles_and_stats(self):
+        category = make_category("Tether", 3)
+        self.save_board(category, 0)
+        self.save_board(category, 50)
+
+        price_type = category.price_types.order_by("id").first()
+        candle = PriceCandle.objects.get(price_type=price_type, interval="1m")
+        self.assertEqual(
+            (candle.open, candle.high, candle.low, candle.close, candle.change_count),
+            (Decimal(1000), Decimal(1050), Decimal(1000), Decimal(1050), 2),
+        )
+        self.assertEqual(PriceCandle.objects.filter(price_type=price_type).count(), 3)
+        stats = RollingPriceStats.objects.get(price_type=price_type)
+        self.assertEqual((stats.count_24h, stats.last_price, stats.max_7d), (2, Decimal(1050), Decimal(1050)))
+
+
+class BulkUpdatePricesTests(TestCase):
+    """bulk_update_prices results, and rebuild_current_price_pointers repairs"""
+
+    def setUp(self):
+        self.category = make_category("Tether", 5)
+        self.types = list(self.category.price_types.order_by("id"))
+        set_current_price(self.types[1], Decimal(100))
+        set_current_price(self.types[2], Decimal(200))
+
+    def test_report(self):
+        report = bulk_update_prices(self.category, {
+            self.types[0].id: "50",  # no price yet
+            self.types[1].id: " 110 ",
+            self.types[2].id: "200.00",
+            self.types[3].id: "abc",
+            # types[4] not submitted
+        })
+        self.assertEqual(
+            [(result.status, result.old_price, result.new_price) for result in report.results],
+            [
+                ("created", None, 50), ("updated", 100, 110), ("unchanged", 200, 200),
+                ("invalid", None, None), ("skipped", None, None),
+            ],
+        )
+        self.assertEqual((report.updated_count, report.error_count), (2, 1))
+        self.assertEqual(report.as_dict()["results"][3]["error"], "Invalid number")
+
+        history = PriceHistory.objects.filter(price_type__category=self.category).order_by("price_type_id")
+        self.assertEqual(
+            [(row.price_type_id, row.old_price, row.new_price) for row in history],
+            [(self.types[0].id, None, 50), (self.types[1].id, 100, 110)],
+        )
+        for price_type, value in zip(self.types[:3], (50, 110, 200)):
+            price_type.refresh_from_db()
+            current = Price.objects.get(price_type=price_type, is_current=True)
+            self.assertEqual((current.price, price_type.current_price_id, price_type.current_price_value),
+                             (value, current.pk, value))
+
+    def test_single_transaction(self):
+        with CaptureQueriesContext(connection) as queries:
+            bulk_update_prices(self.category, {price_type.id: "300" for price_type in self.types})
+        savepoints = [query["sql"] for query in queries.captured_queries if query["sql"].startswith("SAVEPOINT")]
+        self.assertEqual(len(savepoints), 1)
+
+        with mock.patch.object(PriceType.objects, "bulk_update", side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                bulk_update_prices(self.category, {price_type.id: "400" for price_type in self.types})
+        # Prices and history were rolled back with the failed pointer update
+        self.assertFalse(Price.objects.filter(price=400).exists())
+        self.assertFalse(PriceHistory.objects.filter(new_price=400).exists())
+
+    def test_unchanged_prices_write_nothing(self):
+        with self.captureOnCommitCallbacks() as callbacks, CaptureQueriesContext(connection) as queries:
+            report = bulk_update_prices(self.category, {self.types[1].id: "100", self.types[2].id: "200"})
+        self.assertEqual(report.updated_count, 0)
+        writes = [query["sql"] for query in queries.captured_queries if query["sql"].startswith(("INSERT", "UPDATE"))]
+        self.assertEqual(writes, [])
+        self.assertFalse(PriceHistory.objects.exists())
+        self.assertEqual(callbacks, [])  # no board invalidation
+
+    def test_rebuild_follows_is_current(self):
+        old = Price.objects.get(price_type=self.types[1], is_current=True)
+        # Flip the current row behind the pointer's back, as a raw UPDATE would
+        Price.objects.filter(pk=old.pk).update(is_current=False)
+        [new] = Price.objects.bulk_create([Price(price_type=self.types[1], price=Decimal(120), is_current=True)])
+        PriceType.objects.filter(pk=self.types[2].pk).update(current_price_value=Decimal(250))
+
+        stale = rebuild_current_price_pointers(fix=False)
+        self.assertEqual(sorted(price_type.id for price_type in stale), [self.types[1].id, self.types[2].id])
+        self.types[1].refresh_from_db()
+        self.assertEqual(self.types[1].current_price_id, old.pk)  # only reported
+
+        rebuild_current_price_pointers()
+        self.types[1].refresh_from_db()
+        self.types[2].refresh_from_db()
+        self.assertEqual((self.types[1].current_price_id, self.types[1].current_price_value), (new.pk, 120))
+        self.assertEqual(self.types[2].current_price_value, 200)
+        self.assertEqual(rebuild_current_price_pointers(), [])
+
+
+@isolated_caches
+class PageQueryTests(TestCase):
+    """
+    The list, history, report and export pages cost a fixed number of
+    queries on a board several pages long (two of them are the session and
+    user lookups), including on the last and past-the-end pages.
+    """
+    CATEGORIES = 30
+    TYPES = 10
+
+    @classmethod
+    def setUpTestData(cls):
+        for n in range(cls.CATEGORIES):
+            category = make_category(f"Cat{n:02}", cls.TYPES)
+            bulk_update_prices(category, {price_type.id: str(100 + n) for price_type in category.price_types.all()})
+        cls.user = get_user_model().objects.create_user("operator", password="operator")
+
+    def setUp(self):
+        clear_caches()
+        self.client.force_login(self.user)
+
+    def get(self, url, queries):
+        with self.assertNumQueries(queries):
+            response = self.client.get(url)
+            if response.streaming:
+                response.content_lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_category_list(self):
+        response = self.get("/pricing/categories/", 7)
+        self.assertEqual(len(response.context["categories"]), 12)
+        self.assertEqual(response.context["total_categories"], self.CATEGORIES)
+        self.assertEqual(response.context["total_price_types"], self.CATEGORIES * self.TYPES)
+        for category in response.context["categories"]:
+            self.assertEqual((len(category.preview_price_types), category.more_price_types), (3, 7))
+
+        # Later pages look the newest category up separately; past the end is the last page
+        for page in ("3", "99"):
+            response = self.get(f"/pricing/categories/?page={page}", 8)
+            self.assertEqual(response.context["page_obj"].number, 3)
+            self.assertEqual(len(response.context["categories"]), 6)
+
+    def test_category_list_empty(self):
+        Category.objects.all().delete()
+        response = self.get("/pricing/categories/", 6)  # no page to fetch after a zero count
+        self.assertEqual(list(response.context["categories"]), [])
+        self.assertEqual(response.context["latest_category_name"], "")
+
+    def test_price_list(self):
+        for url in ("/pricing/prices/", "/pricing/prices/?group=category"):
+            response = self.get(url, 5)
+            self.assertEqual(len(response.context["price_data"]), self.CATEGORIES * self.TYPES)
+            self.assertEqual(response.context["active_prices_count"], self.CATEGORIES * self.TYPES)
+        self.assertEqual(len(response.context["category_groups"]), self.CATEGORIES)
+
+    def test_board_snapshot(self):
+        with CaptureQueriesContext(connection) as built:
+            board = get_board()
+        self.assertEqual(len(board["categories"]), self.CATEGORIES)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_board()["version"], board["version"])
+
+        category = Category.objects.get(slug="cat00")
+        price_type = category.price_types.order_by("id").first()
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk_update_prices(category, {price_type.id: "999"})
+        # The write bumped the version: the next read rebuilds at the same cost
+        with self.assertNumQueries(len(built.captured_queries)):
+            rebuilt = get_board()
+        self.assertGreater(rebuilt["version"], board["version"])
+        prices = {row["id"]: row["price"] for row in rebuilt["categories"][0]["price_types"]}
+        self.assertEqual(prices[price_type.id], 999)
+
+    def test_history_pages(self):
+        seen = []
+        url = "/pricing/history/"
+        while url:
+            response = self.get(url, 6)
+            seen += [row.pk for row in response.context["rows"]]
+            query = response.context["next_page_query"]
+            url = f"/pricing/history/?{query}" if query else None
+        # 300 rows are exactly six full pages: the sixth has no next cursor
+        self.assertEqual(len(seen), self.CATEGORIES * self.TYPES)
+        self.assertEqual(seen, list(PriceHistory.objects.order_by("-changed_at", "-id").values_list("pk", flat=True)))
+
+        tomorrow = timezone.localdate() + datetime.timedelta(days=1)
+        response = self.get(f"/pricing/history/?date_from={tomorrow}", 6)
+        self.assertEqual((list(response.context["rows"]), response.context["next_page_query"]), ([], ""))
+
+    def test_report(self):
+        response = self.get("/pricing/reports/", 5)
+        self.assertEqual(response.context["total_prices"], self.CATEGORIES * self.TYPES)
+        self.assertEqual(len(response.context["category_stats"]), self.CATEGORIES)
+        self.get("/pricing/reports/", 2)  # cached until the next board write
+
+    def test_exports(self):
+        for dataset in ("prices", "history"):
+            response = self.get(f"/pricing/export/?dataset={dataset}", 3)
+            self.assertEqual(len(response.content_lines), 1 + self.CATEGORIES * self.TYPES)
+
+
+@isolated_caches
+class CategoryListTests(TestCase):
+    """category_list cards, previews and stat tiles, at a cost independent of the board"""
+
+    def setUp(self):
+        clear_caches()
+        self.client.force_login(get_user_model().objects.create_user("operator", password="operator"))
+
+    def get(self, page=1):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f"/pricing/categories/?page={page}")
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries.captured_queries)
+
+    def test_cards_and_tiles(self):
+        small = make_category("Small", 2)
+        make_category("Large", 5)
+        newest = make_category("Newest", 0)
+        PriceType.objects.filter(category=small, name="Small 1").update(action="sell")
+
+        response, _ = self.get()
+        cards = {category.name: category for category in response.context["categories"]}
+        self.assertEqual(list(cards), ["Newest", "Large", "Small"])
+        self.assertEqual([price_type.name for price_type in cards["Small"].preview_price_types], ["Small 0", "Small 1"])
+        self.assertEqual([price_type.name for price_type in cards["Large"].preview_price_types], ["Large 0", "Large 1", "Large 2"])
+        self.assertEqual([cards[name].more_price_types for name in ("Newest", "Large", "Small")], [0, 2, 0])
+        self.assertEqual(
+            [response.context[name] for name in (
+                "most_active_category_name", "most_active_category_count", "latest_category_name", "total_price_types",
+            )],
+            ["Large", 5, newest.name, 7],
+        )
+
+    def test_queries_independent_of_board_size(self):
+        make_category("First", 1)
+        counts = [self.get()[1]]
+        for n in range(30):
+            make_category(f"Cat{n:02}", 8)
+        counts += [self.get()[1], self.get(page=2)[1] - 1]  # later pages look up the newest category
+        self.assertEqual(counts, [counts[0]] * 3)
+
+
+@isolated_caches
+class PriceListTests(TestCase):
+    """price_list rows, counters and grouping, at a cost independent of the board"""
+
+    def setUp(self):
+        clear_caches()
+        self.client.force_login(get_user_model().objects.create_user("operator", password="operator"))
+
+    def get(self, query=""):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f"/pricing/prices/{query}")
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries.captured_queries)
+
+    def test_rows_and_counters(self):
+        gold = make_category("Gold", 2)
+        make_category("Empty", 0)
+        priced, unpriced = gold.price_types.order_by("id")
+        set_current_price(priced, Decimal(5000))
+        set_current_price(make_category("Tether", 1).price_types.get(), Decimal(100), at=timezone.now() - datetime.timedelta(days=2))
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk_update_prices(gold, {priced.pk: "5100"})
+
+        response, _ = self.get()
+        rows = {row["price_type"].name: row for row in response.context["price_data"]}
+        self.assertEqual(list(rows), ["Gold 0", "Gold 1", "Tether 0"])
+        self.assertEqual((rows["Gold 0"]["current_price"], rows["Gold 1"]["current_price"]), (5100, "N/A"))
+        self.assertEqual((rows["Gold 0"]["slug"], rows["Gold 0"]["stats"].count_24h), ("gold", 1))
+        self.assertIsNone(rows["Gold 1"]["stats"])
+        self.assertEqual(
+            [response.context[name] for name in ("price_types_count", "active_prices_count", "today_updates_count")],
+            [3, 2, 1],
+        )
+        self.assertIsNone(response.context["category_groups"])
+
+        response, _ = self.get("?group=category")
+        groups = response.context["category_groups"]
+        self.assertEqual([group["category"].name for group in groups], ["Gold", "Tether"])  # empty ones left out
+        self.assertEqual([len(group["rows"]) for group in groups], [2, 1])
+
+    def test_queries_independent_of_board_size(self):
+        make_category("First", 1)
+        counts = [self.get()[1]]
+        for n in range(20):
+            category = make_category(f"Cat{n:02}", 10)
+            bulk_update_prices(category, {price_type.pk: "100" for price_type in category.price_types.all()})
+        counts += [self.get()[1], self.get("?group=category")[1]]
+        self.assertEqual(counts, [counts[0]] * 3)
+
+
+class PriceFormHistoryTests(TestCase):
+    """The price form shows the last few changes per type and pages older ones in as fragments"""
+
+    def setUp(self):
+        self.client.force_login(get_user_model().objects.create_user("operator", password="operator"))
+        self.category = make_category("Gold", 3)
+        self.long, self.exact, self.empty = self.category.price_types.order_by("id")
+        start = timezone.now() - datetime.timedelta(days=1)
+        PriceHistory.objects.bulk_create(
+            # Pairs share a timestamp so paging has to break ties on id
+            [PriceHistory(price_type=self.long, new_price=n, changed_at=start + datetime.timedelta(minutes=n // 2))
+             for n in range(40)]
+            + [PriceHistory(price_type=self.exact, new_price=n, changed_at=start + datetime.timedelta(minutes=n))
+               for n in range(5)]
+        )
+
+    def timeline(self, price_type):
+        return list(price_type.price_history.order_by("-changed_at", "-id").values_list("pk", flat=True))
+
+    def test_recent_history(self):
+        recent = recent_history([self.long.pk, self.exact.pk, self.empty.pk], limit=5)
+        self.assertEqual([row.pk for row in recent[self.long.pk][0]], self.timeline(self.long)[:5])
+        self.assertTrue(recent[self.long.pk][1])
+        self.assertEqual(([row.pk for row in recent[self.exact.pk][0]], recent[self.exact.pk][1]), (self.timeline(self.exact), False))
+        self.assertEqual(recent[self.empty.pk], ([], False))
+
+    def test_form_and_fragment_pages(self):
+        response = self.client.get("/pricing/categories/gold/prices/")
+        price_types = {price_type.pk: price_type for price_type in response.context["price_types"]}
+        self.assertEqual([len(price_types[pk].recent_history) for pk in (self.long.pk, self.exact.pk, self.empty.pk)], [5, 5, 0])
+        self.assertIsNone(price_types[self.exact.pk].history_more_url)
+        self.assertIsNone(price_types[self.empty.pk].history_more_url)
+
+        seen = [row.pk for row in price_types[self.long.pk].recent_history]
+        url, pages = price_types[self.long.pk].history_more_url, []
+        while url:
+            with self.assertNumQueries(4):  # session, user, price type, page
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append(len(response.context["rows"]))
+            seen += [row.pk for row in response.context["rows"]]
+            url = response.context["more_url"]
+        self.assertEqual(pages, [25, 10])
+        self.assertEqual(seen, self.timeline(self.long))
+
+    def test_fragment_bad_cursor_starts_over(self):
+        response = self.client.get(f"/pricing/price-types/{self.exact.pk}/history/?cursor=not-a-cursor")
+        self.assertEqual([row.pk for row in response.context["rows"]], self.timeline(self.exact))
+        self.assertIsNone(response.context["more_url"])
+        self.assertEqual(self.client.get("/pricing/price-types/999999/history/").status_code, 404)
+
+
+@isolated_caches
+class CrossRateTests(TestCase):
+    """Fewest-hop paths over the currency graph, and price changes applied in place"""
+
+    def setUp(self):
+        clear_caches()
+        self.category = Category.objects.create(name="Rates", slug="rates")
+        edges = [
+            ("buy", "Tether", "Rial", 100000),
+            ("buy", "Euro", "Rial", 120000),
+            ("buy", "euro ", "Dollar", Decimal("1.1")),  # same currency key as "Euro"
+            ("buy", "Dollar", "Tether", 1),
+            ("buy", "Gold", "Rial", None),
+            ("sell", "Tether", "Pound", Decimal("0.8")),
+        ]
+        price_types = []
+        for action, base, target, price in edges:
+            price_type = PriceType.objects.create(
+                category=self.category, name=f"{base}/{target}", action=action,
+                base_currency=base, target_currency=target,
+            )
+            if price is not None:
+                set_current_price(price_type, Decimal(price))
+            price_types.append(price_type)
+        self.tether_rial, self.euro_rial, self.euro_dollar, self.dollar_tether, self.gold, self.sell = price_types
+
+    def test_fewest_hops(self):
+        matrix = CrossRateMatrix.build()
+        self.assertEqual(matrix.rate("Tether", "Rial")["rate"], 100000)
+        self.assertEqual(matrix.rate("rial", "TETHER")["rate"], Decimal("0.00001"))
+
+        # Two-hop paths through Rial and through Dollar tie: the lower ids win
+        rate = matrix.rate("Tether", "Euro")
+        self.assertEqual((rate["hops"], rate["rate"]), (2, Decimal("0.833333333333")))
+        self.assertEqual(
+            [(step["price_type"], step["from"], step["to"]) for step in rate["path"]],
+            [(self.tether_rial.pk, "Tether", "Rial"), (self.euro_rial.pk, "Rial", "Euro")],
+        )
+        self.assertEqual(matrix.rate("Dollar", "Rial")["hops"], 2)  # via Tether
+
+        # Unpriced types are not edges, and actions have separate graphs
+        self.assertIsNone(matrix.rate("Gold", "Rial"))
+        self.assertIsNone(matrix.rate("Rial", "Pound"))
+        self.assertEqual(matrix.rate("Pound", "Tether", action="sell")["rate"], Decimal("1.25"))
+        self.assertEqual(set(matrix.table(source="Euro")["Euro"]), {"Rial", "Dollar", "Tether"})
+
+    def test_apply(self):
+        matrix = CrossRateMatrix.build()
+        untouched = matrix.rate("Dollar", "Euro")["rate"]
+        recomputed = matrix.apply({self.euro_rial.pk: Decimal(125000)})
+        self.assertEqual(recomputed, len(matrix.dependents[self.euro_rial.pk]))
+        self.assertEqual(matrix.rate("Tether", "Euro")["rate"], Decimal("0.8"))
+        self.assertEqual(matrix.rate("Dollar", "Euro")["rate"], untouched)
+        self.assertEqual(matrix.apply({self.sell.pk: Decimal("0.5")}), 2)  # Tether <-> Pound only
+
+        # Changes to the graph itself call for a rebuild
+        self.assertIsNone(matrix.apply({self.gold.pk: Decimal(5)}))
+        self.assertIsNone(CrossRateMatrix.build().apply({self.euro_rial.pk: None}))
+
+    def test_price_change_updates_cached_matrix(self):
+        get_cross_rates()
+        with mock.patch.object(CrossRateMatrix, "build") as build:
+            with self.captureOnCommitCallbacks(execute=True):
+                bulk_update_prices(self.category, {self.euro_rial.pk: "125000"})
+            self.assertEqual(cross_rate("Tether", "Euro")["rate"], Decimal("0.8"))
+        build.assert_not_called()
+
+        # A newly priced type adds an edge: the matrix is dropped and rebuilt
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk_update_prices(self.category, {self.gold.pk: "5000000"})
+        self.assertIsNone(get_cache().get(MATRIX_KEY))
+        self.assertEqual(cross_rate("Gold", "Tether")["rate"], 50)
+
+
+@isolated_caches
+class ReplicaRouterTests(SimpleTestCase):
+    """Pricing reads go to the replica only while it is configured, synced and within the lag limit"""
+
+    def setUp(self):
+        clear_caches()
+        databases = mock.patch.dict(settings.DATABASES, {REPLICA_ALIAS: {}})
+        databases.start()
+        self.addCleanup(databases.stop)
+        self.router = ReplicaRouter()
+
+    def synced(self, seconds_ago, behind=False):
+        version = get_board_version() - (1 if behind else 0)
+        get_cache().set(SYNC_KEY, {"at": time.time() - seconds_ago, "version": version}, timeout=None)
+
+    def read_db(self, model=Price):
+        with use_replica() as state:
+            return state, self.router.db_for_read(model)
+
+    def test_current_replica(self):
+        self.synced(3600)  # no write since, however long ago
+        state, db = self.read_db()
+        self.assertEqual((state.current, state.lag, db), (True, 0, REPLICA_ALIAS))
+        self.assertIsNone(self.read_db(get_user_model())[1])  # other apps stay on the primary
+        self.assertEqual(self.router.db_for_write(Price), "default")
+        self.assertIsNone(self.router.db_for_read(Price))  # outside a replica view
+
+    @override_settings(REPLICA_MAX_LAG=30)
+    def test_lag_guard(self):
+        self.synced(10, behind=True)
+        state, db = self.read_db()
+        self.assertEqual((state.current, db), (False, REPLICA_ALIAS))
+        with use_replica():
+            with current_data_only():
+                self.assertIsNone(self.router.db_for_read(Price))  # nothing stale gets cached
+
+        self.synced(60, behind=True)
+        with self.assertLogs("pricing.replica", "INFO"):
+            self.assertEqual(self.read_db(), (None, None))
+
+    def test_not_synced_or_configured(self):
+        self.assertEqual(self.read_db(), (None, None))
+        self.synced(0)
+        del settings.DATABASES[REPLICA_ALIAS]
+        self.assertEqual(self.read_db(), (None, None))
+
+    def test_no_replica_inside_a_transaction(self):
+        self.synced(0)
+        with mock.patch.object(connections["default"], "in_atomic_block", True):
+            self.assertIsNone(self.read_db()[1])
+        self.assertFalse(self.router.allow_migrate(REPLICA_ALIAS, "pricing"))
+        self.assertTrue(self.router.allow_migrate("default", "pricing"))
+
+
+@isolated_caches
+class SyncReplicaTests(TransactionTestCase):
+    """
+    sync_replica copies the primary into a standalone file and records the
+    sync (outside a test transaction, which would keep the backup waiting)
+    """
+
+    def setUp(self):
+        clear_caches()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.path = os.path.join(self.directory, "replica.sqlite3")
+        make_category("Gold", 3)
+
+    def test_sync(self):
+        with open(self.path, "wb") as f:
+            f.write(b"stale copy")
+        result = sync_replica(self.path)
+        self.assertEqual(result["version"], get_board_version())
+        self.assertEqual(result["bytes"], os.path.getsize(self.path))
+        self.assertEqual(os.listdir(self.directory), ["replica.sqlite3"])  # temporary copy swapped in
+
+        replica = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+        self.addCleanup(replica.close)
+        self.assertEqual(replica.execute("PRAGMA journal_mode").fetchone(), ("delete",))
+        self.assertEqual(replica.execute("SELECT count(*) FROM pricing_pricetype").fetchone(), (3,))
+
+        synced = get_cache().get(SYNC_KEY)
+        self.assertEqual(synced["version"], result["version"])
+        self.assertLessEqual(synced["at"], time.time())
+
+    def test_failed_sync_keeps_the_replica(self):
+        with mock.patch("pricing.replica.os.replace", side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                sync_replica(self.path)
+        self.assertEqual(os.listdir(self.directory), [])
+        self.assertIsNone(get_cache().get(SYNC_KEY))
+
+    def test_command_needs_a_replica(self):
+        with self.settings(DATABASE_REPLICA=""):
+            with self.assertRaisesMessage(CommandError, "DATABASE_REPLICA is not set"):
+                call_command("sync_replica")
+        with self.settings(DATABASE_REPLICA=self.path):
+            out = StringIO()
+            call_command("sync_replica", stdout=out)
+        self.assertIn(f"Replica synced at board version {get_board_version()}", out.getvalue())
+        self.assertTrue(os.path.exists(self.path))
+
+
+@isolated_caches
+@override_settings(PRICING_FRAGMENT_CACHE_METRICS=True)
+class FragmentCacheTests(TestCase):
+    """Fragment keys follow object versions, so writes re-render only what they touched"""
+
+    def setUp(self):
+        clear_caches()
+        counters = mock.patch("pricing.fragments._counters", _Counters())
+        counters.start()
+        self.addCleanup(counters.stop)
+        self.category = make_category("Gold", 3)
+        self.price_types = list(self.category.price_types.order_by("id"))
+        for price_type in self.price_types:
+            set_current_price(price_type, Decimal(100))
+
+    def lookups(self):
+        stats = fragment_cache_stats()
+        return stats["hits"], stats["misses"]
+
+    def test_versions(self):
+        price_type = PriceType.objects.get(pk=self.price_types[0].pk)
+        self.assertEqual(
+            fragment_version(price_type),
+            ("pricing.pricetype", price_type.pk, price_type.updated_at, price_type.current_price_updated_at),
+        )
+        self.assertEqual(fragment_version(self.category), ("pricing.category", self.category.pk, self.category.updated_at))
+        self.assertEqual(fragment_version([self.category, 3]), (fragment_version(self.category), 3))
+        self.assertIsNone(fragment_version(None))
+
+        key = fragment_key("price_row", [price_type, None])
+        self.assertEqual(fragment_key("price_row", [PriceType.objects.get(pk=price_type.pk), None]), key)
+        self.assertNotEqual(fragment_key("other_row", [price_type, None]), key)
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk_update_prices(self.category, {price_type.pk: "110"})
+        self.assertNotEqual(fragment_key("price_row", [PriceType.objects.get(pk=price_type.pk), None]), key)
+
+    def test_tag(self):
+        template = Template('{% load pricing_cache %}{% cachefragment "label" price_type %}{{ label }}{% endcachefragment %}')
+        price_type = self.price_types[0]
+        self.assertEqual(template.render(Context({"price_type": price_type, "label": "first"})), "first")
+        # Same version: the cached markup, whatever else the context holds
+        self.assertEqual(template.render(Context({"price_type": price_type, "label": "second"})), "first")
+        price_type.current_price_updated_at = timezone.now()
+        self.assertEqual(template.render(Context({"price_type": price_type, "label": "third"})), "third")
+        self.assertEqual(self.lookups(), (1, 2))
+        with self.assertRaises(TemplateSyntaxError):
+            Template("{% load pricing_cache %}{% cachefragment %}{% endcachefragment %}")
+
+    def test_price_list_rerenders_changed_rows(self):
+        self.client.force_login(get_user_model().objects.create_user("operator", password="operator"))
+        self.client.get("/pricing/prices/")
+        self.assertEqual(self.lookups(), (0, 3))
+        self.client.get("/pricing/prices/")
+        self.assertEqual(self.lookups(), (3, 3))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk_update_prices(self.category, {self.price_types[1].pk: "120"})
+        response = self.client.get("/pricing/prices/")
+        self.assertEqual(self.lookups(), (5, 4))
+        self.assertContains(response, "120")
+
+    def test_metrics_flush_in_batches(self):
+        for _ in range(FLUSH_EVERY - 1):
+            cached_fragment("row", [1], lambda: "markup")
+        self.assertEqual(get_cache().get(FRAGMENT_STAT_KEYS["hits"]), None)
+        cached_fragment("row", [1], lambda: "markup")
+        self.assertEqual(
+            [get_cache().get(FRAGMENT_STAT_KEYS[name]) for name in ("hits", "misses")], [FLUSH_EVERY - 1, 1]
+        )
+        self.assertEqual(fragment_cache_stats()["hit_ratio"], 0.98)
+
+
+class CandleTests(TestCase):
+    """UTC buckets, incremental folding and rebuilds of the OHLC rollups"""
+
+    START = datetime.datetime(2026, 3, 1, 23, 58, 30, tzinfo=datetime.timezone.utc)
+
+    def setUp(self):
+        self.gold, self.silver = make_category("Gold", 2).price_types.order_by("id")
+
+    def record(self, price_type, points):
+        """History rows at START + `seconds` for each (seconds, price), folded in as written"""
+        rows = PriceHistory.objects.bulk_create([
+            PriceHistory(
+                price_type=price_type, new_price=Decimal(price),
+                changed_at=self.START + datetime.timedelta(seconds=seconds),
+            )
+            for seconds, price in points
+        ])
+        apply_history(rows)
+
+    def candles(self, price_type, interval):
+        candles = PriceCandle.objects.filter(price_type=price_type, interval=interval).order_by("bucket_start")
+        return list(candles.values_list("bucket_start", "open", "high", "low", "close", "change_count"))
+
+    def test_bucket_start(self):
+        tehran = datetime.timezone(datetime.timedelta(hours=3, minutes=30))
+        moment = datetime.datetime(2026, 3, 2, 2, 15, 42, 123, tzinfo=tehran)  # 22:45:42 UTC the day before
+        self.assertEqual(
+            [bucket_start(moment, interval) for interval in INTERVALS],
+            [datetime.datetime(2026, 3, 1, 22, 45, tzinfo=datetime.timezone.utc),
+             datetime.datetime(2026, 3, 1, 22, 0, tzinfo=datetime.timezone.utc),
+             datetime.datetime(2026, 3, 1, tzinfo=datetime.timezone.utc)],
+        )
+
+    def test_buckets(self):
+        # 23:58:30, 23:59:10, 23:59:50 and 00:00:20 the next (UTC) day
+        self.record(self.gold, [(0, 100), (40, 130), (80, 90), (110, 120)])
+        minute, hour, day = (
+            datetime.datetime(2026, 3, 1, 23, 58, tzinfo=datetime.timezone.utc),
+            datetime.datetime(2026, 3, 1, 23, tzinfo=datetime.timezone.utc),
+            datetime.datetime(2026, 3, 1, tzinfo=datetime.timezone.utc),
+        )
+        next_day = datetime.datetime(2026, 3, 2, tzinfo=datetime.timezone.utc)
+        self.assertEqual(self.candles(self.gold, "1m"), [
+            (minute, 100, 100, 100, 100, 1),
+            (minute + datetime.timedelta(minutes=1), 130, 130, 90, 90, 2),
+            (next_day, 120, 120, 120, 120, 1),
+        ])
+        for interval, start in (("1h", hour), ("1d", day)):
+            self.assertEqual(
+                self.candles(self.gold, interval), [(start, 100, 130, 90, 90, 3), (next_day, 120, 120, 120, 120, 1)]
+            )
+        self.assertEqual(self.candles(self.silver, "1d"), [])
+
+    def test_late_rows_fold_into_open_and_close(self):
+        self.record(self.gold, [(40, 100), (50, 110)])
+        self.record(self.gold, [(35, 95), (45, 120)])  # written late, observed earlier
+        [(_, *ohlc, count)] = self.candles(self.gold, "1m")
+        self.assertEqual((ohlc, count), ([95, 120, 95, 110], 4))
+
+    def test_rebuild_matches_incremental(self):
+        self.record(self.gold, [(0, 100), (40, 130), (80, 90), (110, 120), (3600, 80)])
+        self.record(self.silver, [(10, 5), (20, 6), (90000, 7)])
+        incremental = {price_type: {interval: self.candles(price_type, interval) for interval in INTERVALS}
+                       for price_type in (self.gold, self.silver)}
+        PriceCandle.objects.filter(price_type=self.silver).delete()
+        PriceCandle.objects.filter(price_type=self.gold, interval="1h").update(close=1)
+
+        with self.assertLogs("pricing.candles", "INFO"):
+            written = rebuild_candles(batch_size=2)  # flushes mid-stream
+        self.assertEqual(written, PriceCandle.objects.count())
+        self.assertEqual(
+            {price_type: {interval: self.candles(price_type, interval) for interval in INTERVALS}
+             for price_type in (self.gold, self.silver)},
+            incremental,
+        )
+
+        # Limited to some types, the others are left alone
+        PriceCandle.objects.filter(price_type=self.gold).update(close=1)
+        self.assertEqual(rebuild_candles([self.silver.pk]), 6)  # two buckets per interval
+        self.assertEqual(set(PriceCandle.objects.filter(price_type=self.gold).values_list("close", flat=True)), {1})
+
+    def test_get_candles_picks_the_rollup(self):
+        self.record(self.gold, [(0, 100), (40, 130), (3600, 80)])
+        end = self.START + datetime.timedelta(hours=2)
+        self.assertEqual(choose_interval(self.START, end), "1m")
+        self.assertEqual(choose_interval(self.START, self.START + datetime.timedelta(days=20)), "1h")
+        self.assertEqual(choose_interval(self.START, self.START + datetime.timedelta(days=3650)), "1d")
+
+        interval, candles = get_candles(self.gold.pk, self.START, end, max_points=5)
+        self.assertEqual((interval, [candle.close for candle in candles]), ("1h", [130, 80]))
+        # The bucket containing `start` is included
+        interval, candles = get_candles(self.gold.pk, self.START + datetime.timedelta(seconds=20), end)
+        self.assertEqual((interval, len(candles)), ("1m", 3))
+
+
+class RollingStatsTests(TestCase):
+    """
+    24h/7d stats: folded in as history is written, and recomputed by
+    refresh_price_stats so changes that left a window drop out again.
+    """
+
+    def setUp(self):
+        self.now = timezone.now()
+        self.price_type = make_category("Tether", 1).price_types.get()
+
+    def history(self, old, new, ago):
+        return PriceHistory.objects.create(
+            price_type=self.price_type, old_price=old, new_price=new, changed_at=self.now - ago,
+        )
+
+    def stats(self, window):
+        stats = RollingPriceStats.objects.get(price_type=self.price_type)
+        return tuple(getattr(stats, f"{name}_{window}") for name in ("first", "min", "max", "change", "count"))
+
+    def test_written_history_is_folded_in(self):
+        rows = [
+            self.history(None, Decimal(100), datetime.timedelta(days=3)),  # 7d only
+            self.history(Decimal(100), Decimal(80), datetime.timedelta(hours=2)),
+            self.history(Decimal(80), Decimal(120), datetime.timedelta(hours=1)),
+        ]
+        for row in rows:
+            price_history_recorded.send(sender=PriceHistory, rows=[row])
+
+        # The 24h window opens at the price its first change replaced
+        self.assertEqual(self.stats("24h"), (100, 80, 120, 20, 2))
+        self.assertEqual(self.stats("7d"), (100, 80, 120, 20, 3))
+        stats = RollingPriceStats.objects.get(price_type=self.price_type)
+        self.assertEqual((stats.last_price, stats.last_changed_at), (120, rows[-1].changed_at))
+
+    def test_rows_older_than_a_window_skip_it(self):
+        row = self.history(Decimal(90), Decimal(100), datetime.timedelta(days=2))
+        price_history_recorded.send(sender=PriceHistory, rows=[row])
+        self.assertEqual(self.stats("24h"), (90, 90, 90, 0, 0))
+        self.assertEqual(self.stats("7d"), (90, 90, 100, Decimal("11.1111"), 1))
+
+    def test_correction_drops_aged_out_changes(self):
+        set_current_price(self.price_type, Decimal(120), at=self.now - datetime.timedelta(days=2))
+        rows = [
+            self.history(Decimal(100), Decimal(80), datetime.timedelta(days=2, hours=2)),
+            self.history(Decimal(80), Decimal(120), datetime.timedelta(days=2)),
+        ]
+        # Folded when they were written, two days ago: both in both windows
+        record_history(rows, now=self.now - datetime.timedelta(days=2))
+        self.assertEqual(self.stats("24h"), (100, 80, 120, 20, 2))
+
+        call_command("refresh_price_stats", stdout=StringIO())
+        # Nothing changed in the last 24h: the window holds the current price only
+        self.assertEqual(self.stats("24h"), (120, 120, 120, 0, 0))
+        self.assertEqual(self.stats("7d"), (100, 80, 120, 20, 2))
+        stats = RollingPriceStats.objects.get(price_type=self.price_type)
+        self.assertEqual(stats.last_price, 120)
+        self.assertIsNotNone(stats.corrected_at)
+
+    def test_correction_matches_incremental_fold(self):
+        set_current_price(self.price_type, Decimal(120), at=self.now - datetime.timedelta(hours=1))
+        rows = [
+            self.history(None, Decimal(100), datetime.timedelta(days=3)),
+            self.history(Decimal(100), Decimal(80), datetime.timedelta(hours=2)),
+            self.history(Decimal(80), Decimal(120), datetime.timedelta(hours=1)),
+        ]
+        price_history_recorded.send(sender=PriceHistory, rows=rows)
+        folded = (self.stats("24h"), self.stats("7d"))
+
+        call_command("refresh_price_stats", stdout=StringIO())
+        self.assertEqual((self.stats("24h"), self.stats("7d")), folded)
+
+
+@isolated_caches
+class FeedTests(TestCase):
+    """
+    Public JSON feeds: no login, validators taken from the board version so
+    conditional requests are answered without building the body.
+    """
+
+    def setUp(self):
+        clear_caches()
+        self.category = make_category("Tether", 2)
+        for i, price_type in enumerate(self.category.price_types.order_by("id")):
+            set_current_price(price_type, Decimal(100 + i))
+
+    def age_board(self):
+        """Backdate the cached snapshot, as if it had been built a minute ago"""
+        board = get_board()
+        board["generated_at"] -= datetime.timedelta(minutes=1)
+        get_cache().set(SNAPSHOT_KEY.format(version=board["version"]), board)
+        return http_date(board["generated_at"].timestamp())
+
+    def test_anonymous_access(self):
+        for url in ("/pricing/feed/", "/pricing/feed/tether/"):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertEqual(response["Content-Type"], "application/json")
+            self.assertIn("public", response["Cache-Control"])
+        self.assertEqual(response.json()["category"]["slug"], "tether")
+        self.assertEqual(len(response.json()["category"]["prices"]), 2)
+
+    def test_if_none_match(self):
+        response = self.client.get("/pricing/feed/")
+        etag = response["ETag"]
+        self.assertFalse(etag.startswith("W/"))
+        self.assertNotEqual(etag, self.client.get("/pricing/feed/tether/")["ETag"])
+
+        with mock.patch("pricing.views._feed_category") as feed_category:
+            response = self.client.get("/pricing/feed/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+        self.assertEqual(response["ETag"], etag)
+        feed_category.assert_not_called()
+
+    def test_if_modified_since(self):
+        last_modified = self.client.get("/pricing/feed/tether/")["Last-Modified"]
+        response = self.client.get("/pricing/feed/tether/", HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_unknown_category(self):
+        response = self.client.get("/pricing/feed/missing/")
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {"error": "Category not found"})
+
+    def test_price_update_changes_etag(self):
+        etag = self.client.get("/pricing/feed/")["ETag"]
+        price_type = self.category.price_types.order_by("id").first()
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk_update_prices(self.category, {price_type.id: "150"})
+
+        response = self.client.get("/pricing/feed/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        prices = response.json()["categories"][0]["prices"]
+        self.assertEqual(Decimal(prices[0]["price"]), 150)
+
+    def test_rename_is_modified(self):
+        last_modified = self.age_board()
+        response = self.client.get("/pricing/feed/tether/", HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.name = "USDT"
+            self.category.save()
+        response = self.client.get("/pricing/feed/tether/", HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["category"]["name"], "USDT")
+
+
+@skipUnless(numpy_available(), "analytics require numpy")
+@isolated_caches
+class PriceAnalyticsTests(TestCase):
+    """price_analytics on a known series of daily closes"""
+    CLOSES = [100, 110, 99, 121]
+
+    def setUp(self):
+        clear_caches()
+        self.price_type = make_category("Tether", 1).price_types.get()
+        today = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=datetime.timezone.utc)
+        rows = []
+        for day, close in enumerate(self.CLOSES):
+            day_start = today - datetime.timedelta(days=len(self.CLOSES) - day)
+            # Two changes a day: only the later one is the day's close
+            rows += [
+                PriceHistory(price_type=self.price_type, new_price=close + 5, changed_at=day_start + datetime.timedelta(hours=6)),
+                PriceHistory(price_type=self.price_type, new_price=close, changed_at=day_start + datetime.timedelta(hours=18)),
+            ]
+        PriceHistory.objects.bulk_create(rows)
+
+    def analytics(self, *args):
+        out = StringIO()
+        call_command("price_analytics", "--json", "--price-type", str(self.price_type.pk), *args, stdout=out)
+        return json.loads(out.getvalue())["metrics"][str(self.price_type.pk)]
+
+    def test_metrics(self):
+        metrics = self.analytics("--window", "2", "--window", "4", "--window", "5")
+        self.assertEqual((metrics["changes"], metrics["days"], metrics["last"]), (8, 4, 121))
+        self.assertEqual(metrics["moving_averages"], {"2": 110, "4": 107.5, "5": None})
+        self.assertAlmostEqual(metrics["max_drawdown"], -0.1)
+
+        returns = [math.log(b / a) for a, b in zip(self.CLOSES, self.CLOSES[1:])]
+        mean = sum(returns) / len(returns)
+        expected = math.sqrt(sum((r - mean) ** 2 for r in returns) / (len(returns) - 1))
+        self.assertAlmostEqual(metrics["volatility"], expected, places=6)
+        self.assertAlmostEqual(metrics["volatility_annualized"], expected * math.sqrt(365), places=5)
+
+    def test_window_must_be_positive(self):
+        for window in ("0", "-3"):
+            with self.assertRaisesMessage(CommandError, "--window must be at least 1"):
+                self.analytics("--window", window)
+
+
+@isolated_caches
+class PriceAlertTests(TestCase):
+    """Edge-triggered rules, cooldowns, and one delivery job per transaction"""
+
+    def setUp(self):
+        clear_caches()
+        self.category = make_category("Tether", 2)
+        self.types = list(self.category.price_types.order_by("id"))
+        for price_type in self.types:
+            set_current_price(price_type, Decimal(100))
+        self.rule = AlertRule.objects.create(price_type=self.types[0], kind="above", threshold=Decimal(110))
+
+    def save(self, *prices):
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk_update_prices(self.category, {
+                price_type.id: str(price) for price_type, price in zip(self.types, prices) if price is not None
+            })
+
+    def deliver(self):
+        """Run the queued jobs; returns the alerts of each delivery job"""
+        jobs = claim(10)
+        for job in jobs:
+            execute(job)
+        return [job.payload["alerts"] for job in jobs if job.task == "pricing.deliver_alerts"]
+
+    def test_fires_on_crossing_only(self):
+        self.save(105)
+        self.assertEqual(self.deliver(), [])
+        self.save(115)
+        [[alert]] = self.deliver()
+        self.assertEqual((alert["rule_id"], Decimal(alert["price"])), (self.rule.pk, 115))
+        self.save(120)  # still above: no new crossing
+        self.assertEqual(self.deliver(), [])
+
+        event = AlertEvent.objects.get()
+        self.rule.refresh_from_db()
+        self.assertEqual((event.price, self.rule.last_fired_at), (115, event.fired_at))
+        self.assertIsNotNone(event.delivered_at)
+
+    def test_cooldown(self):
+        self.save(115)
+        self.deliver()
+        self.save(100)
+        self.save(115)  # crossed again within the cooldown
+        self.assertEqual(self.deliver(), [])
+
+        AlertRule.objects.filter(pk=self.rule.pk).update(
+            last_fired_at=timezone.now() - datetime.timedelta(minutes=self.rule.cooldown_minutes + 1)
+        )
+        self.save(100)
+        self.save(115)
+        self.assertEqual(len(self.deliver()), 1)
+        self.assertEqual(AlertEvent.objects.count(), 2)
+
+    def test_crossings_queued_before_delivery_fire_once(self):
+        # Both crossings are queued before the first delivery sets last_fired_at
+        self.save(115)
+        self.save(100)
+        self.save(115)
+        self.assertEqual(len(self.deliver()), 2)
+        self.assertEqual(AlertEvent.objects.count(), 1)
+
+    def test_one_job_per_transaction(self):
+        AlertRule.objects.create(price_type=self.types[1], kind="below", threshold=Decimal(90))
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                bulk_update_prices(self.category, {self.types[0].id: "115"})
+                try:
+                    with transaction.atomic():
+                        bulk_update_prices(self.category, {self.types[1].id: "85"})
+                        raise RuntimeError
+                except RuntimeError:
+                    pass
+                bulk_update_prices(self.category, {self.types[1].id: "80"})
+                self.assertFalse(Job.objects.exists())  # queued on commit only
+
+        [alerts] = self.deliver()
+        self.assertEqual([Decimal(alert["price"]) for alert in alerts], [115, 80])
+
+
+class JobQueueTests(TestCase):
+    """Claiming, retries with backoff, heartbeats, stale requeue and purge"""
+
+    def setUp(self):
+        self.calls = []
+        tasks = mock.patch.dict(TASKS, {"tests.record": self.record_task, "tests.fail": self.fail_task})
+        tasks.start()
+        self.addCleanup(tasks.stop)
+
+    def record_task(self, **payload):
+        self.calls.append(payload)
+
+    def fail_task(self, **payload):
+        raise RuntimeError("boom")
+
+    def queue(self, name, payload=None, **fields):
+        with self.captureOnCommitCallbacks(execute=True):
+            return enqueue(name, payload, **fields)
+
+    def test_enqueue_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            enqueue("tests.record", {"x": 1})
+            self.assertFalse(Job.objects.exists())
+        self.assertEqual(Job.objects.get().status, Job.PENDING)
+        with self.assertRaises(ValueError):
+            enqueue("tests.unknown")
+
+    def test_claim(self):
+        first = self.queue("tests.record", {"x": 1})
+        later = self.queue("tests.record", delay=60)
+        [job] = claim(10, "a")
+        self.assertEqual((job.pk, job.status, job.attempts), (first.pk, Job.RUNNING, 1))
+        self.assertIsNotNone(job.heartbeat_at)
+        self.assertEqual(claim(10, "b"), [])  # taken, and the other one is not due
+        self.assertEqual(Job.objects.get(pk=later.pk).status, Job.PENDING)
+
+        execute(job)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.DONE)
+        self.assertIsNotNone(job.finished_at)
+        self.assertEqual(self.calls, [{"x": 1}])
+
+    def test_retry_with_backoff(self):
+        self.queue("tests.fail", max_attempts=2)
+        [job] = claim(1)
+        before = timezone.now()
+        execute(job)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.locked_by), (Job.PENDING, ""))
+        self.assertIn("RuntimeError: boom", job.last_error)
+        delay = (job.run_at - before).total_seconds()
+        self.assertTrue(BACKOFF_BASE * 0.8 <= delay <= BACKOFF_BASE * 1.2 + 1, delay)
+
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        [job] = claim(1)
+        execute(job)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+
+    def test_backoff_is_capped(self):
+        self.assertLessEqual(backoff(1), BACKOFF_BASE * 1.2)
+        self.assertGreater(backoff(3), BACKOFF_BASE * 2)
+        self.assertLessEqual(backoff(50), 600 * 1.2)
+
+    def test_requeue_uses_heartbeat(self):
+        self.queue("tests.record")
+        self.queue("tests.record")
+        long_running, dead = claim(2)
+        long_ago = timezone.now() - STALE_AFTER * 3
+        Job.objects.update(started_at=long_ago, heartbeat_at=long_ago)
+        heartbeat([long_running])  # its worker is still alive
+
+        self.assertEqual(requeue_stale(), 1)
+        self.assertEqual(Job.objects.get(pk=long_running.pk).status, Job.RUNNING)
+        dead.refresh_from_db()
+        self.assertEqual((dead.status, dead.locked_by), (Job.PENDING, ""))
+
+        # The requeued job is claimed again; the old worker's result is ignored
+        [again] = claim(1)
+        execute(dead)
+        self.assertEqual(Job.objects.get(pk=again.pk).status, Job.RUNNING)
+
+    def test_purge(self):
+        old = timezone.now() - datetime.timedelta(days=10)
+        for status, finished_at in ((Job.DONE, old), (Job.FAILED, old), (Job.DONE, timezone.now())):
+            Job.objects.create(task="tests.record", status=status, finished_at=finished_at)
+        self.assertEqual(purge_jobs(7), 1)
+        self.assertEqual(
+            sorted(Job.objects.values_list("status", flat=True)), [Job.DONE, Job.FAILED],
+        )
+
+
+@override_settings(PRICING_SSE_REPLAY_LIMIT=3, PRICING_SSE_POLL_INTERVAL=0.01)
+class PriceStreamTests(TestCase):
+    """SSE replay after Last-Event-ID, the reset past the replay limit, and WSGI refusal"""
+
+    def setUp(self):
+        self.price_type = make_category("Tether", 1).price_types.get()
+        self.rows = PriceHistory.objects.bulk_create([
+            PriceHistory(price_type=self.price_type, new_price=Decimal(100 + i)) for i in range(5)
+        ])
+
+    async def read(self, count, last_event_id):
+        stream = event_stream(last_event_id=last_event_id)
+        try:
+            return [await anext(stream) for _ in range(count)]
+        finally:
+            await stream.aclose()
+
+    async def test_replay(self):
+        messages = await self.read(4, self.rows[1].pk)
+        self.assertEqual(messages[0], "retry: 5000\n\n")
+        self.assertEqual(
+            [message.split("\n")[:2] for message in messages[1:]],
+            [[f"id: {row.pk}", "event: price"] for row in self.rows[2:]],
+        )
+        self.assertIn('"price":"104.0000"', messages[-1])
+
+    async def test_reset_past_replay_limit(self):
+        _, reset = await self.read(2, self.rows[0].pk)
+        self.assertEqual(reset, f'id: {self.rows[-1].pk}\nevent: reset\ndata: {{"feed":"/pricing/feed/"}}\n\n')
+
+    def test_refused_under_wsgi(self):
+        response = self.client.get("/pricing/stream/")  # anonymous: exempt from login
+        self.assertEqual(response.status_code, 501)
+        self.assertEqual(response.json(), {"error": "The price stream requires the ASGI server."})
+
+
+class ExportTests(TestCase):
+    """CSV and XLSX exports of current prices and filtered history"""
+
+    def setUp(self):
+        self.client.force_login(get_user_model().objects.create_user("operator", password="operator"))
+        for name, value in (("Tether", 100), ("Gold", 5000)):
+            price_type = make_category(name, 1).price_types.get()
+            set_current_price(price_type, Decimal(value))
+            PriceHistory.objects.create(price_type=price_type, new_price=Decimal(value))
+        PriceHistory.objects.filter(new_price=5000).update(changed_at=timezone.now() - datetime.timedelta(days=3))
+
+    def csv(self, query):
+        response = self.client.get(f"/pricing/export/?{query}")
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        self.assertRegex(response["Content-Disposition"], r'^attachment; filename="\w+-\d{8}-\d{4}\.csv"$')
+        content = b"".join(response.streaming_content).decode()
+        self.assertTrue(content.startswith("\ufeff"))
+        return [line.split(",") for line in content[1:].splitlines()]
+
+    def test_prices_csv(self):
+        header, *rows = self.csv("dataset=prices")
+        self.assertEqual(header, PRICE_HEADER)
+        self.assertEqual([(row[1], row[7]) for row in rows], [("gold", "5000.0000"), ("tether", "100.0000")])
+
+    def test_history_csv_filters(self):
+        self.assertEqual([row[3] for row in self.csv("dataset=history")[1:]], ["gold", "tether"])  # oldest first
+        self.assertEqual([row[3] for row in self.csv("dataset=history&category=gold")[1:]], ["gold"])
+        today = timezone.localdate()
+        self.assertEqual([row[3] for row in self.csv(f"dataset=history&date_from={today}")[1:]], ["tether"])
+
+    @skipUnless(xlsx_available(), "XLSX export requires openpyxl")
+    def test_prices_xlsx(self):
+        import openpyxl
+
+        response = self.client.get("/pricing/export/?dataset=prices&format=xlsx")
+        self.assertIn("attachment;", response["Content-Disposition"])
+        workbook = openpyxl.load_workbook(BytesIO(b"".join(response.streaming_content)), read_only=True)
+        header, *rows = workbook["Prices"].iter_rows(values_only=True)
+        self.assertEqual(list(header), PRICE_HEADER)
+        self.assertEqual([(row[1], Decimal(str(row[7]))) for row in rows], [("gold", 5000), ("tether", 100)])
+
+
+class ImportTests(TestCase):
+    """import_prices: validation, dry runs, current prices and failed chunks"""
+
+    def setUp(self):
+        self.price_type = make_category("Tether", 1).price_types.get()
+        set_current_price(self.price_type, Decimal(90), at=datetime.datetime(2025, 12, 1, tzinfo=datetime.timezone.utc))
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.dir = directory.name
+
+    def write(self, name, text):
+        path = os.path.join(self.dir, name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        return path
+
+    def run_import(self, path, *args):
+        out = StringIO()
+        call_command("import_prices", path, *args, stdout=out)
+        return out.getvalue()
+
+    def csv_file(self):
+        return self.write("prices.csv", (
+            "category_slug,price_type,price,changed_at\n"
+            "tether,Tether 0,100,2026-01-02T10:00:00\n"
+            "tether,Tether 0,-5,2026-01-02T11:00:00\n"
+            "tether,Missing,100,\n"
+            "tether,Tether 0,110,2026-01-03T10:00:00\n"
+            "tether,Tether 0,105,2026-01-01T10:00:00\n"
+        ))
+
+    def test_import(self):
+        output = self.run_import(self.csv_file())
+        self.assertIn("Row 2: price must be greater than zero", output)
+        self.assertIn("Row 3: unknown price type", output)
+        self.assertIn("3 of 5 row(s) imported, 2 error(s), 1 current price(s) updated", output)
+
+        history = PriceHistory.objects.order_by("id")
+        self.assertEqual([(row.old_price, row.new_price) for row in history], [(90, 100), (100, 110), (110, 105)])
+        # The newest observation wins, whatever the file order
+        self.price_type.refresh_from_db()
+        self.assertEqual(self.price_type.current_price_value, 110)
+        self.assertEqual(self.price_type.current_price_updated_at, datetime.datetime(2026, 1, 3, 10, tzinfo=datetime.timezone.utc))
+
+    def test_dry_run_writes_nothing(self):
+        output = self.run_import(self.csv_file(), "--dry-run")
+        self.assertIn("[dry run] 3 of 5 row(s) imported, 2 error(s), 0 current price(s) updated", output)
+        self.assertFalse(PriceHistory.objects.exists())
+        self.price_type.refresh_from_db()
+        self.assertEqual(self.price_type.current_price_value, 90)
+
+    def test_jsonl_errors(self):
+        path = self.write("prices.jsonl", (
+            f'{{"price_type_id": {self.price_type.pk}, "price": "120"}}\n'
+            "{not json\n"
+            '["a list"]\n'
+            '{"category": "tether", "price_type": "Tether 0", "price": "1", "at": "2026-02-30T00:00:00"}\n'
+        ))
+        output = self.run_import(path, "--history-only")
+        self.assertIn("Row 2: invalid JSON", output)
+        self.assertIn("Row 3: record is not an object", output)
+        self.assertIn("Row 4: invalid timestamp", output)
+        self.assertEqual(PriceHistory.objects.get().new_price, 120)
+        self.price_type.refresh_from_db()
+        self.assertEqual(self.price_type.current_price_value, 90)  # history only
+
+    def test_failed_chunk_is_rolled_back(self):
+        bulk_create = PriceHistory.objects.bulk_create
+        chunks = iter([bulk_create, mock.Mock(side_effect=RuntimeError("disk full"))])
+        with mock.patch.object(PriceHistory.objects, "bulk_create", side_effect=lambda rows: next(chunks)(rows)):
+            with self.assertRaisesMessage(RuntimeError, "disk full"):
+                self.run_import(self.csv_file(), "--chunk-size", "2")
+        # The first chunk was committed on its own; the failed one left nothing
+        # behind and current prices were not touched
+        self.assertEqual(list(PriceHistory.objects.order_by("id").values_list("new_price", flat=True)), [100, 110])
+        self.price_type.refresh_from_db()
+        self.assertEqual(self.price_type.current_price_value, 90)
+
+    def test_exported_history_imports(self):
+        self.run_import(self.csv_file())
+        path = os.path.join(self.dir, "history.csv")
+        call_command("export_prices", "history", "--output", path, stdout=StringIO())
+        PriceHistory.objects.all().delete()
+
+        self.assertIn("3 of 3 row(s) imported, 0 error(s)", self.run_import(path))
+        self.assertEqual(
+            list(PriceHistory.objects.order_by("changed_at").values_list("old_price", "new_price")),
+            [(110, 105), (90, 100), (100, 110)],
+        )
+
+
+@override_settings(**BENCHMARK_SETTINGS)
+class BenchmarkTests(TestCase):
+    """benchmark_views building blocks (the command itself needs its own test database)"""
+
+    def test_percentile(self):
+        values = [5, 1, 4, 2, 3]
+        self.assertEqual([percentile(values, pct) for pct in (1, 50, 95, 100)], [1, 3, 5, 5])
+
+    def test_seed(self):
+        # Price.save records one more change per type for the current price
+        self.assertEqual(seed(categories=2, types_per_category=3, history_per_type=4, batch_size=5),
+                         {"categories": 2, "price_types": 6, "history": 6 * 5})
+        for price_type in PriceType.objects.all():
+            *seeded, current = price_type.price_history.order_by("changed_at")
+            self.assertEqual([row.old_price for row in seeded[1:]], [row.new_price for row in seeded[:-1]])
+            self.assertEqual(price_type.current_price_value, current.new_price)
+            self.assertEqual(current.new_price, seeded[-1].new_price)
+
+    def test_measure(self):
+        seed(categories=2, types_per_category=2, history_per_type=2)
+        self.client.force_login(get_user_model().objects.create_user("operator", password="operator"))
+        result = measure(self.client, "get", "/pricing/prices/", iterations=3)
+        self.assertEqual((result["status"], result["runs"], result["queries"]), (200, 3, 5))
+        self.assertTrue(result["p50_ms"] <= result["p95_ms"] <= result["max_ms"])
+
+    def test_command_rejects_bad_sizes(self):
+        for args in (["--categories", "0"], ["--iterations", "0"], ["--history", "-1"]):
+            with self.assertRaisesMessage(CommandError, "Seed sizes and --iterations must be positive"):
+                call_command("benchmark_views", *args, stdout=StringIO())
+
+
+class SQLiteConcurrencyTests(SimpleTestCase):
+    """
+    Parallel readers and writers on a temporary SQLite file configured like
+    production: SQLITE_PRAGMAS, IMMEDIATE transactions and the serialized
+    writer.
+    """
+    alias = "concurrency"
+    WRITERS = 6
+    WRITES_PER_WRITER = 20
+    READERS = 4
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.directory = tempfile.TemporaryDirectory()
+        databases = connections.configure_settings({
+            **copy.deepcopy(settings.DATABASES),
+            cls.alias: {
+                "ENGINE": "django.db.backends.sqlite3",
+                "NAME": os.path.join(cls.directory.name, "db.sqlite3"),
+                "OPTIONS": {"transaction_mode": "IMMEDIATE"},
+            },
+        })
+        connections.settings[cls.alias] = databases[cls.alias]
+        # The test runner does not know this alias, so it is only allowed
+        # (including from threads) once registered
+        cls.databases = {*cls.databases, cls.alias}
+        # As migrated databases are (pricing 0011)
+        with connections[cls.alias].cursor() as cursor:
+            cursor.execute("PRAGMA journal_mode = WAL")
+
+    @classmethod
+    def tearDownClass(cls):
+        connections[cls.alias].close()
+        del connections[cls.alias]
+        del connections.settings[cls.alias]
+        cls.directory.cleanup()
+        super().tearDownClass()
+
+    def setUp(self):
+        with connections[self.alias].cursor() as cursor:
+            cursor.execute("DROP TABLE IF EXISTS ticks")
+            cursor.execute("CREATE TABLE ticks (id INTEGER PRIMARY KEY, writer INTEGER, n INTEGER)")
+
+    def count(self):
+        with connections[self.alias].cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM ticks")
+            return cursor.fetchone()[0]
+
+    def insert(self, writer, n):
+        with connections[self.alias].cursor() as cursor:
+            cursor.execute("INSERT INTO ticks (writer, n) VALUES (%s, %s)", [writer, n])
+
+    def in_thread(self, target, *args):
+        """Start `target` in a thread that closes its own connection"""
+        def run():
+            try:
+                target(*args)
+            finally:
+                connections[self.alias].close()
+        thread = threading.Thread(target=run)
+        thread.start()
+        return thread
+
+    def hold_writer(self, held, release):
+        with write_transaction(using=self.alias):
+            self.insert(0, 0)
+            held.set()
+            release.wait(5)
+
+    def test_pragmas_applied(self):
+        with connections[self.alias].cursor() as cursor:
+            cursor.execute("PRAGMA journal_mode")
+            self.assertEqual(cursor.fetchone()[0], "wal")
+            cursor.execute("PRAGMA synchronous")
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+            cursor.execute("PRAGMA busy_timeout")
+            self.assertEqual(cursor.fetchone()[0], settings.SQLITE_PRAGMAS["busy_timeout"])
+
+    def connect(self, name):
+        """New connection to `name` (a file in the temporary directory, or a URI), configured like the others"""
+        if not name.startswith("file:"):
+            name = os.path.join(self.directory.name, name)
+        settings_dict = {**connections.settings[self.alias], "NAME": name}
+        connection = connections[self.alias].__class__(settings_dict, alias="fresh")
+        self.addCleanup(connection.close)
+        return connection
+
+    def pragma(self, connection, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f"PRAGMA {name}")
+            return cursor.fetchone()[0]
+
+    def test_connection_keeps_journal_mode(self):
+        # Opening a connection must not rewrite the database file
+        fresh = self.connect("fresh.sqlite3")
+        self.assertEqual(self.pragma(fresh, "journal_mode"), "delete")
+        self.assertEqual(self.pragma(fresh, "synchronous"), 1)
+
+    def test_wal_migration(self):
+        migration = import_module("pricing.migrations.0011_sqlite_wal")
+        self.assertFalse(migration.Migration.atomic)  # journal_mode cannot change in a transaction
+        fresh = self.connect("migrated.sqlite3")
+        self.assertEqual(self.pragma(fresh, "journal_mode"), "delete")
+        migration.enable_wal(None, mock.Mock(connection=fresh))
+        self.assertEqual(self.pragma(fresh, "journal_mode"), "wal")
+        # Stored in the file: later connections open it in WAL mode
+        self.assertEqual(self.pragma(self.connect("migrated.sqlite3"), "journal_mode"), "wal")
+
+        memory = self.connect("file:wal-check?mode=memory")
+        migration.enable_wal(None, mock.Mock(connection=memory))
+        self.assertEqual(self.pragma(memory, "journal_mode"), "memory")
+        other = mock.Mock(vendor="postgresql")
+        migration.enable_wal(None, mock.Mock(connection=other))
+        other.cursor.assert_not_called()
+
+    def test_read_only_connection_skips_write_pragmas(self):
+        path = connections.settings[self.alias]["NAME"]
+        read_only = self.connect(f"file:{path}?mode=ro")
+        self.assertEqual(self.pragma(read_only, "synchronous"), 2)  # SQLite's default, FULL
+        self.assertEqual(self.pragma(read_only, "busy_timeout"), settings.SQLITE_PRAGMAS["busy_timeout"])
+        self.assertEqual(self.pragma(read_only, "journal_mode"), "wal")
+
+    def test_parallel_readers_and_writers(self):
+        errors = []
+        reads = []
+        writing_done = threading.Event()
+
+        def writer(number):
+            try:
+                for n in range(self.WRITES_PER_WRITER):
+                    with write_transaction(using=self.alias):
+                        self.insert(number, n)
+            except Exception as e:
+                errors.append(e)
+
+        def reader():
+            try:
+                counts = []
+                while not writing_done.is_set():
+                    counts.append(self.count())
+                reads.append(counts)
+            except Exception as e:
+                errors.append(e)
+
+        readers = [self.in_thread(reader) for _ in range(self.READERS)]
+        writers = [self.in_thread(writer, number) for number in range(self.WRITERS)]
+        for thread in writers:
+            thread.join(30)
+        writing_done.set()
+        for thread in readers:
+            thread.join(30)
+
+        self.assertEqual(errors, [])
+        self.assertEqual(self.count(), self.WRITERS * self.WRITES_PER_WRITER)
+        self.assertEqual(len(reads), self.READERS)
+        for counts in reads:
+            self.assertTrue(counts)
+            self.assertEqual(counts, sorted(counts))  # committed rows only ever grow
+
+    def test_readers_do_not_wait_for_writer(self):
+        held, release = threading.Event(), threading.Event()
+        holder = self.in_thread(self.hold_writer, held, release)
+        try:
+            self.assertTrue(held.wait(5))
+            started = time.monotonic()
+            self.assertEqual(self.count(), 0)  # the uncommitted row is invisible
+            self.assertLess(time.monotonic() - started, 1)
+        finally:
+            release.set()
+            holder.join(10)
+        self.assertEqual(self.count(), 1)
+
+    def test_commit_hooks_run_after_writer_release(self):
+        held = []
+        with write_transaction(using=self.alias):
+            self.insert(0, 0)
+            transaction.on_commit(lambda: held.append(_writer(self.alias).lock.locked()), using=self.alias)
+        self.assertEqual(held, [False])
+
+        with self.assertRaises(ZeroDivisionError):
+            with write_transaction(using=self.alias):
+                1 / 0
+        self.assertFalse(_writer(self.alias).lock.locked())
+
+    @override_settings(PRICING_WRITE_QUEUE_SIZE=1, PRICING_WRITE_TIMEOUT=5)
+    def test_writer_queue_is_bounded(self):
+        held, release = threading.Event(), threading.Event()
+        holder = self.in_thread(self.hold_writer, held, release)
+        queued = self.in_thread(lambda: self.hold_writer(threading.Event(), release))
+        try:
+            self.assertTrue(held.wait(5))
+            deadline = time.monotonic() + 5
+            while writer_queue_length(self.alias) < 1 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            with self.assertRaises(WriterBusy):
+                with write_transaction(using=self.alias):
+                    pass
+        finally:
+            release.set()
+            holder.join(10)
+            queued.join(10)
+        self.assertEqual(self.count(), 2)
+
+    @override_settings(PRICING_WRITE_TIMEOUT=0.1)
+    def test_writer_wait_times_out(self):
+        held, release = threading.Event(), threading.Event()
+        holder = self.in_thread(self.hold_writer, held, release)
+        try:
+            self.assertTrue(held.wait(5))
+            with self.assertRaises(WriterBusy):
+                with write_transaction(using=self.alias):
+                    pass
+        finally:
+            release.set()
+            holder.join(10)
@@ -13,5 +13,25 @@ urlpatterns = [
     # Price views
     path('prices/', views.price_list, name='price_list'),
     path('categories/<slug:category_slug>/prices/', views.category_prices_form, name='category_prices_form'),
+    path('history/', views.price_history, name='price_history'),
+    path('reports/', views.report, name='report'),
+    path('export/', views.export, name='export'),
+    path('price-types/<int:pk>/candles/', views.price_type_candles, name='price_type_candles'),
+    path('price-types/<int:pk>/history/', views.price_type_history, name='price_type_history'),
     # path('categories/<slug:category_slug>/prices/<int:price_id>/edit/', views.price_form, name='edit_price'),
+
+    # Public JSON feed and SSE stream (exempt from login, see users.middlewares)
+    path('feed/', views.price_feed, name='price_feed'),
+    path('feed/<slug:category_slug>/', views.category_price_feed, name='category_price_feed'),
+    path('stream/', views.price_stream, name='price_stream'),
+
+    # Analytics over the price history (needs numpy)
+    path('analytics/', views.price_analytics, name='price_analytics'),
+
+    # Derived cross rates over the currency graph
+    path('cross-rates/', views.cross_rates, name='cross_rates'),
+
+    # Price board cache
+    path('board/cache-stats/', views.board_cache_status, name='board_cache_status'),
+    path('jobs/stats/', views.job_queue_status, name='job_queue_status'),
 ]
@@ -3,16 +3,40 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.urls import reverse
 from django.contrib import messages
-from django.http import JsonResponse
+from django.http import FileResponse, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.dateparse import parse_datetime
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
 from django.db import transaction
+from django.db.models import Count, Prefetch, Q, prefetch_related_objects
 from django.utils import timezone
 from django.core.exceptions import ValidationError
-from decimal import Decimal, InvalidOperation
 import datetime
+import json
 import logging
 
+from .cache import board_cache_stats, get_board, get_category_board
+from .analytics import DEFAULT_DAYS, get_analytics, numpy_available
+from .candles import INTERVALS, get_candles
+from .crossrates import get_cross_rates
+from .db import WriterBusy
+from .events import event_stream
+from .exports import DATASETS, csv_lines, export_rows, xlsx_available, xlsx_file
+from .fragments import fragment_cache_stats
+from .jobs import queue_stats
+from .history import (
+    day_range, encode_cursor, filter_history, history_counts, keyset_page, parse_history_filters, recent_history,
+)
+from .replica import replica_view
+from .reports import get_report
 from .forms import CategoryForm, PriceTypeFormSet
-from .models import Category, PriceType, Price
+from .models import Category, PriceType
+from .services import bulk_update_prices, parse_price_fields
 
 logger = logging.getLogger(__name__)
 
@@ -120,41 +144,47 @@ def edit_category(request, pk):
     }
     return render(request, 'pricing/category_form.html', context)
 
+CATEGORY_PAGE_SIZE = 12
+CATEGORY_PREVIEW_TYPES = 3
+
 @login_required
 def category_list(request):
-    categories = Category.objects.prefetch_related(
-        'price_types', 'price_types__prices'
-    ).order_by('-created_at').all()
-
-    # Calculate total price types
-    total_price_types = 0
-    most_active_category_count = 0
-    most_active_category_name = ""
-    latest_category_count = 0
-    latest_category_name = ""
-
-    if categories:
-        # Calculate total price types
-        for category in categories:
-            total_price_types += category.price_types.count()
-
-        # Find most active category (category with most price types)
-        most_active_category = max(categories, key=lambda cat: cat.price_types.count())
-        most_active_category_count = most_active_category.price_types.count()
-        most_active_category_name = most_active_category.name
-
-        # Latest category (first in the ordered list)
-        latest_category = categories[0]
-        latest_category_count = latest_category.price_types.count()
-        latest_category_name = latest_category.name
+    """
+    Category cards with a preview of their first price types.
+
+    The query plan is bounded by the page size: counts come from SQL
+    aggregates, and each card gets at most CATEGORY_PREVIEW_TYPES price
+    types whose current price is read from the denormalized pointer.
+    """
+    categories = Category.objects.annotate(
+        price_type_count=Count('price_types')
+    ).order_by('-created_at', '-pk')
+
+    preview_types = PriceType.objects.only(
+        'id', 'category_id', 'name', 'action', 'base_currency', 'target_currency', 'current_price_value',
+        'updated_at', 'current_price_updated_at',
+    ).order_by('action', 'name')[:CATEGORY_PREVIEW_TYPES]
+    page = Paginator(categories, CATEGORY_PAGE_SIZE).get_page(request.GET.get('page'))
+    page.object_list = list(page.object_list)
+    prefetch_related_objects(
+        page.object_list, Prefetch('price_types', queryset=preview_types, to_attr='preview_price_types')
+    )
+    for category in page.object_list:
+        category.more_price_types = max(category.price_type_count - CATEGORY_PREVIEW_TYPES, 0)
+
+    # Stat tiles: latest category is the first row, most active is one ordered query
+    latest_category = page.object_list[0] if page.number == 1 and page.object_list else categories.first()
+    most_active_category = categories.order_by('-price_type_count', 'name').first()
 
     context = {
-        'categories': categories,
-        'total_price_types': total_price_types,
-        'most_active_category_count': most_active_category_count,
-        'most_active_category_name': most_active_category_name,
-        'latest_category_count': latest_category_count,
-        'latest_category_name': latest_category_name,
+        'categories': page.object_list,
+        'page_obj': page,
+        'total_categories': page.paginator.count,
+        'total_price_types': PriceType.objects.count(),
+        'most_active_category_count': most_active_category.price_type_count if most_active_category else 0,
+        'most_active_category_name': most_active_category.name if most_active_category else "",
+        'latest_category_count': latest_category.price_type_count if latest_category else 0,
+        'latest_category_name': latest_category.name if latest_category else "",
     }
     return render(request, 'pricing/category_list.html', context)
 
@@ -207,87 +237,413 @@ def edit_category(request, pk):
 
 @login_required
 def price_list(request):
-    price_types = PriceType.objects.select_related('category').prefetch_related('prices')
-    price_data = []
+    """
+    All price types with their current price, in a fixed number of queries:
+    one for the rows, one for the annotated categories and one aggregate for
+    the counters. ``?group=category`` renders the table grouped by category.
+    """
+    price_types = list(
+        PriceType.objects.select_related('category', 'rolling_stats').order_by('category__name', 'action', 'name')
+    )
+    categories = list(Category.objects.annotate(price_type_count=Count('price_types')).order_by('name'))
 
+    today_start, tomorrow_start = day_range(timezone.localdate())
+    counters = PriceType.objects.aggregate(
+        total=Count('id'),
+        active=Count('id', filter=Q(current_price__isnull=False)),
+        today=Count('id', filter=Q(
+            current_price_updated_at__gte=today_start, current_price_updated_at__lt=tomorrow_start
+        )),
+    )
+
+    price_data = []
+    rows_by_category = {category.pk: [] for category in categories}
     for pt in price_types:
-        current_price_obj = pt.prices.filter(is_current=True).first()
-        price_data.append({
+        has_price = pt.current_price_id is not None
+        item = {
             'category': pt.category,
             'price_type': pt,
-            'current_price': current_price_obj.price if current_price_obj else 'N/A',
-            'last_updated': current_price_obj.updated_at if current_price_obj else None,
+            'current_price': pt.current_price_value if has_price else 'N/A',
+            'last_updated': pt.current_price_updated_at,
+            'stats': getattr(pt, 'rolling_stats', None),
             'slug': pt.category.slug  # اضافه کردن slug
-        })
+        }
+        price_data.append(item)
+        rows_by_category[pt.category_id].append(item)
 
+    group_by_category = request.GET.get('group') == 'category'
     context = {
         'price_data': price_data,
-        'price_types': price_types,
-        'categories': set(pt.category for pt in price_types),
-        'active_prices_count': sum(1 for pt in price_types if pt.prices.filter(is_current=True).exists()),
-        'today_updates_count': sum(
-            1 for pt in price_types if pt.prices.filter(is_current=True, updated_at__date=datetime.date.today()).exists()
-        ),
+        'price_types_count': counters['total'],
+        'categories': categories,
+        'category_groups': [
+            {'category': category, 'rows': rows_by_category[category.pk]}
+            for category in categories if rows_by_category[category.pk]
+        ] if group_by_category else None,
+        'group_by_category': group_by_category,
+        'active_prices_count': counters['active'],
+        'today_updates_count': counters['today'],
+        'board_cache_stats': board_cache_stats(),
     }
 
     return render(request, 'pricing/price_list.html', context)
 
+PRICE_FORM_HISTORY_ROWS = 5
+HISTORY_FRAGMENT_PAGE_SIZE = 25
+
 @login_required
 def category_prices_form(request, category_slug):
     category = get_object_or_404(Category, slug=category_slug)
 
     if request.method == "POST":
-        updated_count = 0
-        error_count = 0
-        
         try:
-            with transaction.atomic():
-                for price_type in category.price_types.all():
-                    price_field = f'price_{price_type.id}'
-                    new_price_value = request.POST.get(price_field)
-                    
-                    if new_price_value:
-                        try:
-                            new_price = Decimal(new_price_value.strip())
-                            if new_price <= 0:
-                                raise ValueError("Price must be greater than zero")
-                                
-                            current_price_obj = price_type.get_current_price_object()
-                            
-                            # اگر قیمت تغییر کرده یا قیمت جاری وجود ندارد
-                            if current_price_obj is None or new_price != current_price_obj.price:
-                                # ایجاد یا به‌روزرسانی قیمت از طریق مدل
-                                if current_price_obj:
-                                    # به‌روزرسانی قیمت موجود
-                                    current_price_obj.price = new_price
-                                    current_price_obj.save()
-                                else:
-                                    # ایجاد قیمت جدید
-                                    Price.objects.create(
-                                        price_type=price_type,
-                                        price=new_price,
-                                        is_current=True
-                                    )
-                                updated_count += 1
-                        except (ValueError, TypeError, InvalidOperation) as e:
-                            error_count += 1
-                            messages.error(request, f"Invalid price for {price_type.name}: {str(e)}")
-                            logger.warning(f'Invalid price input for {price_type.name}: {new_price_value}')
-                
-                if updated_count > 0:
-                    messages.success(request, f"Successfully updated {updated_count} price(s)!")
-                    logger.info(f'Updated {updated_count} prices for category {category.name} by user {request.user.username}')
-                
-                if error_count > 0:
-                    messages.warning(request, f"{error_count} price(s) had errors and were not updated.")
-                    
+            report = bulk_update_prices(category, parse_price_fields(request.POST))
+
+            for result in report.errors:
+                messages.error(request, f"Invalid price for {result.price_type.name}: {result.error}")
+                logger.warning(f'Invalid price input for {result.price_type.name}: {request.POST.get(f"price_{result.price_type.id}")}')
+
+            if report.updated_count > 0:
+                messages.success(request, f"Successfully updated {report.updated_count} price(s)!")
+                logger.info(f'Updated {report.updated_count} prices for category {category.name} by user {request.user.username}')
+
+            if report.error_count > 0:
+                messages.warning(request, f"{report.error_count} price(s) had errors and were not updated.")
+
+        except WriterBusy as e:
+            messages.error(request, "The server is busy saving other prices, please submit again.")
+            logger.warning(f'Price update for category {category_slug} rejected: {str(e)}')
         except Exception as e:
             messages.error(request, "An error occurred while updating prices.")
             logger.error(f'Error updating prices for category {category_slug}: {str(e)}')
         
         return redirect("pricing:price_list")
 
+    # Only the last few changes per type are rendered; older ones are loaded
+    # on demand from price_type_history
+    price_types = list(category.price_types.order_by("action", "name"))
+    recent = recent_history([price_type.pk for price_type in price_types], limit=PRICE_FORM_HISTORY_ROWS)
+    for price_type in price_types:
+        price_type.recent_history, has_more = recent[price_type.pk]
+        price_type.history_more_url = (
+            f'{reverse("pricing:price_type_history", args=[price_type.pk])}'
+            f'?cursor={encode_cursor(price_type.recent_history[-1])}'
+        ) if has_more else None
+
     context = {
         "category": category,
+        "price_types": price_types,
+    }
+    return render(request, "pricing/price_form.html", context)
+
+@login_required
+@require_safe
+@replica_view
+def price_type_history(request, pk):
+    """
+    One page of a price type's history as table rows (HTML fragment), newest
+    first after ``cursor``; the last row links to the next page.
+    """
+    price_type = get_object_or_404(PriceType.objects.only("id"), pk=pk)
+    rows, next_cursor = keyset_page(
+        price_type.price_history.all(), request.GET.get("cursor"), page_size=HISTORY_FRAGMENT_PAGE_SIZE
+    )
+    context = {
+        "rows": rows,
+        "more_url": f'{reverse("pricing:price_type_history", args=[pk])}?cursor={next_cursor}' if next_cursor else None,
+    }
+    return render(request, "pricing/partials/history_rows.html", context)
+
+@login_required
+@replica_view
+def price_history(request):
+    """
+    Price change log with server-side filters and keyset pagination.
+    """
+    filters = parse_history_filters(request.GET)
+    history = filter_history(filters).select_related('price_type__category')
+    rows, next_cursor = keyset_page(history, request.GET.get('cursor'), page_size=50)
+
+    # Counters follow the category/type/action filters but not the date range
+    counts = history_counts(filter_history({**filters, 'date_from': None, 'date_to': None}))
+
+    query = request.GET.copy()
+    query.pop('cursor', None)
+    first_page_query = query.urlencode()
+    if next_cursor:
+        query['cursor'] = next_cursor
+
+    context = {
+        'rows': rows,
+        'counts': counts,
+        'filters': filters,
+        'categories': Category.objects.order_by('name').values('slug', 'name'),
+        'price_types': PriceType.objects.select_related('category').only(
+            'id', 'name', 'category__name'
+        ).order_by('category__name', 'name'),
+        'next_page_query': query.urlencode() if next_cursor else '',
+        'first_page_query': first_page_query,
+        'is_first_page': not request.GET.get('cursor'),
     }
-    return render(request, "pricing/price_form.html", context)
\ No newline at end of file
+    return render(request, 'pricing/price_history.html', context)
+
+@login_required
+@replica_view
+def export(request):
+    """
+    Stream current prices (``dataset=prices``) or price history
+    (``dataset=history``, with the same filters as the history page) as CSV
+    or, when openpyxl is installed, XLSX.
+    """
+    dataset = request.GET.get('dataset', 'prices')
+    if dataset not in DATASETS:
+        dataset = 'prices'
+    file_format = request.GET.get('format', 'csv')
+    filters = parse_history_filters(request.GET)
+    filename = f"{dataset}-{timezone.now():%Y%m%d-%H%M}"
+
+    logger.info(f'{dataset} export ({file_format}) requested by user {request.user.username}')
+
+    if file_format == 'xlsx':
+        if not xlsx_available():
+            messages.error(request, 'XLSX export is not available on this server, please use CSV.')
+            return redirect('pricing:price_list')
+        return FileResponse(
+            xlsx_file(export_rows(dataset, filters), title=dataset.title()),
+            as_attachment=True,
+            filename=f"{filename}.xlsx",
+            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        )
+
+    response = StreamingHttpResponse(csv_lines(export_rows(dataset, filters)), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{filename}.csv"'
+    return response
+
+@login_required
+@replica_view
+def report(request):
+    """Aggregated pricing statistics (cached until the next price write)"""
+    return render(request, 'pricing/report.html', get_report())
+
+@login_required
+def board_cache_status(request):
+    """Hit/miss/rebuild counters of the shared price board cache and the template fragment cache"""
+    return JsonResponse({**board_cache_stats(), 'fragments': fragment_cache_stats()})
+
+@login_required
+def job_queue_status(request):
+    """Depth, latency and failure counts of the background job queue"""
+    return JsonResponse(queue_stats())
+
+ANALYTICS_MAX_PRICE_TYPES = 50
+
+@login_required
+@require_safe
+@replica_view
+def price_analytics(request):
+    """
+    Volatility, moving averages, max drawdown and correlations as JSON for
+    the repeated ``price_type`` ids (default: every active priced type, up
+    to ANALYTICS_MAX_PRICE_TYPES) over the last ``days`` days.
+    """
+    if not numpy_available():
+        return JsonResponse({'error': 'Analytics require the numpy package'}, status=503)
+
+    try:
+        price_type_ids = [int(value) for value in request.GET.getlist('price_type')]
+        days = max(2, min(int(request.GET.get('days', DEFAULT_DAYS)), 3650))
+    except ValueError:
+        return JsonResponse({'error': 'price_type and days must be integers'}, status=400)
+    if not price_type_ids:
+        price_type_ids = list(PriceType.objects.filter(
+            is_active=True, current_price__isnull=False
+        ).order_by('id').values_list('id', flat=True)[:ANALYTICS_MAX_PRICE_TYPES])
+
+    return JsonResponse(get_analytics(price_type_ids[:ANALYTICS_MAX_PRICE_TYPES], days=days), encoder=DjangoJSONEncoder)
+
+@login_required
+@require_safe
+def cross_rates(request):
+    """
+    Derived cross rates as JSON.
+
+    ``?from=X&to=Y`` returns one rate with the path it was derived along,
+    ``?from=X`` every rate from X, and no currency the whole matrix.
+    ``action`` (buy or sell, default buy) selects the graph.
+    """
+    action = request.GET.get('action', 'buy')
+    if action not in dict(PriceType.ACTION_CHOICES):
+        return JsonResponse({'error': 'action must be buy or sell'}, status=400)
+
+    matrix = get_cross_rates()
+    source, target = request.GET.get('from'), request.GET.get('to')
+    if source and target:
+        rate = matrix.rate(source, target, action)
+        if rate is None:
+            return JsonResponse({'error': f'No rate from {source} to {target}'}, status=404)
+        return JsonResponse(rate, encoder=DjangoJSONEncoder)
+
+    return JsonResponse({
+        'action': action,
+        'currencies': sorted(matrix.currencies.values()),
+        'rates': matrix.table(action, source),
+    }, encoder=DjangoJSONEncoder)
+
+
+def _feed_category(category):
+    return {
+        "name": category["name"],
+        "slug": category["slug"],
+        "description": category["description"],
+        "prices": [
+            {
+                "id": price_type["id"],
+                "name": price_type["name"],
+                "action": price_type["action"],
+                "base_currency": price_type["base_currency"],
+                "target_currency": price_type["target_currency"],
+                "price": price_type["price"],
+                "updated_at": price_type["updated_at"],
+                "low_24h": price_type["low_24h"],
+                "high_24h": price_type["high_24h"],
+                "change_24h": price_type["change_24h"],
+                "change_7d": price_type["change_7d"],
+            }
+            for price_type in category["price_types"]
+        ],
+    }
+
+
+FEED_SCHEMA = "v2"  # part of the feed ETag; change it when the feed body changes shape
+
+
+def _feed_response(request, board, scope, payload):
+    """
+    Answer a feed request from the board snapshot. ETag and Last-Modified
+    come from the snapshot's version and build time, which change on every
+    board write (prices, renames, deactivations), so a conditional request
+    is answered with 304 without serializing anything; `payload` is only
+    called to build a full response.
+    """
+    generated_at = int(board["generated_at"].timestamp())
+    etag = f'"{FEED_SCHEMA}-{scope}-{board["version"]}-{generated_at}"'
+
+    response = get_conditional_response(request, etag=etag, last_modified=generated_at)
+    if response is None:
+        body = json.dumps(payload(), cls=DjangoJSONEncoder, ensure_ascii=False, separators=(",", ":"))
+        response = HttpResponse(body, content_type="application/json")
+
+    response.headers["ETag"] = etag
+    response.headers["Last-Modified"] = http_date(generated_at)
+    patch_cache_control(response, public=True, max_age=getattr(settings, "PRICING_FEED_MAX_AGE", 10))
+    return response
+
+
+@require_safe
+@replica_view
+def price_feed(request):
+    """Public read-only JSON feed of the current price board"""
+    board = get_board()
+    return _feed_response(request, board, "board", lambda: {
+        "last_modified": board["last_modified"],
+        "categories": [_feed_category(category) for category in board["categories"]],
+    })
+
+
+@require_safe
+@replica_view
+def category_price_feed(request, category_slug):
+    """Public read-only JSON feed of a single category's current prices"""
+    board = get_board()
+    category = get_category_board(category_slug, board)
+    if category is None:
+        return JsonResponse({"error": "Category not found"}, status=404)
+
+    def payload():
+        last_modified = max(
+            (price_type["updated_at"] for price_type in category["price_types"] if price_type["updated_at"]),
+            default=None,
+        )
+        return {"last_modified": last_modified, "category": _feed_category(category)}
+
+    return _feed_response(request, board, category_slug, payload)
+
+
+@require_safe
+async def price_stream(request):
+    """
+    Server-Sent Events stream of price changes.
+
+    Optional ``?category=<slug>`` (repeatable) limits the stream to those
+    categories; ``Last-Event-ID`` (or ``?last_event_id=``) resumes after a
+    reconnect.
+    """
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({"error": "The price stream requires the ASGI server."}, status=501)
+
+    category_ids = None
+    slugs = request.GET.getlist("category")
+    if slugs:
+        category_ids = [pk async for pk in Category.objects.filter(slug__in=slugs).values_list("pk", flat=True)]
+        if len(category_ids) != len(set(slugs)):
+            return JsonResponse({"error": "Category not found"}, status=404)
+
+    last_event_id = request.headers.get("Last-Event-ID") or request.GET.get("last_event_id")
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+
+    response = StreamingHttpResponse(
+        event_stream(category_ids, last_event_id), content_type="text/event-stream"
+    )
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+@login_required
+@replica_view
+def price_type_candles(request, pk):
+    """
+    OHLC candles for one price type as JSON.
+
+    Accepts ISO ``start``/``end`` (default: the last 24 hours), ``max_points``
+    and an optional explicit ``interval``; otherwise the smallest rollup that
+    fits ``max_points`` is used.
+    """
+    price_type = get_object_or_404(PriceType, pk=pk)
+    try:
+        end = parse_datetime(request.GET.get("end", "")) or timezone.now()
+        start = parse_datetime(request.GET.get("start", "")) or end - datetime.timedelta(days=1)
+    except ValueError:  # well formed but out of range, e.g. T25:00
+        return JsonResponse({"error": "Invalid start or end, use ISO 8601 date-times"}, status=400)
+    if timezone.is_naive(start):
+        start = timezone.make_aware(start)
+    if timezone.is_naive(end):
+        end = timezone.make_aware(end)
+
+    interval = request.GET.get("interval")
+    if interval and interval not in INTERVALS:
+        return JsonResponse({"error": f"Unknown interval, use one of {', '.join(INTERVALS)}"}, status=400)
+    try:
+        max_points = max(1, min(int(request.GET.get("max_points", 500)), 5000))
+    except ValueError:
+        max_points = 500
+
+    interval, candles = get_candles(price_type.pk, start, end, max_points=max_points, interval=interval)
+    return JsonResponse({
+        "price_type": price_type.pk,
+        "interval": interval,
+        "candles": [
+            {
+                "t": candle["bucket_start"],
+                "o": candle["open"],
+                "h": candle["high"],
+                "l": candle["low"],
+                "c": candle["close"],
+                "n": candle["change_count"],
+            }
+            for candle in candles.values("bucket_start", "open", "high", "low", "close", "change_count")
+        ],
+    })
@@ -1,7 +1,22 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from contextvars import ContextVar
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
 from django.shortcuts import redirect
 from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed, SuspiciousFileOperation
+from django.db import connections
+from django.db.backends.signals import connection_created
 from django.urls import reverse
+from django.utils._os import safe_join
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+import json
 import logging
+import mimetypes
+import os
+import random
+import re
+import time
 
 logger = logging.getLogger(__name__)
 
@@ -18,24 +33,312 @@ class LoginRequiredMiddleware:
         '/static/',
         '/media/',
         '/favicon.ico',
+        '/pricing/feed/',
+        '/pricing/stream/',
     ]
+
+    # Works in both stacks so async views (the price stream) stay async under ASGI
+    sync_capable = True
+    async_capable = True
     
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
 
     def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
         # Skip middleware for exempt URLs
-        if any(request.path.startswith(url) for url in self.EXEMPT_URLS):
+        if self._is_exempt(request):
             return self.get_response(request)
-        
+
+        return self._check_user(request, request.user) or self.get_response(request)
+
+    async def __acall__(self, request):
+        if self._is_exempt(request):
+            return await self.get_response(request)
+
+        return self._check_user(request, await request.auser()) or await self.get_response(request)
+
+    def _is_exempt(self, request):
+        return any(request.path.startswith(url) for url in self.EXEMPT_URLS)
+
+    def _check_user(self, request, user):
+        """Return a redirect for anonymous or inactive users, None otherwise"""
         # Check if user is authenticated
-        if not request.user.is_authenticated:
+        if not user.is_authenticated:
             logger.warning(f'Unauthenticated access attempt to: {request.path}')
             return redirect(settings.LOGIN_URL + f'?next={request.path}')
         
         # Check if user is active (optional additional security)
-        if not request.user.is_active:
-            logger.warning(f'Inactive user access attempt: {request.user.username}')
+        if not user.is_active:
+            logger.warning(f'Inactive user access attempt: {user.username}')
             return redirect(settings.LOGIN_URL)
-        
+
+        return None
+
+
+class QueryRecorder:
+    """
+    Database execute wrapper collecting per-request SQL statistics.
+
+    Only a counter, a timer and a dict increment run per query; statements
+    are grouped by their raw parameterized SQL and normalized into shapes
+    only when a report is built.
+    """
+
+    IN_LIST = re.compile(r'\((?:\s*%s\s*,)+\s*%s\s*\)')
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.slowest = (0.0, '')
+        self.statements = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.duration += elapsed
+            self.statements[sql] = self.statements.get(sql, 0) + 1
+            if elapsed > self.slowest[0]:
+                self.slowest = (elapsed, sql)
+
+    def repeated_shapes(self, threshold):
+        """Query shapes (IN lists collapsed) executed at least `threshold` times"""
+        shapes = {}
+        for sql, count in self.statements.items():
+            shape = self.IN_LIST.sub('(...)', sql)
+            shapes[shape] = shapes.get(shape, 0) + count
+        return sorted(
+            ((count, shape) for shape, count in shapes.items() if count >= threshold),
+            reverse=True,
+        )
+
+
+# Recorder of the request being handled; sync_to_async copies the context, so
+# ORM calls on a shared executor thread still see their own request's recorder
+_current_recorder = ContextVar('query_recorder', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    """Execute wrapper left on every connection; hands queries to the current request's recorder"""
+    recorder = _current_recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+def install_query_recorder(sender=None, connection=None, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def install_on_open_connections():
+    """Install the wrapper on this thread's connections opened before the middleware was loaded"""
+    for connection in connections.all(initialized_only=True):
+        install_query_recorder(connection=connection)
+
+
+class QueryInspectorMiddleware:
+    """
+    Record SQL query count, DB time, slowest query and repeated query shapes
+    per request, log requests over the configured budgets as one JSON line
+    and optionally add a Server-Timing header.
+
+    Only a sample of requests (SQL_INSPECTOR_SAMPLE_RATE) is instrumented, so
+    it can stay enabled in production. Queries run while a streaming response
+    is consumed happen after the view returns and are not recorded.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'SQL_INSPECTOR_ENABLED', True)
+        self.sample_rate = getattr(settings, 'SQL_INSPECTOR_SAMPLE_RATE', 1.0)
+        self.max_queries = getattr(settings, 'SQL_INSPECTOR_MAX_QUERIES', 50)
+        self.max_db_time = getattr(settings, 'SQL_INSPECTOR_MAX_DB_TIME_MS', 200) / 1000
+        self.repeat_threshold = getattr(settings, 'SQL_INSPECTOR_REPEAT_THRESHOLD', 10)
+        self.server_timing = getattr(settings, 'SQL_INSPECTOR_SERVER_TIMING', False)
+        if self.enabled:
+            # One permanent wrapper per connection, installed as connections
+            # open; requests never add or remove wrappers themselves
+            connection_created.connect(install_query_recorder, dispatch_uid='query_inspector')
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        if not self._sampled():
+            return self.get_response(request)
+
+        install_on_open_connections()
+        recorder = QueryRecorder()
+        token = _current_recorder.set(recorder)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_recorder.reset(token)
+        return self._report(request, response, recorder, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        if not self._sampled():
+            return await self.get_response(request)
+
+        # Connections are per thread: install on the one sync_to_async ORM calls use
+        await sync_to_async(install_on_open_connections)()
+        recorder = QueryRecorder()
+        token = _current_recorder.set(recorder)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_recorder.reset(token)
+        return self._report(request, response, recorder, time.perf_counter() - started)
+
+    def _sampled(self):
+        return self.enabled and (self.sample_rate >= 1 or random.random() < self.sample_rate)
+
+    def _report(self, request, response, recorder, elapsed):
+        repeated = recorder.repeated_shapes(self.repeat_threshold)
+        if recorder.count > self.max_queries or recorder.duration > self.max_db_time or repeated:
+            report = {
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'queries': recorder.count,
+                'db_ms': round(recorder.duration * 1000, 2),
+                'total_ms': round(elapsed * 1000, 2),
+                'slowest_ms': round(recorder.slowest[0] * 1000, 2),
+                'slowest_sql': QueryRecorder.IN_LIST.sub('(...)', recorder.slowest[1])[:500],
+                'repeated': [{'count': count, 'sql': shape[:500]} for count, shape in repeated[:5]],
+            }
+            logger.warning(f'SQL budget exceeded: {json.dumps(report)}')
+
+        if self.server_timing:
+            response.headers['Server-Timing'] = (
+                f'db;dur={recorder.duration * 1000:.2f};desc="{recorder.count} queries", '
+                f'total;dur={elapsed * 1000:.2f}'
+            )
+        return response
+
+
+class PrecompressedStaticMiddleware:
+    """
+    Serve collected static files (STATIC_ROOT) with their pre-compressed
+    .br/.gz variants when no front proxy does it. Off under DEBUG, where
+    runserver serves the live files from the finders instead.
+
+    The variant is chosen from Accept-Encoding; fingerprinted names are
+    cached for a year as immutable, others for STATIC_MAX_AGE. Files that
+    are not in STATIC_ROOT fall through to the rest of the stack.
+    """
+
+    HASHED_NAME = re.compile(r'\.[0-9a-f]{12}\.[^./]+$')
+    ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+    IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        enabled = (
+            not settings.DEBUG
+            and getattr(settings, 'STATIC_SERVE_PRECOMPRESSED', True)
+            and bool(settings.STATIC_ROOT)
+            and settings.STATIC_URL.startswith('/')
+        )
+        if not enabled:
+            raise MiddlewareNotUsed
+        self.max_age = getattr(settings, 'STATIC_MAX_AGE', 3600)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        if self._is_static(request):
+            response = self._serve(request)
+            if response is not None:
+                return response
         return self.get_response(request)
+
+    async def __acall__(self, request):
+        if self._is_static(request):
+            response = await sync_to_async(self._serve)(request)
+            if response is not None:
+                return response
+        return await self.get_response(request)
+
+    def _is_static(self, request):
+        return (
+            request.method in ('GET', 'HEAD')
+            and request.path.startswith(settings.STATIC_URL)
+        )
+
+    def _accepted(self, request):
+        """Content codings the client accepts (q > 0)"""
+        accepted = set()
+        for part in request.headers.get('Accept-Encoding', '').split(','):
+            coding, _, params = part.strip().partition(';')
+            quality = params.strip()
+            if quality.startswith('q='):
+                try:
+                    if float(quality[2:]) <= 0:
+                        continue
+                except ValueError:
+                    continue
+            accepted.add(coding.strip().lower())
+        return accepted
+
+    def _serve(self, request):
+        name = request.path[len(settings.STATIC_URL):]
+        try:
+            path = safe_join(settings.STATIC_ROOT, name)
+        except SuspiciousFileOperation:
+            return None
+        if not name or not os.path.isfile(path):
+            return None
+
+        accepted = self._accepted(request)
+        encoding = None
+        for coding, suffix in self.ENCODINGS:
+            if coding in accepted and os.path.isfile(path + suffix):
+                encoding, path = coding, path + suffix
+                break
+
+        stat = os.stat(path)
+        if not was_modified_since(request.headers.get('If-Modified-Since'), stat.st_mtime):
+            response = HttpResponseNotModified()
+        else:
+            content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+            if request.method == 'HEAD':
+                response = HttpResponse(content_type=content_type)
+                response.headers['Content-Length'] = str(stat.st_size)
+            else:
+                # Streamed (wsgi.file_wrapper under WSGI), never read into memory here
+                response = FileResponse(open(path, 'rb'), content_type=content_type)
+                # FileResponse names the open file (e.g. the .br variant); not a download
+                del response['Content-Disposition']
+            if encoding:
+                response.headers['Content-Encoding'] = encoding
+
+        response.headers['Last-Modified'] = http_date(stat.st_mtime)
+        response.headers['Vary'] = 'Accept-Encoding'
+        if self.HASHED_NAME.search(name):
+            response.headers['Cache-Control'] = f'public, max-age={self.IMMUTABLE_MAX_AGE}, immutable'
+        else:
+            response.headers['Cache-Control'] = f'public, max-age={self.max_age}'
+        return response
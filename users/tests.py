@@ -1,3 +1,146 @@
-from django.test import TestCase
+import gzip
+import os
+import shutil
+import tempfile
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+
+from pricing.models import Category
+
+from .middlewares import PrecompressedStaticMiddleware, QueryInspectorMiddleware
+
+
+@override_settings(
+    SQL_INSPECTOR_ENABLED=True, SQL_INSPECTOR_SAMPLE_RATE=1.0, SQL_INSPECTOR_MAX_QUERIES=2,
+    SQL_INSPECTOR_REPEAT_THRESHOLD=3, SQL_INSPECTOR_SERVER_TIMING=True,
+)
+class QueryInspectorMiddlewareTests(TestCase):
+    """Budget log line and Server-Timing header, under WSGI and ASGI"""
+
+    QUERIES = 3
+
+    def setUp(self):
+        self.request = RequestFactory().get('/pricing/prices/')
+
+    def view(self, request):
+        for _ in range(self.QUERIES):
+            list(Category.objects.filter(name='Tether'))
+        return HttpResponse('ok')
+
+    async def async_view(self, request):
+        return await sync_to_async(self.view)(request)
+
+    def assertReported(self, response, logs):
+        self.assertRegex(response['Server-Timing'], rf'^db;dur=[\d.]+;desc="{self.QUERIES} queries", total;dur=[\d.]+$')
+        [line] = logs.output
+        self.assertIn('SQL budget exceeded', line)
+        self.assertIn(f'"queries": {self.QUERIES}', line)
+        self.assertIn('"repeated": [{"count": 3', line)
+
+    def test_sync(self):
+        middleware = QueryInspectorMiddleware(self.view)
+        with self.assertLogs('users.middlewares', 'WARNING') as logs:
+            response = middleware(self.request)
+        self.assertReported(response, logs)
+
+    async def test_async(self):
+        # The test database connection was opened before the middleware existed
+        middleware = QueryInspectorMiddleware(self.async_view)
+        with self.assertLogs('users.middlewares', 'WARNING') as logs:
+            response = await middleware(self.request)
+        self.assertReported(response, logs)
+
+    def test_within_budget(self):
+        with self.settings(SQL_INSPECTOR_MAX_QUERIES=10, SQL_INSPECTOR_REPEAT_THRESHOLD=10):
+            middleware = QueryInspectorMiddleware(self.view)
+        with self.assertNoLogs('users.middlewares', 'WARNING'):
+            response = middleware(self.request)
+        self.assertIn(f'desc="{self.QUERIES} queries"', response['Server-Timing'])
+
+
+class PrecompressedStaticMiddlewareTests(SimpleTestCase):
+    """Variant choice, cache headers, HEAD/304 and fall-through of collected static files"""
+
+    CSS = b'body { color: black; }\n' * 40
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        base = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, base)
+        cls.root = os.path.join(base, 'static')
+        os.mkdir(cls.root)
+        with open(os.path.join(base, 'secret.txt'), 'wb') as f:
+            f.write(b'outside STATIC_ROOT')
+        for name in ('app.css', 'app.0123456789ab.css'):
+            with open(os.path.join(cls.root, name), 'wb') as f:
+                f.write(cls.CSS)
+        with open(os.path.join(cls.root, 'app.css.gz'), 'wb') as f:
+            f.write(gzip.compress(cls.CSS))
+        with open(os.path.join(cls.root, 'app.css.br'), 'wb') as f:
+            f.write(b'brotli')  # only its name and size matter here
+
+    def setUp(self):
+        settings = override_settings(DEBUG=False, STATIC_ROOT=self.root, STATIC_URL='/static/', STATIC_MAX_AGE=120)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.middleware = PrecompressedStaticMiddleware(lambda request: HttpResponse('next', status=404))
+
+    def get(self, path, method='get', **headers):
+        request = getattr(RequestFactory(), method)(path, headers=headers)
+        return self.middleware(request)
+
+    def test_encoding_from_accept_encoding(self):
+        for accept, encoding, body in (
+            ('gzip, br', 'br', b'brotli'),
+            ('gzip', 'gzip', gzip.compress(self.CSS)),
+            ('br;q=0, gzip;q=0.5', 'gzip', gzip.compress(self.CSS)),
+            ('br;q=0', None, self.CSS),
+            ('', None, self.CSS),
+        ):
+            with self.subTest(accept=accept):
+                response = self.get('/static/app.css', accept_encoding=accept)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.get('Content-Encoding'), encoding)
+                self.assertEqual(b''.join(response.streaming_content), body)
+                self.assertEqual(response['Content-Length'], str(len(body)))
+                self.assertEqual(response['Content-Type'], 'text/css')
+                self.assertEqual(response['Vary'], 'Accept-Encoding')
+                self.assertNotIn('Content-Disposition', response)
+                response.close()
+
+    def test_cache_headers(self):
+        response = self.get('/static/app.0123456789ab.css')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        response.close()
+        response = self.get('/static/app.css')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=120')
+        response.close()
+
+    def test_head(self):
+        response = self.get('/static/app.css', method='head', accept_encoding='gzip')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['Content-Length'], str(len(gzip.compress(self.CSS))))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+    def test_not_modified(self):
+        response = self.get('/static/app.css')
+        response.close()
+        response = self.get('/static/app.css', if_modified_since=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['Cache-Control'], 'public, max-age=120')
+
+    def test_falls_through(self):
+        for path in ('/static/missing.css', '/static/../secret.txt', '/static//etc/passwd', '/static/'):
+            with self.subTest(path=path):
+                self.assertEqual(self.get(path).content, b'next')
+        self.assertEqual(self.get('/static/app.css', method='post').content, b'next')
+
+    def test_off_under_debug(self):
+        with self.settings(DEBUG=True):
+            with self.assertRaises(MiddlewareNotUsed):
+                PrecompressedStaticMiddleware(lambda request: None)